@@ -1,6 +1,13 @@
 import os
+import html
 import requests
+import fixtures
+import http_client
+import forecast_history
+from prefectures import PREF_NAMES
+from weather_api import geocode_prefecture, fetch_weather_bundle
 import streamlit as st
+import streamlit.components.v1 as components
 from datetime import datetime, timezone, timedelta
 import pandas as pd
 from dotenv import load_dotenv
@@ -19,6 +26,10 @@ if not API_KEY:
 if not API_KEY:
     API_KEY = os.getenv("OPENWEATHER_API_KEY")  # フォールバック（念のため）
 
+# 外部APIへの接続を先に開いておく（記録の再生中はネットワークを使わない）
+if not fixtures.is_replay():
+    http_client.warm_up_in_background()
+
 # 簡易アイコンマッピング（長いワードを先にマッチするようにソート）
 weather_icons = {
     "快晴": "☀️",
@@ -39,34 +50,83 @@ def get_weather_icon(desc: str) -> str:
             return v
     return "🌤️"
 
-# 47都道府県リスト（表示用）
-prefectures = [
-    "北海道","青森県","岩手県","宮城県","秋田県","山形県","福島県",
-    "茨城県","栃木県","群馬県","埼玉県","千葉県","東京都","神奈川県",
-    "新潟県","富山県","石川県","福井県","山梨県","長野県","岐阜県",
-    "愛知県","三重県","滋賀県","京都府","大阪府","兵庫県","奈良県",
-    "和歌山県","鳥取県","島根県","岡山県","広島県","山口県","徳島県",
-    "香川県","愛媛県","高知県","福岡県","佐賀県","長崎県","熊本県",
-    "大分県","宮崎県","鹿児島県","沖縄県"
-]
-
-# 都道府県名を主要都市名にマッピング（OpenWeatherMap のジオコーディング用）
-pref_to_city = {
-    "北海道": "Sapporo", "青森県": "Aomori", "岩手県": "Morioka", "宮城県": "Sendai",
-    "秋田県": "Akita", "山形県": "Yamagata", "福島県": "Fukushima",
-    "茨城県": "Mito", "栃木県": "Utsunomiya", "群馬県": "Maebashi",
-    "埼玉県": "Saitama", "千葉県": "Chiba", "東京都": "Tokyo", "神奈川県": "Yokohama",
-    "新潟県": "Niigata", "富山県": "Toyama", "石川県": "Kanazawa", "福井県": "Fukui",
-    "山梨県": "Kofu", "長野県": "Nagano", "岐阜県": "Gifu",
-    "静岡県": "Shizuoka", "愛知県": "Nagoya", "三重県": "Tsu",
-    "滋賀県": "Otsu", "京都府": "Kyoto", "大阪府": "Osaka", "兵庫県": "Kobe",
-    "奈良県": "Nara", "和歌山県": "Wakayama",
-    "鳥取県": "Tottori", "島根県": "Matsue", "岡山県": "Okayama", "広島県": "Hiroshima",
-    "山口県": "Yamaguchi", "徳島県": "Tokushima", "香川県": "Takamatsu",
-    "愛媛県": "Matsuyama", "高知県": "Kochi",
-    "福岡県": "Fukuoka", "佐賀県": "Saga", "長崎県": "Nagasaki", "熊本県": "Kumamoto",
-    "大分県": "Oita", "宮崎県": "Miyazaki", "鹿児島県": "Kagoshima", "沖縄県": "Naha"
-}
+CAROUSEL_HEIGHT = 330
+DAY_LABELS = ["今日", "明日", "明後日"]
+JST = timezone(timedelta(hours=9))
+
+
+def carousel_html(daily_forecast: list[dict], diff: dict | None) -> str:
+    """3日分の天気を1枚ずつ表示し、◀/▶ で切り替える HTML（切り替えはブラウザ内で完結）"""
+    slides = []
+    for i, day_data in enumerate(daily_forecast):
+        dt = datetime.fromtimestamp(day_data["dt"], tz=timezone.utc).astimezone(JST)
+        date_label = dt.strftime("%Y-%m-%d (%a)")
+
+        weather_desc = day_data.get("weather", [{}])[0].get("description", "不明")
+        weather_desc = weather_desc.replace("晴天", "晴れ")
+        icon = get_weather_icon(weather_desc)
+
+        temp_max = day_data.get("temp", {}).get("max", "--")
+        temp_min = day_data.get("temp", {}).get("min", "--")
+        pop = day_data.get("pop", None)
+        pop_text = f"{int(pop * 100)}%" if pop is not None else "--"
+
+        compare = ""
+        if i == 0 and diff and "temp_max" in diff:
+            compare = f"<div class='compare'>最高気温は昨日より <b>{diff['temp_max']:+.1f}°C</b></div>"
+
+        slides.append(f"""
+        <div class="slide" style="display:{'block' if i == 0 else 'none'};">
+            <div class="title">{DAY_LABELS[i]}の天気 - {date_label}</div>
+            <div class="icon">{icon}</div>
+            <div class="desc">{html.escape(weather_desc)}</div>
+            <div class="temp">最高: <b>{temp_max}°C</b> / 最低: <b>{temp_min}°C</b></div>
+            <div class="pop">降水確率: <b>{pop_text}</b></div>
+            {compare}
+        </div>
+        """)
+
+    return f"""
+    <style>
+        body {{ font-family: "Source Sans Pro", sans-serif; margin: 0; color: #31333F; }}
+        .nav {{ display: flex; justify-content: space-between; align-items: center; }}
+        .nav button {{ font-size: 20px; padding: 4px 16px; border: 1px solid #ddd; border-radius: 8px; background: #fff; cursor: pointer; }}
+        .dots {{ color: #bbb; letter-spacing: 4px; }}
+        .dots .on {{ color: #FF4B4B; }}
+        .slide {{ text-align: center; }}
+        .title {{ font-size: 24px; font-weight: 600; margin: 12px 0; text-align: left; }}
+        .icon {{ font-size: 80px; line-height: 1.1; }}
+        .desc {{ font-size: 28px; }}
+        .temp {{ font-size: 22px; }}
+        .pop {{ font-size: 18px; margin-top: 8px; }}
+        .compare {{ font-size: 16px; color: #666; margin-top: 4px; }}
+    </style>
+    <div class="nav">
+        <button onclick="show(-1)">◀</button>
+        <span class="dots">{"".join(f"<span>●</span>" for _ in daily_forecast)}</span>
+        <button onclick="show(1)">▶</button>
+    </div>
+    {"".join(slides)}
+    <script>
+        let index = 0;
+        const slides = document.querySelectorAll(".slide");
+        const dots = document.querySelectorAll(".dots span");
+        function show(step) {{
+            index = (index + step + slides.length) % slides.length;
+            slides.forEach((s, i) => s.style.display = i === index ? "block" : "none");
+            dots.forEach((d, i) => d.className = i === index ? "on" : "");
+        }}
+        show(0);
+    </script>
+    """
+
+
+@st.fragment
+def render_debug(current_weather, forecast_data):
+    """デバッグ用のレスポンス表示（オンにしたときだけ送る。切り替えはこの部分だけ再実行）"""
+    if st.toggle("APIレスポンスを確認（デバッグ）"):
+        st.json({"current": current_weather, "forecast": forecast_data})
+
 
 st.title("天気アプリ（OpenWeather 版）")
 st.write("都道府県を選択して OpenWeather の天気を表示します。")
@@ -76,156 +136,44 @@ if not API_KEY:
     st.stop()
 
 # 選択 UI
-selected_pref = st.selectbox("地域を選んでください（都道府県）", prefectures)
-
-# セッションステートで日切り替えインデックス管理（カルーセル代わり）
-if 'weather_index' not in st.session_state:
-    st.session_state.weather_index = 0
-
-nav_col1, nav_col2, nav_col3 = st.columns([1, 3, 1])
-with nav_col1:
-    if st.button("◀", key="prev"):
-        st.session_state.weather_index = (st.session_state.weather_index - 1) % 3
-        st.rerun()
-with nav_col3:
-    if st.button("▶", key="next"):
-        st.session_state.weather_index = (st.session_state.weather_index + 1) % 3
-        st.rerun()
-
-# --- キャッシュ付きの API 呼び出し ---
-@st.cache_data(ttl=60 * 10)  # 10分キャッシュ（API呼び出しを節約）
-def geocode_prefecture(pref_name: str):
-    city_name = pref_to_city.get(pref_name, pref_name)
-    url = "https://api.openweathermap.org/geo/1.0/direct"
-    params = {"q": f"{city_name},JP", "limit": 1, "appid": API_KEY}
-    r = requests.get(url, params=params, timeout=8)
-    r.raise_for_status()
-    data = r.json()
-    if not data:
-        raise ValueError(f"ジオコーディングで結果が見つかりませんでした: {pref_name} ({city_name})")
-    return data[0]["lat"], data[0]["lon"], data[0].get("name", city_name)
-
-@st.cache_data(ttl=60 * 5)  # 5分キャッシュ
-def fetch_weather(lat: float, lon: float):
-    """現在の天気を取得（無料API）"""
-    url = "https://api.openweathermap.org/data/2.5/weather"
-    params = {
-        "lat": lat,
-        "lon": lon,
-        "units": "metric",
-        "lang": "ja",
-        "appid": API_KEY
-    }
-    r = requests.get(url, params=params, timeout=8)
-    r.raise_for_status()
-    return r.json()
-
-@st.cache_data(ttl=60 * 5)  # 5分キャッシュ
-def fetch_forecast(lat: float, lon: float):
-    """5日間の3時間ごと予報を取得（無料API）"""
-    url = "https://api.openweathermap.org/data/2.5/forecast"
-    params = {
-        "lat": lat,
-        "lon": lon,
-        "units": "metric",
-        "lang": "ja",
-        "appid": API_KEY
-    }
-    r = requests.get(url, params=params, timeout=8)
-    r.raise_for_status()
-    return r.json()
-
-def aggregate_daily_forecast(forecast_data):
-    """3時間ごとの予報を日次に集約"""
-    from collections import defaultdict
-    
-    daily = defaultdict(lambda: {
-        "temps": [],
-        "pops": [],
-        "weather": [],
-        "wind_speeds": [],
-        "rain": 0,
-        "snow": 0
-    })
-    
-    jst = timezone(timedelta(hours=9))
-    
-    for item in forecast_data.get("list", []):
-        dt = datetime.fromtimestamp(item["dt"], tz=timezone.utc).astimezone(jst)
-        date_key = dt.strftime("%Y-%m-%d")
-        
-        daily[date_key]["temps"].append(item["main"]["temp"])
-        daily[date_key]["pops"].append(item.get("pop", 0))
-        daily[date_key]["wind_speeds"].append(item.get("wind", {}).get("speed", 0))
-        
-        if item.get("weather"):
-            daily[date_key]["weather"].append(item["weather"][0])
-        
-        if "rain" in item:
-            daily[date_key]["rain"] += item["rain"].get("3h", 0)
-        if "snow" in item:
-            daily[date_key]["snow"] += item["snow"].get("3h", 0)
-    
-    result = []
-    for date_key in sorted(daily.keys())[:3]:  # 3日分のみ
-        d = daily[date_key]
-        result.append({
-            "dt": datetime.strptime(date_key, "%Y-%m-%d").replace(tzinfo=jst).timestamp(),
-            "temp": {
-                "max": max(d["temps"]) if d["temps"] else 0,
-                "min": min(d["temps"]) if d["temps"] else 0
-            },
-            "pop": max(d["pops"]) if d["pops"] else 0,
-            "weather": [d["weather"][0]] if d["weather"] else [{"description": "不明"}],
-            "wind_speed": sum(d["wind_speeds"]) / len(d["wind_speeds"]) if d["wind_speeds"] else 0,
-            "rain": d["rain"],
-            "snow": d["snow"]
-        })
-    
-    return result
-
-# 実行
+selected_pref = st.selectbox("地域を選んでください（都道府県）", PREF_NAMES)
+
+# 実行（API 呼び出しとキャッシュは weather_api.py にまとめてある）
 try:
-    lat, lon, resolved_name = geocode_prefecture(selected_pref)
-    current_weather = fetch_weather(lat, lon)
-    forecast_data = fetch_forecast(lat, lon)
-    
-    daily_forecast = aggregate_daily_forecast(forecast_data)
+    lat, lon, resolved_name = geocode_prefecture(selected_pref, API_KEY)  # 一覧の座標を使うので API は呼ばない
+    # 現在の天気と日次予報を1回（One Call）または同時の2リクエストでまとめて取得する
+    bundle = fetch_weather_bundle(lat, lon, API_KEY)
+    current_weather = bundle["current"]
+    forecast_data = bundle["forecast"]
+    daily_forecast = bundle["daily"]
+    # 履歴に追記（前回と同じ値なら何も書かない）
+    forecast_history.record_daily(selected_pref, daily_forecast, "openweather")
+    if current_weather.get("dt") and (current_weather.get("main") or {}).get("temp") is not None:
+        forecast_history.record_observation(selected_pref, current_weather["dt"], current_weather["main"]["temp"])
 
     if len(daily_forecast) < 3:
         st.error("日次予報が取得できませんでした。APIレスポンスを確認してください。")
         st.json({"current": current_weather, "forecast": forecast_data})
         st.stop()
 
-    days_labels = ["今日", "明日", "明後日"]
-    idx = st.session_state.weather_index
-    day_data = daily_forecast[idx]
-
-    jst = timezone(timedelta(hours=9))
-    dt = datetime.fromtimestamp(day_data["dt"], tz=timezone.utc).astimezone(jst)
-    date_label = dt.strftime("%Y-%m-%d (%a)")
-
-    weather_desc = day_data.get("weather", [{}])[0].get("description", "不明")
-    weather_desc = weather_desc.replace("晴天", "晴れ")
-    icon = get_weather_icon(weather_desc)
-
-    temp_max = day_data.get("temp", {}).get("max", "--")
-    temp_min = day_data.get("temp", {}).get("min", "--")
-    pop = day_data.get("pop", None)
-    pop_text = f"{int(pop * 100)}%" if pop is not None else "--"
-    wind_speed = day_data.get("wind_speed", "--")
-    rain = day_data.get("rain", 0)
-    snow = day_data.get("snow", 0)
-
     st.write(f"選択中の地域: **{selected_pref}**（推定地点: {resolved_name}）")
-    st.subheader(f"{days_labels[idx]}の天気 - {date_label}")
-    st.markdown(f"<div style='text-align: center; font-size: 80px;'>{icon}</div>", unsafe_allow_html=True)
-    st.markdown(f"<div style='text-align: center; font-size: 28px;'>{weather_desc}</div>", unsafe_allow_html=True)
-    st.markdown(f"<div style='text-align: center; font-size: 22px;'>最高: <b>{temp_max}°C</b> / 最低: <b>{temp_min}°C</b></div>", unsafe_allow_html=True)
-    st.markdown(f"<div style='text-align: center; font-size: 18px; margin-top: 8px;'>降水確率: <b>{pop_text}</b></div>", unsafe_allow_html=True)
 
-    with st.expander("APIレスポンスを確認（デバッグ）"):
-        st.json({"current": current_weather, "forecast": forecast_data})
+    # 3日分をまとめて描画し、◀/▶ はブラウザ側で切り替える（サーバーの再実行なし）
+    # 昨日との比較（貯めておいた履歴から作るので API は呼ばない）
+    diff = forecast_history.compare_with_yesterday(selected_pref)
+    carousel = carousel_html(daily_forecast[:3], diff)
+    if hasattr(st, "iframe"):
+        st.iframe(carousel, height=CAROUSEL_HEIGHT)
+    else:  # 古い Streamlit
+        components.html(carousel, height=CAROUSEL_HEIGHT)
+
+    history = forecast_history.daily_history(selected_pref)
+    if len(history) >= 2:
+        st.subheader("気温の推移")
+        trend = pd.DataFrame(history).set_index("date")[["temp_max", "temp_min"]]
+        st.line_chart(trend.rename(columns={"temp_max": "最高気温", "temp_min": "最低気温"}))
+
+    render_debug(current_weather, forecast_data)
 
 except requests.HTTPError as e:
     status = e.response.status_code if e.response is not None else "No response"
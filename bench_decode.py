@@ -0,0 +1,137 @@
+# bench_decode.py
+# JSON の読み込み（標準 json / payloads.loads）と項目の絞り込みの効果を測るスクリプト
+#
+#   python bench_decode.py
+#
+# 実際の API と同じ形のレスポンスを作って測る（ネットワークは使わない）
+# fixtures/ に記録があればそちらも測る
+import os
+import sys
+import json
+import timeit
+import payloads
+
+REPEAT = 200
+
+
+def make_forecast(count: int = 40) -> dict:
+    """OpenWeather の 5日間予報と同じ形（count 件）"""
+    items = []
+    for i in range(count):
+        items.append({
+            "dt": 1714500000 + i * 10800,
+            "main": {"temp": 18.3, "feels_like": 17.9, "temp_min": 17.1, "temp_max": 18.3, "pressure": 1012,
+                     "sea_level": 1012, "grnd_level": 1008, "humidity": 62, "temp_kf": 1.2},
+            "weather": [{"id": 500, "main": "Rain", "description": "小雨", "icon": "10d"}],
+            "clouds": {"all": 75},
+            "wind": {"speed": 3.4, "deg": 190, "gust": 5.8},
+            "visibility": 10000,
+            "pop": 0.42,
+            "rain": {"3h": 0.6},
+            "sys": {"pod": "d"},
+            "dt_txt": "2024-05-01 03:00:00",
+        })
+    return {
+        "cod": "200", "message": 0, "cnt": count, "list": items,
+        "city": {"id": 1850147, "name": "東京都", "coord": {"lat": 35.6895, "lon": 139.6917}, "country": "JP",
+                 "population": 12445327, "timezone": 32400, "sunrise": 1714484000, "sunset": 1714533000},
+    }
+
+
+def make_horoscope() -> dict:
+    """jugemkey の無料占いと同じ形（12星座）"""
+    signs = ["牡羊座", "牡牛座", "双子座", "蟹座", "獅子座", "乙女座",
+             "天秤座", "蠍座", "射手座", "山羊座", "水瓶座", "魚座"]
+    items = [{
+        "content": "周りの人の意見に耳を傾けると、思わぬヒントが見つかりそう。焦らず一歩ずつ進んで。",
+        "item": "ハンカチ", "money": 3, "total": 4, "job": 3, "color": "ピンク",
+        "day": "2024/05/01", "love": 4, "rank": rank, "sign": sign,
+    } for rank, sign in enumerate(signs, start=1)]
+    return {"horoscope": {"2024/05/01": items}}
+
+
+def deep_size(value) -> int:
+    """オブジェクトが使うメモリのおおよその大きさ（バイト）"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_size(k) + deep_size(v) for k, v in value.items())
+    elif isinstance(value, list):
+        size += sum(deep_size(v) for v in value)
+    return size
+
+
+def best_ms(func) -> float:
+    return min(timeit.repeat(func, number=REPEAT, repeat=5)) / REPEAT * 1000
+
+
+def bench(name: str, payload: dict, schema) -> None:
+    """同じレスポンスを、これまで（標準 json で全部読む）と今（payloads.decode）で読んで比べる"""
+    raw = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+    stdlib = best_ms(lambda: json.loads(raw))
+    fast = best_ms(lambda: payloads.loads(raw))
+    decoded = best_ms(lambda: payloads.decode(raw, schema))
+    before_size = deep_size(json.loads(raw))
+    after_size = deep_size(payloads.decode(raw, schema))
+
+    print(f"## {name}")
+    print(f"  レスポンス          : {len(raw) / 1024:8.1f} KB")
+    print(f"  json.loads（これまで）: {stdlib:8.3f} ms")
+    print(f"  payloads.loads      : {fast:8.3f} ms  (x{stdlib / fast:.1f})")
+    print(f"  payloads.decode     : {decoded:8.3f} ms  (x{stdlib / decoded:.1f})")
+    print(f"  キャッシュの大きさ  : {before_size / 1024:8.1f} KB -> {after_size / 1024:8.1f} KB"
+          f"  ({after_size / before_size:.0%})")
+    print()
+
+
+def bench_count(full: int, count: int) -> None:
+    """予報の cnt を減らした効果（読み方は同じ payloads.decode で、件数だけを変えて比べる）"""
+    schema = payloads.OPENWEATHER_FORECAST
+    before_raw = json.dumps(make_forecast(full), ensure_ascii=False).encode("utf-8")
+    after_raw = json.dumps(make_forecast(count), ensure_ascii=False).encode("utf-8")
+    before = best_ms(lambda: payloads.decode(before_raw, schema))
+    after = best_ms(lambda: payloads.decode(after_raw, schema))
+
+    print(f"## OpenWeather 予報の cnt（{full}件 → {count}件）")
+    print(f"  レスポンス          : {len(before_raw) / 1024:8.1f} KB -> {len(after_raw) / 1024:8.1f} KB")
+    print(f"  payloads.decode     : {before:8.3f} ms -> {after:8.3f} ms")
+    print()
+
+
+def main():
+    print(f"JSON バックエンド: {'orjson' if payloads.orjson else 'json（標準）'}")
+    print()
+    # 読み方の違いは同じレスポンスで測り、cnt で件数を減らした効果は別に出す
+    bench("OpenWeather 予報（40件）", make_forecast(40), payloads.OPENWEATHER_FORECAST)
+    bench_count(40, payloads.FORECAST_COUNT)
+    bench("jugemkey 占い（12星座）", make_horoscope(), payloads.JUGEMKEY_HOROSCOPE)
+
+    # 記録済みのレスポンスがあればそれも測る（URL ごとに最新の1件）
+    schemas = {
+        "https://api.openweathermap.org/data/2.5/forecast": payloads.OPENWEATHER_FORECAST,
+        "https://api.openweathermap.org/data/2.5/weather": payloads.OPENWEATHER_CURRENT,
+    }
+    for provider in ("openweather", "tsukumijima", "jugemkey"):
+        path = os.path.join("fixtures", f"{provider}.jsonl")
+        if not os.path.exists(path):
+            continue
+        latest = {}
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    latest[record["url"]] = record
+        for url, record in latest.items():
+            if url in schemas:
+                schema = schemas[url]
+            elif provider == "tsukumijima":
+                schema = payloads.TSUKUMIJIMA_FORECAST
+            elif provider == "jugemkey":
+                schema = payloads.JUGEMKEY_HOROSCOPE
+            else:
+                continue
+            bench(f"記録: {provider}（{url}）", record["body"], schema)
+
+
+if __name__ == "__main__":
+    main()
@@ -13,3 +13,41 @@ SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+
+
+# ======================================
+# 星座ごとのユーザー（users.zodiac_sign）
+# ======================================
+# zodiac_sign は save_settings_to_supabase が誕生日と一緒に保存する
+# （列とインデックスは supabase/migrations/20261018000000_add_zodiac_sign_to_users.sql）
+
+def users_by_sign(sign: str, columns: str = "auth_user_id, email") -> list[dict]:
+    """その星座のユーザーを返す（zodiac_sign のインデックスを使う）"""
+    res = supabase.table("users").select(columns).eq("zodiac_sign", sign).execute()
+    return res.data or []
+
+
+def backfill_zodiac_signs() -> int:
+    """zodiac_sign が空のユーザーに星座を入れる（列を追加する前からいるユーザー用）。更新した件数を返す"""
+    from horoscope import get_zodiacs
+
+    rows = (
+        supabase.table("users")
+        .select("auth_user_id, birth_month, birth_day")
+        .is_("zodiac_sign", "null")
+        .not_.is_("birth_month", "null")
+        .not_.is_("birth_day", "null")
+        .execute()
+    ).data or []
+    if not rows:
+        return 0
+
+    # まとめて判定し、星座ごとに1回ずつ更新する（最大12回）
+    signs = get_zodiacs([r["birth_month"] for r in rows], [r["birth_day"] for r in rows])
+    groups = {}
+    for row, sign in zip(rows, signs):
+        if sign:
+            groups.setdefault(sign, []).append(row["auth_user_id"])
+    for sign, ids in groups.items():
+        supabase.table("users").update({"zodiac_sign": sign}).in_("auth_user_id", ids).execute()
+    return sum(len(ids) for ids in groups.values())
@@ -0,0 +1,98 @@
+# dedupe.py
+# 同じニュースが複数のサイトに配信されている場合に、ほぼ同じ記事をまとめるためのモジュール
+# （タイトル＋説明文の SimHash を使う）
+import re
+import hashlib
+import unicodedata
+
+# 64bit の SimHash を 8bit ずつ 8 つに分けたものを索引に使う
+# ハミング距離が 7 以下なら、8 つのうち少なくとも 1 つは完全に一致する
+BITS = 64
+BANDS = 8
+BAND_BITS = BITS // BANDS
+
+# これ以下のハミング距離ならほぼ同じ記事とみなす
+# （配信先ごとに付く「 - 朝日新聞」のような短い違いで 4〜5 程度、別の記事なら 25 以上）
+MAX_DISTANCE = 6
+
+# 文字 n-gram の長さ（日本語は単語で区切れないので文字単位にする）
+NGRAM = 3
+
+_MASK = (1 << BITS) - 1
+_IGNORE = re.compile(r"[\s\W_]+")
+
+
+def normalize(text: str) -> str:
+    # 全角・半角をそろえ、空白と記号を取り除く
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return _IGNORE.sub("", text)
+
+
+def _hash64(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def simhash(text: str) -> int:
+    """テキストの 64bit SimHash を返す"""
+    text = normalize(text)
+    if len(text) < NGRAM:
+        grams = [text] if text else []
+    else:
+        grams = [text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)]
+
+    weights = [0] * BITS
+    for gram in grams:
+        h = _hash64(gram)
+        for bit in range(BITS):
+            weights[bit] += 1 if (h >> bit) & 1 else -1
+
+    sig = 0
+    for bit in range(BITS):
+        if weights[bit] > 0:
+            sig |= 1 << bit
+    return sig
+
+
+def article_signature(article: dict) -> int:
+    """記事のタイトルと説明文から署名を作る"""
+    return simhash(f"{article.get('title') or ''} {article.get('description') or ''}")
+
+
+def bands(sig: int) -> list[int]:
+    """署名を索引用の 8 つの値に分ける"""
+    mask = (1 << BAND_BITS) - 1
+    return [(sig >> (i * BAND_BITS)) & mask for i in range(BANDS)]
+
+
+def hamming(a: int, b: int) -> int:
+    return bin((a ^ b) & _MASK).count("1")
+
+
+def is_near_duplicate(a: int, b: int) -> bool:
+    return hamming(a, b) <= MAX_DISTANCE
+
+
+def to_signed(sig: int) -> int:
+    """SQLite の INTEGER（符号付き 64bit）に入る形にする"""
+    return sig - (1 << BITS) if sig >= 1 << (BITS - 1) else sig
+
+
+def to_unsigned(value: int) -> int:
+    return value & _MASK
+
+
+def collapse(articles: list[dict]) -> list[dict]:
+    """ほぼ同じ記事をまとめる（並び順で先に出てきた記事を残す）"""
+    kept = []
+    index = {}  # (バンド番号, 値) -> 残した記事の署名
+    for article in articles:
+        sig = article_signature(article)
+        candidates = set()
+        for i, value in enumerate(bands(sig)):
+            candidates.update(index.get((i, value), ()))
+        if any(is_near_duplicate(sig, other) for other in candidates):
+            continue
+        kept.append(article)
+        for i, value in enumerate(bands(sig)):
+            index.setdefault((i, value), []).append(sig)
+    return kept
@@ -1,13 +1,18 @@
 import streamlit as st
+from prefectures import PREF_NAMES
 from datetime import date, datetime
-from weather import weather_api, get_weather_icon
+from weather import weather_api, get_weather_icon, start_refresher
 import os
 from dotenv import load_dotenv
+import news_api
 from news_api import news_get
 from hour_calc import diff_hour
-from horoscope import get_horoscope
+from horoscope import get_horoscope, get_zodiac, start_prefetcher
 from supabase import create_client, Client
 from dotenv import load_dotenv
+import requests
+import fixtures
+import http_client
 
 #categoriesを文字列にするためにjason必要
 import json
@@ -15,6 +20,19 @@ import json
 #.envを読み込ませる
 load_dotenv()
 
+# APIキーがなく、モードの指定もなければ記録済みのレスポンスで動かす（デモモード）
+if not os.getenv("NEWS_API_KEY") and not os.getenv("OTASUKE_PROVIDER_MODE"):
+    fixtures.set_mode("replay")
+
+# 外部APIへの接続を先に開き、全都道府県の天気をバックグラウンドで取得しておく
+# （記録の再生中はネットワークを使わない）
+if not fixtures.is_replay():
+    http_client.warm_up_in_background()
+    start_refresher()
+    start_prefetcher()
+    if os.getenv("NEWS_API_KEY"):
+        news_api.start_ingester(os.getenv("NEWS_API_KEY"))
+
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
@@ -42,6 +60,7 @@ def save_settings_to_supabase():
         "birth_year":  s.get("birth_year"),
         "birth_month": s.get("birth_month"),
         "birth_day":   s.get("birth_day"),
+        "zodiac_sign": get_zodiac(s.get("birth_month"), s.get("birth_day")),
         "home_pref":   s.get("home_pref"),
         "work_pref":   s.get("work_pref"),
         "categories":  categories_json,
@@ -315,24 +334,10 @@ if "settings" not in st.session_state:
     }
 
 # 都道府県リスト
-PREF_LIST = [
-    "北海道", "青森県", "岩手県", "宮城県", "秋田県", "山形県", "福島県",
-    "茨城県", "栃木県", "群馬県", "埼玉県", "千葉県", "東京都", "神奈川県",
-    "新潟県", "富山県", "石川県", "福井県", "山梨県", "長野県",
-    "岐阜県", "静岡県", "愛知県", "三重県",
-    "滋賀県", "京都府", "大阪府", "兵庫県", "奈良県", "和歌山県",
-    "鳥取県", "島根県", "岡山県", "広島県", "山口県",
-    "徳島県", "香川県", "愛媛県", "高知県",
-    "福岡県", "佐賀県", "長崎県", "熊本県", "大分県", "宮崎県", "鹿児島県",
-    "沖縄県",
-]
-
-# ニュースジャンルリスト（例）
-CATEGORY_LIST = [
-    "テクノロジー", "ビジネス", "スポーツ", "政治", "国際",
-    "エンタメ", "健康", "ライフスタイル", "経済", "科学",
-    "環境", "教育",
-]
+PREF_LIST = PREF_NAMES
+
+# ニュースジャンルリスト（news_api と同じもの）
+CATEGORY_LIST = news_api.CATEGORY_LIST
 
 # ======================================
 # 共通ヘッダー
@@ -453,18 +458,16 @@ def render_dashboard():
     st.markdown('<div style="margin-top:12px;"></div>', unsafe_allow_html=True)
 
     # デモモードの表示
-    st.markdown('<div style="font-size:11px; color:#9ca3af; text-align:center; margin-bottom:12px;">🎨 デモモード（サンプルデータ表示中）</div>', unsafe_allow_html=True)
+    if fixtures.is_replay():
+        st.markdown('<div style="font-size:11px; color:#9ca3af; text-align:center; margin-bottom:12px;">🎨 デモモード（記録済みデータ表示中）</div>', unsafe_allow_html=True)
 
-    # 天気（ダミーデータ）
-    home_pref = st.session_state.settings.get("home_pref") or "東京"
+    # 天気
+    home_pref = st.session_state.settings.get("home_pref") or "東京都"
     
-    # APIキーがあれば本物のデータを取得、なければダミー
+    # 取得できなければ（記録がないときなど）ダミー
     try:
-        if os.getenv("OPENWEATHER_API_KEY"):
-            telop, max_temp, min_temp = weather_api(home_pref)
-        else:
-            telop, max_temp, min_temp = "晴れ", 22, 15
-    except:
+        telop, max_temp, min_temp = weather_api(home_pref)
+    except requests.RequestException:
         telop, max_temp, min_temp = "晴れ", 22, 15
     
     icon = get_weather_icon(telop)
@@ -493,7 +496,7 @@ def render_dashboard():
 
     try:
         horoscope_result = get_horoscope(birth_month, birth_day)
-    except:
+    except (requests.RequestException, KeyError, StopIteration):
         # ダミーデータ
         horoscope_result = {
             "sign": "おひつじ座",
@@ -535,29 +538,10 @@ def render_dashboard():
 
     select_categories = st.session_state.settings.get("categories", [])
     
-    # ニュース取得（APIキーがなければダミーデータ）
+    # ニュース取得（デモモードでは記録済みのレスポンスから）
     try:
-        if NEWS_API_KEY:
-            articles = news_get(NEWS_API_KEY, select_categories)
-        else:
-            # ダミーニュース
-            articles = [
-                {
-                    "title": "新しいテクノロジーが日常生活を変える",
-                    "description": "最新のAI技術により、私たちの生活がより便利になっています。",
-                    "url": "https://example.com/news1",
-                    "urlToImage": "",
-                    "publishedAt": "2025-12-09T09:00:00Z"
-                },
-                {
-                    "title": "健康的なライフスタイルのための5つのヒント",
-                    "description": "毎日の小さな習慣が大きな変化をもたらします。",
-                    "url": "https://example.com/news2",
-                    "urlToImage": "",
-                    "publishedAt": "2025-12-09T08:00:00Z"
-                }
-            ]
-    except:
+        articles = news_get(NEWS_API_KEY, select_categories)
+    except requests.RequestException:
         articles = [
             {
                 "title": "サンプルニュース1",
@@ -0,0 +1,57 @@
+# expiry.py
+# キャッシュの期限を「決まった秒数」ではなく、取得元が更新する時刻に合わせて決めるモジュール
+#
+# - OpenWeather の予報   : 3時間ごとの区切り（UTC 0,3,6,...時）で更新される
+# - OpenWeather の現在の天気: 10分ごとに更新される
+# - tsukumijima（気象庁） : 毎日 5時・11時・17時（JST）に発表される
+# - 星占い               : JST の日付が変わるまで同じ
+#
+# 各関数は「次に変わる時刻（UNIX 秒）」を返す。それまではキャッシュを使い、API は呼ばない
+import time
+from datetime import datetime, timezone, timedelta
+
+JST = timezone(timedelta(hours=9))
+
+OPENWEATHER_FORECAST_STEP = 3 * 60 * 60
+OPENWEATHER_CURRENT_STEP = 10 * 60
+OPENWEATHER_LAG = 5 * 60  # 区切りの時刻から新しいデータが出るまでの余裕
+
+TSUKUMIJIMA_PUBLISH_HOURS = (5, 11, 17)  # 気象庁の定時発表（JST）
+TSUKUMIJIMA_LAG = 10 * 60  # 発表から tsukumijima に反映されるまでの余裕
+
+
+def _now(now: float | None) -> float:
+    return time.time() if now is None else now
+
+
+def next_step(step: float, lag: float = 0, now: float | None = None) -> float:
+    """step 秒ごとの区切り（+ lag 秒）のうち、now より後の最初の時刻"""
+    now = _now(now)
+    return ((now - lag) // step + 1) * step + lag
+
+
+def openweather_forecast(now: float | None = None) -> float:
+    return next_step(OPENWEATHER_FORECAST_STEP, OPENWEATHER_LAG, now)
+
+
+def openweather_current(now: float | None = None) -> float:
+    return next_step(OPENWEATHER_CURRENT_STEP, 0, now)
+
+
+def tsukumijima(now: float | None = None) -> float:
+    """次の気象庁の発表が tsukumijima に反映される時刻"""
+    now = _now(now)
+    today = datetime.fromtimestamp(now, JST).replace(hour=0, minute=0, second=0, microsecond=0)
+    for days in (0, 1):
+        for hour in TSUKUMIJIMA_PUBLISH_HOURS:
+            at = (today + timedelta(days=days, hours=hour)).timestamp() + TSUKUMIJIMA_LAG
+            if at > now:
+                return at
+    raise AssertionError("unreachable")
+
+
+def jst_midnight(now: float | None = None) -> float:
+    """次の JST 0時"""
+    now = _now(now)
+    today = datetime.fromtimestamp(now, JST).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (today + timedelta(days=1)).timestamp()
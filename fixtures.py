@@ -0,0 +1,172 @@
+# fixtures.py
+# 外部APIのレスポンスを記録・再生するモジュール
+#
+# OTASUKE_PROVIDER_MODE で切り替える（.env でも可）
+#   live   : 通常どおり API を呼ぶ（デフォルト）
+#   record : API を呼び、レスポンスを fixtures/<provider>.jsonl に追記する
+#   replay : 記録済みのレスポンスだけを返す（ネットワークには一切アクセスしない）
+import os
+import ast
+import json
+import threading
+import requests
+import http_client
+import payloads
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MODES = ("live", "record", "replay")
+PROVIDERS = ("newsapi", "openweather", "tsukumijima", "jugemkey")
+MODE = os.getenv("OTASUKE_PROVIDER_MODE", "live")
+FIXTURE_DIR = os.getenv("OTASUKE_FIXTURE_DIR", "fixtures")
+
+# 記録しないパラメータ（APIキー）
+SECRET_PARAMS = {"apiKey", "appid"}
+
+# 呼ぶたびに変わるパラメータ（差分取得の日時）。再生で完全に一致する記録がないときは、
+# これだけを無視して一致する記録を使う（地点などほかのパラメータが違う記録は使わない）
+VOLATILE_PARAMS = {"from", "to"}
+
+# 記録がないときに使う NewsAPI の元データ（Python の repr 形式）
+TEST_NEWS_PATH = "test_news.txt"
+
+_lock = threading.Lock()
+_store = {}  # provider -> {key: record}（初めて使うときに読み込む）
+_replay_now = None  # replay モードの現在時刻（記録の最新時刻。一度だけ求める）
+
+
+class FixtureMissing(requests.RequestException):
+    """replay モードで、該当するレスポンスが記録されていないとき"""
+
+
+def set_mode(mode: str) -> None:
+    global MODE, _replay_now
+    if mode not in MODES:
+        raise ValueError(f"不明なモードです: {mode}（{', '.join(MODES)} のどれか）")
+    MODE = mode
+    _replay_now = None
+
+
+def is_replay() -> bool:
+    return MODE == "replay"
+
+
+def _fixture_path(provider: str) -> str:
+    return os.path.join(FIXTURE_DIR, f"{provider}.jsonl")
+
+
+def _make_key(url: str, params: dict | None) -> str:
+    clean = {k: v for k, v in (params or {}).items() if k not in SECRET_PARAMS}
+    return url + "?" + json.dumps(clean, ensure_ascii=False, sort_keys=True, default=str)
+
+
+def _stable_params(key: str) -> str:
+    """記録のキーから、呼ぶたびに変わるパラメータを除いた部分"""
+    params = json.loads(key.split("?", 1)[1])
+    return json.dumps({k: v for k, v in params.items() if k not in VOLATILE_PARAMS},
+                      ensure_ascii=False, sort_keys=True)
+
+
+def _seed_from_test_news() -> list[dict]:
+    """test_news.txt（NewsAPI の articles の repr）を記録1件分に変換する"""
+    if not os.path.exists(TEST_NEWS_PATH):
+        return []
+    with open(TEST_NEWS_PATH, "r", encoding="utf-8") as f:
+        articles = ast.literal_eval(f.read())
+    latest = max((a.get("publishedAt") or "" for a in articles), default="")
+    return [{
+        "key": _make_key("https://newsapi.org/v2/everything", None),
+        "url": "https://newsapi.org/v2/everything",
+        "recorded_at": latest,
+        "any_params": True,  # どのジャンル（q）で呼ばれてもこの記録を使う
+        "body": {"status": "ok", "totalResults": len(articles), "articles": articles},
+    }]
+
+
+def _load(provider: str) -> dict:
+    """記録を読み込む（プロバイダーごとに最初の1回だけ）"""
+    with _lock:
+        if provider in _store:
+            return _store[provider]
+        records = {}
+        path = _fixture_path(provider)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        records[record["key"]] = record  # 同じキーは後の記録を優先
+        elif provider == "newsapi":
+            records = {r["key"]: r for r in _seed_from_test_news()}
+        _store[provider] = records
+        return records
+
+
+def _record(provider: str, url: str, params: dict | None, body) -> None:
+    record = {
+        "key": _make_key(url, params),
+        "url": url,
+        "recorded_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "body": body,
+    }
+    records = _load(provider)
+    with _lock:
+        os.makedirs(FIXTURE_DIR, exist_ok=True)
+        with open(_fixture_path(provider), "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+        records[record["key"]] = record
+
+
+def _replay(provider: str, url: str, params: dict | None):
+    records = _load(provider)
+    key = _make_key(url, params)
+    record = records.get(key)
+    if record is None:
+        # 日時（VOLATILE_PARAMS）だけが違う記録があれば、その最新のもので代用する
+        stable = _stable_params(key)
+        candidates = [
+            r for r in records.values()
+            if r["url"] == url and (r.get("any_params") or _stable_params(r["key"]) == stable)
+        ]
+        if not candidates:
+            raise FixtureMissing(f"{provider} の記録がありません: {key}")
+        record = max(candidates, key=lambda r: r["recorded_at"])
+    return record["body"]
+
+
+def fetch_json(provider: str, url: str, params: dict | None = None, timeout=http_client.DEFAULT_TIMEOUT, schema=None):
+    """GET して JSON を返す（モードに応じて記録・再生する）
+
+    schema を渡すと、使う項目だけを残して返す（payloads.py のスキーマ）
+    記録にはレスポンス全体を残す（あとでスキーマに項目を足しても再生できるように）
+    """
+    if MODE == "replay":
+        return payloads.project(_replay(provider, url, params), schema)
+
+    r = http_client.get(url, params=params, timeout=timeout)
+    r.raise_for_status()
+    body = payloads.loads(r.content)
+    if MODE == "record":
+        _record(provider, url, params, body)
+    return payloads.project(body, schema)
+
+
+def now() -> datetime:
+    """現在時刻（UTC）。replay モードでは記録時刻で止めて、結果が毎回同じになるようにする
+
+    記録の最新時刻は最初の1回だけ求める（再生中は記録が増えないので変わらない）
+    """
+    global _replay_now
+    if MODE == "replay":
+        if _replay_now is None:
+            latest = max(
+                (r["recorded_at"] for p in PROVIDERS for r in _load(p).values()),
+                default=None,
+            )
+            _replay_now = (datetime.strptime(latest, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+                           if latest else False)
+        if _replay_now:
+            return _replay_now
+    return datetime.now(timezone.utc)
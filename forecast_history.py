@@ -0,0 +1,338 @@
+# forecast_history.py
+# 都道府県ごとの予報・実況の時系列を貯めておくモジュール
+#
+# - 地点ごとに列（時刻・取得時刻・種類・取得元・最高・最低・降水確率）を numpy 配列で持ち、後ろに追記していく
+# - 前回と同じ値は追記しない（取得元ごとに比べるので、tsukumijima と OpenWeather を交互に使っても増えない）
+# - 古い実況は1時間ごとにまとめ、過ぎた日の予報は最後に出たものだけ残す
+# - RETENTION_DAYS より古い点は捨てる
+# - .cache/forecast_history/<地域コード>.rec に、固定長のレコードとして追記だけで保存する
+#   （まとめ直してファイルを書き直すのは COMPACT_INTERVAL ごと。記録の再生中はメモリだけ）
+#
+# 「昨日との比較」や気温の推移グラフはここから読むので API を呼ばない
+import os
+import hashlib
+import threading
+from datetime import datetime, timedelta
+import numpy as np
+import fixtures
+import prefectures
+from weather_api import JST
+
+DATA_DIR = os.getenv("FORECAST_HISTORY_DIR", os.path.join(".cache", "forecast_history"))
+
+RETENTION_DAYS = 14          # これより古い点は捨てる
+DOWNSAMPLE_AFTER = 2 * 86400  # これより古い実況は1時間ごとにまとめる（秒）
+COMPACT_INTERVAL = 6 * 3600   # ファイルをまとめ直す間隔（秒）
+
+# 点の種類
+OBSERVATION = 0  # 実況（その時刻の気温。最高・最低に同じ値が入る）
+FORECAST = 1     # 日次予報（ts はその日の 0 時 JST）
+
+# 取得元（予報はこの単位で前回の値と比べる）
+SOURCES = {"tsukumijima": 1, "openweather": 2}
+UNKNOWN_SOURCE = 0  # 実況・取得元を記録する前の点
+
+COLUMNS = {
+    "ts": np.int64,        # 対象の時刻（UNIX 秒）
+    "issued": np.int64,    # 取得した時刻（UNIX 秒）
+    "kind": np.int8,
+    "source": np.int8,
+    "temp_max": np.float32,
+    "temp_min": np.float32,
+    "pop": np.float32,     # 降水確率 0〜1（ないときは NaN）
+}
+
+# ファイルの1レコード（リトルエンディアン固定）
+RECORD = np.dtype([(name, np.dtype(dtype).newbyteorder("<")) for name, dtype in COLUMNS.items()])
+
+_series = {}  # 地点 -> _Series
+_lock = threading.Lock()
+
+
+class _Series:
+    """1地点分の列データ（容量を倍々に増やしながら追記する）"""
+
+    def __init__(self, columns: dict | None = None):
+        columns = columns or {name: np.empty(0, dtype) for name, dtype in COLUMNS.items()}
+        self.size = len(columns["ts"])
+        capacity = max(16, self.size)
+        self.columns = {}
+        for name, dtype in COLUMNS.items():
+            array = np.empty(capacity, dtype)
+            array[:self.size] = columns[name]
+            self.columns[name] = array
+        self.compacted_at = 0  # 最後にまとめ直した時刻
+
+    def view(self) -> dict:
+        return {name: array[:self.size] for name, array in self.columns.items()}
+
+    def append(self, rows: dict) -> None:
+        n = len(rows["ts"])
+        if self.size + n > len(self.columns["ts"]):
+            capacity = max(2 * len(self.columns["ts"]), self.size + n)
+            for name, array in self.columns.items():
+                grown = np.empty(capacity, array.dtype)
+                grown[:self.size] = array[:self.size]
+                self.columns[name] = grown
+        for name, array in self.columns.items():
+            array[self.size:self.size + n] = rows[name]
+        self.size += n
+
+
+def _key(pref: str) -> str:
+    found = prefectures.lookup(pref)
+    return found.name if found else pref
+
+
+def _path(key: str, ext: str = "rec") -> str:
+    found = prefectures.lookup(key)
+    name = found.area_code if found else hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(DATA_DIR, f"{name}.{ext}")
+
+
+def _now() -> int:
+    return int(fixtures.now().timestamp())
+
+
+def _read(key: str) -> dict | None:
+    """ファイルから列データを読む（以前の .npz 形式も読める）"""
+    path = _path(key)
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            raw = f.read()
+        # 書きかけで終わったレコードは捨てる
+        records = np.frombuffer(raw[:len(raw) - len(raw) % RECORD.itemsize], dtype=RECORD)
+        return {name: records[name].astype(dtype) for name, dtype in COLUMNS.items()}
+    legacy = _path(key, "npz")
+    if os.path.exists(legacy):
+        with np.load(legacy) as data:
+            return {
+                name: data[name] if name in data else np.full(len(data["ts"]), UNKNOWN_SOURCE, dtype)
+                for name, dtype in COLUMNS.items()
+            }
+    return None
+
+
+def _get(key: str) -> _Series:
+    """地点の列データ（初回はファイルから読む）。_lock を持って呼ぶ"""
+    series = _series.get(key)
+    if series is None:
+        columns = None
+        if not fixtures.is_replay():
+            try:
+                columns = _read(key)
+            except Exception as e:
+                print(f"予報履歴の読み込みエラー（{key}）: {e}")
+        series = _series[key] = _Series(columns)
+    return series
+
+
+def _compact(columns: dict, now: int) -> dict:
+    """保持期間を過ぎた点を捨て、古い点を間引く"""
+    keep = columns["ts"] >= now - RETENTION_DAYS * 86400
+    columns = {name: array[keep] for name, array in columns.items()}
+    ts, kind, issued = columns["ts"], columns["kind"], columns["issued"]
+
+    # 過ぎた日の予報は、その日について最後に出たものだけ残す
+    past_forecast = (kind == FORECAST) & (ts + 86400 <= now)
+    # 古い実況は1時間ごとに1点へまとめる
+    old_obs = (kind == OBSERVATION) & (ts < now - DOWNSAMPLE_AFTER)
+    rest = ~(past_forecast | old_obs)
+
+    parts = [{name: array[rest] for name, array in columns.items()}]
+
+    if past_forecast.any():
+        idx = np.flatnonzero(past_forecast)
+        idx = idx[np.lexsort((issued[idx], ts[idx]))]
+        last = np.ones(len(idx), dtype=bool)
+        last[:-1] = ts[idx][1:] != ts[idx][:-1]
+        parts.append({name: array[idx[last]] for name, array in columns.items()})
+
+    if old_obs.any():
+        idx = np.flatnonzero(old_obs)
+        hour = ts[idx] // 3600
+        idx = idx[np.argsort(hour, kind="stable")]
+        hour = ts[idx] // 3600
+        starts = np.flatnonzero(np.r_[True, hour[1:] != hour[:-1]])
+        parts.append({
+            "ts": hour[starts] * 3600,
+            "issued": np.maximum.reduceat(issued[idx], starts),
+            "kind": np.full(len(starts), OBSERVATION, dtype=np.int8),
+            "source": np.full(len(starts), UNKNOWN_SOURCE, dtype=np.int8),
+            "temp_max": np.fmax.reduceat(columns["temp_max"][idx], starts),
+            "temp_min": np.fmin.reduceat(columns["temp_min"][idx], starts),
+            "pop": np.full(len(starts), np.nan, dtype=np.float32),
+        })
+
+    merged = {name: np.concatenate([p[name] for p in parts]).astype(dtype) for name, dtype in COLUMNS.items()}
+    order = np.lexsort((merged["issued"], merged["ts"]))
+    return {name: array[order] for name, array in merged.items()}
+
+
+def _to_records(columns: dict) -> np.ndarray:
+    records = np.empty(len(columns["ts"]), dtype=RECORD)
+    for name in COLUMNS:
+        records[name] = columns[name]
+    return records
+
+
+def _rewrite(key: str, columns: dict) -> None:
+    """まとめ直した列データでファイルを置き換える"""
+    path = _path(key)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_to_records(columns).tobytes())
+    os.replace(tmp, path)
+    legacy = _path(key, "npz")
+    if os.path.exists(legacy):
+        os.remove(legacy)  # 以前の形式は置き換えたので消す
+
+
+def _save(key: str, series: _Series, rows: dict) -> None:
+    """追記した行をファイルの後ろに書き足す。COMPACT_INTERVAL ごとに間引いて書き直す。_lock を持って呼ぶ"""
+    now = _now()
+    if now - series.compacted_at >= COMPACT_INTERVAL:
+        compacted = _compact(series.view(), now)
+        fresh = _series[key] = _Series(compacted)
+        fresh.compacted_at = now
+        if not fixtures.is_replay():
+            _rewrite(key, compacted)
+        return
+    if fixtures.is_replay():
+        return
+    path = _path(key)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "ab") as f:
+        f.write(_to_records(rows).tobytes())
+
+
+def _same(a, b) -> bool:
+    return a == b or (np.isnan(a) and np.isnan(b))
+
+
+def _value(v) -> float:
+    return np.nan if v is None else float(v)
+
+
+def _float(v) -> float | None:
+    """float32 の値を表示用に戻す（NaN は None）"""
+    return None if np.isnan(v) else round(float(v), 2)
+
+
+def record_daily(pref: str, daily: list[dict], source: str | None = None) -> int:
+    """日次予報（weather_providers / aggregate_daily_forecast の形）を追記し、追記した件数を返す
+
+    取得元は source か、各日の "provider" で決まる
+    同じ日・同じ取得元について最後に記録した値と変わらなければ追記しない
+    """
+    key = _key(pref)
+    now = _now()
+    with _lock:
+        series = _get(key)
+        cols = series.view()
+        forecast = cols["kind"] == FORECAST
+        rows = {name: [] for name in COLUMNS}
+        for day in daily:
+            ts = int(day["dt"])
+            source_id = SOURCES.get(day.get("provider") or source, UNKNOWN_SOURCE)
+            temp = day.get("temp") or {}
+            values = (_value(temp.get("max")), _value(temp.get("min")), _value(day.get("pop")))
+            same_day = np.flatnonzero(forecast & (cols["ts"] == ts) & (cols["source"] == source_id))
+            if len(same_day):
+                last = same_day[-1]  # 同じ日の中では取得順に並んでいるので最後が最新
+                stored = (cols["temp_max"][last], cols["temp_min"][last], cols["pop"][last])
+                if all(_same(np.float32(a), b) for a, b in zip(values, stored)):
+                    continue
+            for name, value in zip(("ts", "issued", "kind", "source", "temp_max", "temp_min", "pop"),
+                                   (ts, now, FORECAST, source_id) + values):
+                rows[name].append(value)
+        if rows["ts"]:
+            series.append(rows)
+            _save(key, series, rows)
+        return len(rows["ts"])
+
+
+def record_observation(pref: str, ts: int, temp: float) -> bool:
+    """実況の気温を追記する（前回の実況より新しいときだけ）"""
+    key = _key(pref)
+    with _lock:
+        series = _get(key)
+        cols = series.view()
+        observed = cols["ts"][cols["kind"] == OBSERVATION]
+        if len(observed) and observed.max() >= ts:
+            return False
+        rows = {
+            "ts": [int(ts)], "issued": [_now()], "kind": [OBSERVATION], "source": [UNKNOWN_SOURCE],
+            "temp_max": [temp], "temp_min": [temp], "pop": [np.nan],
+        }
+        series.append(rows)
+        _save(key, series, rows)
+        return True
+
+
+def _latest(column: np.ndarray, idx: np.ndarray):
+    """idx のうち値のある最後の点（取得元によって欠ける値があるので、欠けていれば1つ前の予報を使う）"""
+    values = column[idx]
+    present = np.flatnonzero(~np.isnan(values))
+    return values[present[-1]] if len(present) else np.float32(np.nan)
+
+
+def daily_history(pref: str, days_back: int = 7, days_ahead: int = 2) -> list[dict]:
+    """JST の日ごとの最高・最低・降水確率を返す（古い日から順）
+
+    実況があればその日の実況の最高・最低、なければその日について最後に出た予報を使う
+    記録のない日は含まない
+    """
+    key = _key(pref)
+    with _lock:
+        cols = {name: array.copy() for name, array in _get(key).view().items()}
+
+    today = datetime.fromtimestamp(_now(), JST).replace(hour=0, minute=0, second=0, microsecond=0)
+    jst_offset = int(JST.utcoffset(None).total_seconds())
+    day_of = (cols["ts"] + jst_offset) // 86400
+
+    result = []
+    for offset in range(-days_back, days_ahead + 1):
+        date = today + timedelta(days=offset)
+        day = (int(date.timestamp()) + jst_offset) // 86400
+        obs = (day_of == day) & (cols["kind"] == OBSERVATION)
+        fc = np.flatnonzero((day_of == day) & (cols["kind"] == FORECAST))
+        if obs.any():
+            entry = {
+                "temp_max": _float(np.nanmax(cols["temp_max"][obs])),
+                "temp_min": _float(np.nanmin(cols["temp_min"][obs])),
+                "pop": None,
+                "observed": True,
+            }
+            if len(fc):
+                # 1日の最高・最低は実況の点がまばらだと取りこぼすので、予報の値とも比べる
+                entry["temp_max"] = _float(np.fmax(entry["temp_max"], _latest(cols["temp_max"], fc)))
+                entry["temp_min"] = _float(np.fmin(entry["temp_min"], _latest(cols["temp_min"], fc)))
+                entry["pop"] = _float(_latest(cols["pop"], fc))
+        elif len(fc):
+            entry = {
+                "temp_max": _float(_latest(cols["temp_max"], fc)),
+                "temp_min": _float(_latest(cols["temp_min"], fc)),
+                "pop": _float(_latest(cols["pop"], fc)),
+                "observed": False,
+            }
+        else:
+            continue
+        entry["date"] = date.date()
+        result.append(entry)
+    return result
+
+
+def compare_with_yesterday(pref: str) -> dict | None:
+    """今日と昨日の最高・最低気温の差（どちらかの記録がなければ None）"""
+    history = {entry["date"]: entry for entry in daily_history(pref, days_back=1, days_ahead=0)}
+    today = datetime.fromtimestamp(_now(), JST).date()
+    now, before = history.get(today), history.get(today - timedelta(days=1))
+    if not now or not before:
+        return None
+    diff = {}
+    for name in ("temp_max", "temp_min"):
+        if now[name] is not None and before[name] is not None:
+            diff[name] = round(now[name] - before[name], 1)
+    return diff or None
@@ -1,55 +1,212 @@
-import requests
+import os
+import time
+import sqlite3
+import threading
+import quota
+import fixtures
+import payloads
+import expiry
 import json
 import datetime
+import numpy as np
+
+JST = datetime.timezone(datetime.timedelta(hours=9))
+
+# 星座と始まりの日（月, 日）。1月1日〜1月19日は前の年から続く山羊座
+ZODIAC_STARTS = [
+    ("水瓶座", (1, 20)),
+    ("魚座", (2, 19)),
+    ("牡羊座", (3, 21)),
+    ("牡牛座", (4, 20)),
+    ("双子座", (5, 21)),
+    ("蟹座", (6, 22)),
+    ("獅子座", (7, 23)),
+    ("乙女座", (8, 23)),
+    ("天秤座", (9, 23)),
+    ("蠍座", (10, 24)),
+    ("射手座", (11, 23)),
+    ("山羊座", (12, 22)),
+]
+ZODIAC_SIGNS = [sign for sign, _ in ZODIAC_STARTS]
+
+# 月ごとの日数と、その月の1日が何日目か（2月29日も引けるようにうるう年で数える）
+_MONTH_DAYS = np.array([31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+_MONTH_START = np.concatenate([[0], np.cumsum(_MONTH_DAYS)[:-1]])
+
+# 1年の何日目（0〜365）→ 星座の番号 の表（起動時に1回だけ作る）
+_START_DAYS = np.array([_MONTH_START[m - 1] + d - 1 for _, (m, d) in ZODIAC_STARTS])
+_SIGN_BY_DAY = (np.searchsorted(_START_DAYS, np.arange(366), side="right") - 1) % len(ZODIAC_SIGNS)
+
+
+def zodiac_indices(months, days) -> np.ndarray:
+    """(月, 日) の配列から星座の番号（ZODIAC_SIGNS の位置）の配列を返す。存在しない日付は -1"""
+    months = np.asarray(months, dtype=np.int64)
+    days = np.asarray(days, dtype=np.int64)
+    valid = (months >= 1) & (months <= 12)
+    m = np.where(valid, months, 1)
+    valid &= (days >= 1) & (days <= _MONTH_DAYS[m - 1])
+    day_of_year = np.where(valid, _MONTH_START[m - 1] + days - 1, 0)
+    return np.where(valid, _SIGN_BY_DAY[day_of_year], -1)
+
+
+def get_zodiacs(months, days) -> list[str | None]:
+    """たくさんの (月, 日) の星座をまとめて判定する（存在しない日付は None）"""
+    return [ZODIAC_SIGNS[i] if i >= 0 else None for i in zodiac_indices(months, days).tolist()]
+
 
 # 星座を判定する関数（誕生日→星座名）
 def get_zodiac(month, day):
-    zodiac_dates = [
-        ("山羊座", (12, 22), (1, 19)),
-        ("水瓶座", (1, 20), (2, 18)),
-        ("魚座", (2, 19), (3, 20)),
-        ("牡羊座", (3, 21), (4, 19)),
-        ("牡牛座", (4, 20), (5, 20)),
-        ("双子座", (5, 21), (6, 21)),
-        ("蟹座", (6, 22), (7, 22)),
-        ("獅子座", (7, 23), (8, 22)),
-        ("乙女座", (8, 23), (9, 22)),
-        ("天秤座", (9, 23), (10, 23)),
-        ("蠍座", (10, 24), (11, 22)),
-        ("射手座", (11, 23), (12, 21)),
-    ]
-
-    for sign, start, end in zodiac_dates:
-        # 年をまたぐ星座（山羊座）への対応
-        if start[0] == 12:
-            if (month == 12 and day >= start[1]) or (month == 1 and day <= end[1]):
-                return sign
-        else:
-            if (month == start[0] and day >= start[1]) or \
-               (month == end[0] and day <= end[1]) or \
-               (start[0] < month < end[0]):
-                return sign
-
-    return None
+    try:
+        month, day = int(month), int(day)
+    except (TypeError, ValueError):
+        return None
+    if not (1 <= month <= 12 and 1 <= day <= _MONTH_DAYS[month - 1]):
+        return None
+    return ZODIAC_SIGNS[_SIGN_BY_DAY[_MONTH_START[month - 1] + day - 1]]
 
-def get_horoscope(birth_month, birth_day):
-    # 今日の日付（API形式）
-    date = datetime.datetime.today().strftime("%Y/%m/%d")
+@quota.governed("jugemkey", "horoscope/free")
+def fetch_horoscope(date):
+    """指定日（YYYY/MM/DD）の12星座分の占いデータを取得"""
+    return fixtures.fetch_json(
+        "jugemkey", f"http://api.jugemkey.jp/api/horoscope/free/{date}", schema=payloads.JUGEMKEY_HOROSCOPE
+    )
 
-    # 星座を判定
-    user_sign = get_zodiac(birth_month, birth_day)
 
-    # API取得
-    res = requests.get(f"http://api.jugemkey.jp/api/horoscope/free/{date}")
-    data = res.json()
+# --- 1日分（12星座）を1回だけ取得し、星座ごとに引けるようにしておく ---
+# 取得した日の分は .cache/horoscope.sqlite3 にも保存するので、再起動しても取り直さない
+# 2人目以降のユーザーはメモリの辞書を引くだけ（ネットワークを使わない）
+DB_PATH = os.getenv("HOROSCOPE_DB_PATH", os.path.join(".cache", "horoscope.sqlite3"))
+RETENTION_DAYS = 7        # これより古い日の分は消す
+PREFETCH_AHEAD = 60 * 60  # JST 0時のこの秒数前に、翌日分を先に取りに行く
+PREFETCH_DELAY = 5 * 60   # 先に取れなかったときに、0時を過ぎてから取りに行くまでの秒数
+MEMORY_DAYS = 2           # メモリに置いておく日数
 
-    # 今日の12星座一覧
-    today_horoscopes = data["horoscope"][date]
+_days = {}  # 日付（YYYY/MM/DD） -> {星座: 占いデータ}
+_day_locks = {}
+_lock = threading.Lock()
+_prefetcher_started = False
+_db_initialized = False
+
+
+def _connect() -> sqlite3.Connection:
+    global _db_initialized
+    if not _db_initialized:
+        os.makedirs(os.path.dirname(DB_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(DB_PATH, timeout=10)
+    if not _db_initialized:
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS horoscopes (
+                day  TEXT NOT NULL,
+                sign TEXT NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (day, sign)
+            )
+        """)
+        _db_initialized = True
+    return conn
+
+
+def _load_saved(date) -> dict | None:
+    if fixtures.is_replay():
+        return None
+    conn = _connect()
+    try:
+        rows = conn.execute("SELECT sign, data FROM horoscopes WHERE day = ?", (date,)).fetchall()
+    finally:
+        conn.close()
+    return {sign: json.loads(data) for sign, data in rows} or None
 
-    # 星座に一致するデータだけ取り出す
-    user_horoscope = next(
-        item for item in today_horoscopes if item["sign"] == user_sign
-    )
 
-    return user_horoscope
+def _save(date, by_sign) -> None:
+    if fixtures.is_replay():
+        return  # 記録の再生中は保存しない
+    oldest = (datetime.datetime.strptime(date, "%Y/%m/%d") - datetime.timedelta(days=RETENTION_DAYS)).strftime("%Y/%m/%d")
+    conn = _connect()
+    try:
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO horoscopes (day, sign, data) VALUES (?, ?, ?)",
+                [(date, sign, json.dumps(item, ensure_ascii=False)) for sign, item in by_sign.items()],
+            )
+            conn.execute("DELETE FROM horoscopes WHERE day < ?", (oldest,))
+    finally:
+        conn.close()
+
+
+def _remember(date, by_sign) -> None:
+    with _lock:
+        _days[date] = by_sign
+        for old in sorted(_days)[:-MEMORY_DAYS]:
+            del _days[old]
+
+
+def load_day(date) -> dict:
+    """指定日の {星座: 占いデータ} を返す（メモリ → 保存済み → API の順。API は1日1回）"""
+    with _lock:
+        if date in _days:
+            return _days[date]
+        day_lock = _day_locks.setdefault(date, threading.Lock())
+
+    # 同じ日を同時に取りに行かないように、日ごとに1人だけが取得する
+    try:
+        with day_lock:
+            with _lock:
+                if date in _days:
+                    return _days[date]
+            by_sign = _load_saved(date)
+            if by_sign is None:
+                data = fetch_horoscope(date)
+                by_sign = {item["sign"]: item for item in data["horoscope"][date]}
+                _save(date, by_sign)
+            _remember(date, by_sign)
+        return by_sign
+    finally:
+        # 取得に失敗した日もロックを残さない（次の呼び出しで取り直す）
+        with _lock:
+            _day_locks.pop(date, None)
+
+
+def today_date() -> str:
+    """今日の日付（API形式, JST）。replay モードでは記録時の日付になる"""
+    return fixtures.now().astimezone(JST).strftime("%Y/%m/%d")
+
+
+def _prefetch_loop():
+    while True:
+        try:
+            load_day(today_date())
+        except Exception as e:
+            print(f"占いの読み込みエラー: {e}")
+
+        # 次の JST 0時の少し前に、翌日分を先に取っておく（0時すぎの最初の表示で API を待たない）
+        midnight = expiry.jst_midnight()
+        time.sleep(max(midnight - PREFETCH_AHEAD - time.time(), 0))
+        tomorrow = datetime.datetime.fromtimestamp(midnight, JST).strftime("%Y/%m/%d")
+        try:
+            load_day(tomorrow)
+        except Exception as e:
+            # まだ公開されていなければ、0時を過ぎてから今日の分として取る
+            print(f"占いの先読みエラー（{tomorrow}）: {e}")
+        time.sleep(max(midnight - time.time(), 0) + PREFETCH_DELAY)
+
+
+def start_prefetcher():
+    """今日の分を読み込み、毎日 JST 0時の少し前に翌日分を先読みする（プロセスごとに1回だけ）
+
+    翌日分がまだ取れないときは、0時を過ぎてから取りに行く
+    """
+    global _prefetcher_started
+    with _lock:
+        if _prefetcher_started:
+            return
+        _prefetcher_started = True
+    threading.Thread(target=_prefetch_loop, name="horoscope-prefetcher", daemon=True).start()
+
+
+def get_horoscope(birth_month, birth_day):
+    # 星座を判定
+    user_sign = get_zodiac(birth_month, birth_day)
 
+    # 今日の12星座（1日1回だけ取得したもの）から、星座に一致するデータを取り出す
+    return load_day(today_date())[user_sign]
@@ -0,0 +1,88 @@
+# http_client.py
+# 外部APIへの通信をまとめるモジュール
+# すべての API 呼び出しで1つのセッションを共有し、ホストごとに接続を使い回す
+# （毎回 TCP + TLS のハンドシェイクをしなくて済む）
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# 通信先のホスト（起動時に接続を開いておく。DNS の問い合わせは接続を開くときの1回だけで、
+# あとは keep-alive で同じ接続を使い回す）
+API_HOSTS = {
+    "newsapi.org": "https://newsapi.org/",
+    "api.openweathermap.org": "https://api.openweathermap.org/",
+    "weather.tsukumijima.net": "https://weather.tsukumijima.net/",
+    "api.jugemkey.jp": "http://api.jugemkey.jp/",
+}
+
+# (接続, 読み込み) のタイムアウト秒数
+DEFAULT_TIMEOUT = (3.05, 8)
+
+# ホストごとに保持する接続数（Streamlit は1プロセスで複数セッションを並行して処理する）
+POOL_CONNECTIONS = 16
+POOL_MAXSIZE = 16
+
+try:
+    import brotli  # noqa: F401  brotli があれば br 圧縮も受け付ける
+    ACCEPT_ENCODING = "br, gzip, deflate"
+except ImportError:
+    ACCEPT_ENCODING = "gzip, deflate"
+
+
+class TimeoutAdapter(HTTPAdapter):
+    """timeout を指定しなかった呼び出しにもデフォルトのタイムアウトを付ける"""
+
+    def send(self, request, timeout=None, **kwargs):
+        if timeout is None:
+            timeout = DEFAULT_TIMEOUT
+        return super().send(request, timeout=timeout, **kwargs)
+
+
+def make_session(adapter_class=TimeoutAdapter) -> requests.Session:
+    """共有セッションと同じ設定のセッションを作る（adapter_class で接続の仕方を変えられる）"""
+    s = requests.Session()
+    # 一時的な障害（GET のみ）は少し待って1回だけやり直す
+    retry = Retry(total=1, backoff_factor=0.3, status_forcelist=(502, 503, 504), allowed_methods=("GET", "HEAD"))
+    adapter = adapter_class(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, max_retries=retry)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    s.headers.update({"Accept-Encoding": ACCEPT_ENCODING, "Connection": "keep-alive"})
+    return s
+
+
+session = make_session()
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    """共有セッションで GET する（requests.get の代わり）"""
+    return session.get(url, **kwargs)
+
+
+_warmed_up = False
+_warm_up_lock = threading.Lock()
+
+
+def warm_up() -> None:
+    """各APIホストへの接続を先に開いておく（DNS 解決 + TLS ハンドシェイクを済ませる）"""
+    def touch(url):
+        try:
+            session.head(url, timeout=DEFAULT_TIMEOUT, allow_redirects=False)
+        except requests.RequestException:
+            pass  # 事前接続なので失敗しても問題ない
+
+    threads = [threading.Thread(target=touch, args=(url,), daemon=True) for url in API_HOSTS.values()]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def warm_up_in_background() -> None:
+    """サーバー起動時に1回だけ、バックグラウンドで warm_up する"""
+    global _warmed_up
+    with _warm_up_lock:
+        if _warmed_up:
+            return
+        _warmed_up = True
+    threading.Thread(target=warm_up, daemon=True).start()
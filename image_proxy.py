@@ -0,0 +1,277 @@
+# image_proxy.py
+# ニュース画像を一度だけダウンロードし、カードの大きさに縮小したサムネイルを
+# static/thumbs/ に保存して配信するモジュール
+#
+# Streamlit の静的ファイル配信（.streamlit/config.toml の enableStaticServing）を使い、
+# ブラウザには app/static/thumbs/<ハッシュ>.jpg を読ませる
+import io
+import os
+import time
+import socket
+import sqlite3
+import hashlib
+import ipaddress
+import threading
+from urllib.parse import urljoin, urlsplit
+from concurrent.futures import ThreadPoolExecutor
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+import fixtures
+import http_client
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow がなければ元の画像URLをそのまま使う
+    Image = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+THUMB_DIR = os.path.join(BASE_DIR, "static", "thumbs")
+THUMB_URL_PREFIX = "app/static/thumbs/"
+DB_PATH = os.path.abspath(os.getenv("IMAGE_DB_PATH", os.path.join(BASE_DIR, ".cache", "images.sqlite3")))
+
+# カード（幅いっぱい・高さ220px）に対して十分な大きさ
+THUMB_SIZE = (640, 360)
+THUMB_QUALITY = 70
+
+# キャッシュ全体の上限サイズ（超えたら古く使われていないものから消す）
+MAX_CACHE_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", 50 * 1024 * 1024))
+
+# これより大きい元画像はダウンロードしない
+MAX_SOURCE_BYTES = 10 * 1024 * 1024
+
+# これより画素数の多い画像は展開しない（小さいファイルで巨大な画像になるものを避ける）
+MAX_SOURCE_PIXELS = 25_000_000
+
+# たどるリダイレクトの回数
+MAX_REDIRECTS = 3
+
+
+class UnsafeImageUrl(ValueError):
+    """記事の画像URLが、取りに行ってはいけない先（内部のアドレスなど）を指しているとき"""
+
+
+def _is_public(address: str) -> bool:
+    return ipaddress.ip_address(address.split("%")[0]).is_global
+
+
+class _PublicOnlyConnection:
+    """接続した先の IP アドレスを、リクエストを送る前に確かめる
+
+    check_public_url で名前解決してから実際に接続するまでに DNS の応答が変わっても
+    （DNS rebinding）、内部のアドレスには何も送らない
+    """
+
+    def _new_conn(self):
+        sock = super()._new_conn()
+        peer = sock.getpeername()[0]
+        if not _is_public(peer):
+            sock.close()
+            raise UnsafeImageUrl(f"公開されていないアドレスに接続しようとしました: {self.host}（{peer}）")
+        return sock
+
+
+class _PublicOnlyHTTPConnection(_PublicOnlyConnection, HTTPConnection):
+    pass
+
+
+class _PublicOnlyHTTPSConnection(_PublicOnlyConnection, HTTPSConnection):
+    pass
+
+
+class _PublicOnlyHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _PublicOnlyHTTPConnection
+
+
+class _PublicOnlyHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _PublicOnlyHTTPSConnection
+
+
+class _PublicOnlyAdapter(http_client.TimeoutAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _PublicOnlyHTTPConnectionPool,
+            "https": _PublicOnlyHTTPSConnectionPool,
+        }
+
+
+# 画像のダウンロード用のセッション（公開されたアドレスにだけ接続する）
+# プロキシを通すと実際の接続先を確かめられないので、環境変数のプロキシは使わない
+_session = http_client.make_session(_PublicOnlyAdapter)
+_session.trust_env = False
+
+_executor = ThreadPoolExecutor(max_workers=4)
+_lock = threading.Lock()
+_in_flight = set()
+_initialized = False
+
+
+def _connect() -> sqlite3.Connection:
+    global _initialized
+    if not _initialized:
+        os.makedirs(os.path.dirname(DB_PATH) or ".", exist_ok=True)
+        os.makedirs(THUMB_DIR, exist_ok=True)
+    conn = sqlite3.connect(DB_PATH, timeout=10)
+    if not _initialized:
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS thumbs (
+                url         TEXT PRIMARY KEY,
+                digest      TEXT NOT NULL,
+                size        INTEGER NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_thumbs_digest ON thumbs (digest)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_thumbs_accessed_at ON thumbs (accessed_at)")
+        _initialized = True
+    return conn
+
+
+def _thumb_path(digest: str) -> str:
+    return os.path.join(THUMB_DIR, f"{digest}.jpg")
+
+
+def make_thumbnail(data: bytes) -> bytes:
+    """画像を縮小して JPEG に再圧縮する（Streamlit の静的配信が正しく返せる形式）"""
+    with Image.open(io.BytesIO(data)) as img:
+        # Image.open はヘッダーしか読まないので、展開する前に大きさを確かめる
+        if img.width * img.height > MAX_SOURCE_PIXELS:
+            raise ValueError(f"画像が大きすぎます: {img.width}x{img.height}")
+        img = img.convert("RGB")
+        img.thumbnail(THUMB_SIZE)
+        out = io.BytesIO()
+        img.save(out, format="JPEG", quality=THUMB_QUALITY, optimize=True, progressive=True)
+    return out.getvalue()
+
+
+def check_public_url(url: str) -> None:
+    """http(s) で、公開されたアドレスだけを指す URL か確かめる（違えば UnsafeImageUrl）
+
+    記事の画像URLはサーバーから取りに行くので、社内のアドレスや localhost を指すものは断る
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise UnsafeImageUrl(f"http(s) ではない画像URLです: {url}")
+    try:
+        infos = socket.getaddrinfo(parts.hostname, parts.port or (443 if parts.scheme == "https" else 80),
+                                   proto=socket.IPPROTO_TCP)
+    except socket.gaierror as e:
+        raise UnsafeImageUrl(f"画像URLのホストが見つかりません: {url}") from e
+    for info in infos:
+        if not _is_public(info[4][0]):
+            raise UnsafeImageUrl(f"公開されていないアドレスの画像URLです: {url}")
+
+
+def _download(url: str) -> bytes | None:
+    """画像をダウンロードする（MAX_SOURCE_BYTES を超えるものは None）。リダイレクト先も確かめる
+
+    check_public_url で先に断り、実際に接続した先も _session が確かめる
+    """
+    for _ in range(MAX_REDIRECTS + 1):
+        check_public_url(url)
+        with _session.get(url, stream=True, allow_redirects=False) as r:
+            if r.is_redirect:
+                url = urljoin(url, r.headers["Location"])
+                continue
+            r.raise_for_status()
+            length = r.headers.get("Content-Length")
+            if length and length.isdigit() and int(length) > MAX_SOURCE_BYTES:
+                return None
+            data = r.raw.read(MAX_SOURCE_BYTES + 1, decode_content=True)
+        return data if len(data) <= MAX_SOURCE_BYTES else None
+    raise UnsafeImageUrl(f"リダイレクトが多すぎます: {url}")
+
+
+def _store_thumbnail(url: str) -> None:
+    data = _download(url)
+    if data is None:
+        return
+    thumb = make_thumbnail(data)
+
+    # 内容のハッシュをファイル名にする（同じ画像は1つだけ保存される）
+    digest = hashlib.sha256(thumb).hexdigest()
+    path = _thumb_path(digest)
+    if not os.path.exists(path):
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(thumb)
+        os.replace(tmp, path)
+
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO thumbs (url, digest, size, accessed_at) VALUES (?, ?, ?, ?)",
+                (url, digest, len(thumb), time.time()),
+            )
+        evict(conn)
+    finally:
+        conn.close()
+
+
+def _download_and_store(url: str) -> None:
+    try:
+        _store_thumbnail(url)
+    except Exception as e:
+        # 取得・変換できない画像は元のURLのまま表示される
+        print(f"サムネイル作成エラー（{url}）: {e}")
+    finally:
+        with _lock:
+            _in_flight.discard(url)
+
+
+def evict(conn: sqlite3.Connection) -> None:
+    """キャッシュが上限を超えていたら、最後に使われたのが古いものから削除する"""
+    with conn:
+        total = conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT digest, size FROM thumbs)"
+        ).fetchone()[0]
+        if total <= MAX_CACHE_BYTES:
+            return
+        rows = conn.execute(
+            "SELECT digest, MAX(accessed_at) AS last, MAX(size) FROM thumbs GROUP BY digest ORDER BY last"
+        ).fetchall()
+        for digest, _, size in rows:
+            if total <= MAX_CACHE_BYTES:
+                break
+            conn.execute("DELETE FROM thumbs WHERE digest = ?", (digest,))
+            try:
+                os.remove(_thumb_path(digest))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def thumbnail_url(url: str) -> str:
+    """カードに表示する画像のURLを返す
+
+    サムネイルがあればローカルのURL、まだなければ元のURLを返して
+    バックグラウンドでサムネイルを作る（次の表示から使われる）
+    """
+    if not url or Image is None or fixtures.is_replay():
+        return url
+
+    conn = _connect()
+    try:
+        with conn:
+            row = conn.execute("SELECT digest FROM thumbs WHERE url = ?", (url,)).fetchone()
+            if row and os.path.exists(_thumb_path(row[0])):
+                conn.execute("UPDATE thumbs SET accessed_at = ? WHERE url = ?", (time.time(), url))
+                return THUMB_URL_PREFIX + f"{row[0]}.jpg"
+    finally:
+        conn.close()
+
+    with _lock:
+        if url in _in_flight:
+            return url
+        _in_flight.add(url)
+    _executor.submit(_download_and_store, url)
+    return url
+
+
+def img_tag(url: str, alt: str = "ニュース画像") -> str:
+    """遅延読み込みする <img> タグ（画像がなければ空文字）"""
+    if not url:
+        return ""
+    return f'<img src="{thumbnail_url(url)}" alt="{alt}" loading="lazy" decoding="async">'
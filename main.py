@@ -1,81 +1,67 @@
 import streamlit as st
+from prefectures import PREF_NAMES
 from datetime import date, datetime
 from weather import weather_api, get_weather_icon
+import news_api
 from news_api import news_get
 from hour_calc import diff_hour
-from horoscope import get_horoscope
+from horoscope import get_horoscope, start_prefetcher
+import settings_store
 from db import supabase
 import os
 from dotenv import load_dotenv
 load_dotenv()
-import json
-from weather_api import (
-    geocode_prefecture, fetch_current_weather, 
-    fetch_forecast, aggregate_daily_forecast, get_weather_icon, JST
-)
+import fixtures
+import image_proxy
+import http_client
+import weather_providers
+import forecast_history
+import pandas as pd
+import prefectures
+from weather_api import get_weather_icon, JST
+
+# 外部APIへの接続を先に開いておく（記録の再生中はネットワークを使わない）
+if not fixtures.is_replay():
+    http_client.warm_up_in_background()
+    start_prefetcher()  # 今日の占いを先に読み込み、毎日0時過ぎに翌日分を取る
+    if os.getenv("NEWS_API_KEY"):
+        news_api.start_ingester(os.getenv("NEWS_API_KEY"))  # ニュースは裏で取り込み、表示は記事ストアから読む
 
 
 #========================================
 # Supabase に設定を保存する関数
 #========================================
 def save_settings_to_supabase():
-    """st.session_state.settings の内容を users テーブルに 1 行保存する"""
+    """st.session_state.settings のうち変わった列を users テーブルに保存する（書き込みは裏で行う）
 
-    auth_user_id = st.session_state.get("auth_user_id")
+    保存を予約したら True、変わった列がなくて何もしなかったら False、ログインしていなければ None
+    （書き込みの結果は settings_store.status() で分かる）
+    """
+
+    auth_user_id = st.session_state.get("auth_user_id") or st.session_state.settings.get("auth_user_id")
     if not auth_user_id:
         st.error("ログインユーザーが取得できません。先にログインしてください。")
         return None
 
-    s = st.session_state.settings
-    categories_json = json.dumps(s.get("categories", []), ensure_ascii=False)
-
-    data = {
-        "auth_user_id": auth_user_id,
-        "birth_year":   s.get("birth_year"),
-        "birth_month":  s.get("birth_month"),
-        "birth_day":    s.get("birth_day"),
-        "home_pref":    s.get("home_pref"),
-        "work_pref":    s.get("work_pref"),
-        "categories":   categories_json,
-    }
-
-    res = (
-        supabase
-        .table("users")
-        .upsert(data, on_conflict="auth_user_id")
-        .execute()
-    )
+    return settings_store.persist(st.session_state, auth_user_id)
 
-    return res
 
 
+def load_settings_from_supabase(user_metadata: dict | None = None):
+    """このユーザーの設定を読み込む
 
-def load_settings_from_supabase():
-    #Supabase の users テーブルから、このユーザーの設定を読み込む"""
+    ログインの応答の user_metadata に設定があればそれを使う（DB の問い合わせは0回）
+    """
 
     auth_user_id = st.session_state.get("auth_user_id")
     if not auth_user_id:
         return  # ログインしていなければ何もしない
-    res = (
-        supabase
-        .table("users")
-        .select("*")
-        .eq("auth_user_id", auth_user_id)
-        .maybe_single()      # 0 or 1 件想定
-        .execute()
-    )
 
-    if res.data:
-        row = res.data
-        st.session_state.settings = {
-            "email":row.get("email"),
-            "birth_year":  row.get("birth_year"),
-            "birth_month": row.get("birth_month"),
-            "birth_day":   row.get("birth_day"),
-            "home_pref":   row.get("home_pref"),
-            "work_pref":   row.get("work_pref"),
-            "categories":  json.loads(row.get("categories") or "[]"),
-        }
+    settings = settings_store.load(st.session_state, auth_user_id, user_metadata)
+    if settings:
+        st.session_state.settings = settings
+        # 読み込んだ内容は保存済み（変えない限り書き込まない）
+        settings_store.mark_saved(st.session_state)
 
 
 
@@ -322,24 +308,10 @@ h1, h2, h3, h4 {
 
 
 # 都道府県リスト
-PREF_LIST = [
-    "北海道", "青森県", "岩手県", "宮城県", "秋田県", "山形県", "福島県",
-    "茨城県", "栃木県", "群馬県", "埼玉県", "千葉県", "東京都", "神奈川県",
-    "新潟県", "富山県", "石川県", "福井県", "山梨県", "長野県",
-    "岐阜県", "静岡県", "愛知県", "三重県",
-    "滋賀県", "京都府", "大阪府", "兵庫県", "奈良県", "和歌山県",
-    "鳥取県", "島根県", "岡山県", "広島県", "山口県",
-    "徳島県", "香川県", "愛媛県", "高知県",
-    "福岡県", "佐賀県", "長崎県", "熊本県", "大分県", "宮崎県", "鹿児島県",
-    "沖縄県",
-]
-
-# ニュースジャンルリスト（例）
-CATEGORY_LIST = [
-    "テクノロジー", "ビジネス", "スポーツ", "政治", "国際",
-    "エンタメ", "健康", "ライフスタイル", "経済", "科学",
-    "環境", "教育",
-]
+PREF_LIST = PREF_NAMES
+
+# ニュースジャンルリスト（news_api と同じもの）
+CATEGORY_LIST = news_api.CATEGORY_LIST
 
 # ======================================
 # 共通ヘッダー
@@ -446,74 +418,101 @@ def step_categories():
 
 
 # ======================================
-# ダッシュボード（メイン画面）
+# ニュースフィード
 # ======================================
-def render_dashboard():
-    cols = st.columns([6, 1])
-    with cols[1]:
-        # 右上に小さな「設定」ボタン
-        if st.button("⚙️ 設定", key="header_settings"):
-            st.session_state.page = "onboarding"
-            st.session_state.step = 1  # 生年月日からやり直し（好みで変更OK）
-            st.rerun()
+NEWS_FEED_SIZE = 50  # まとめて取得する件数（ページ送りはここから切り出すだけ）
+NEWS_PAGE_SIZE = 3   # 1回に表示する件数
+NEWS_FEED_TTL = 60 * 15  # この秒数がたったら取り直す
+
+def load_news_feed(api_key, categories):
+    """ニュースをまとめて取得してセッションに保持する（ジャンルが変わるか古くなったら取り直す）"""
+    key = tuple(sorted(set(categories or [])))
+    feed = st.session_state.get("news_feed")
+    now = datetime.now().timestamp()
+    if not feed or feed["key"] != key or now - feed["fetched_at"] > NEWS_FEED_TTL:
+        feed = {
+            "key": key,
+            "articles": news_get(api_key, categories, limit=NEWS_FEED_SIZE),
+            "shown": NEWS_PAGE_SIZE,  # 表示済みの件数（カーソル）
+            "fetched_at": now,
+        }
+        st.session_state.news_feed = feed
+    return feed
+
+def render_news_card(article):
+    delta = diff_hour(article["publishedAt"])
 
-    render_header()
-    NEWS_API_KEY = os.getenv("NEWS_API_KEY")
-    today = datetime.today()
-    
     st.markdown(
-        f"**{today.strftime('%m月%d日（%a）')}**",
+        f"""
+        <div class="news-card">
+            {image_proxy.img_tag(article["urlToImage"])}
+            <div style="font-size:16px; font-weight:700; color:#333; margin-bottom:8px; line-height:1.4;">
+                {article["title"]}
+            </div>
+            <div style="font-size:14px; color:#555; line-height:1.6; margin-bottom:10px;">
+                {article["description"]}
+            </div>
+            <div style="font-size:11px; color:#999;">
+                🕐 {delta}時間前
+            </div>
+        </div>
+        """,
+        unsafe_allow_html=True,
+    )
+    st.link_button(
+        label="📰 記事を読む",
+        url=article["url"],
+        help="クリックすると記事の詳細ページに移動します"
     )
 
-    st.markdown('<div style="margin-top:12px;"></div>', unsafe_allow_html=True)
+@st.fragment
+def render_news_feed(feed):
+    """最初の数件だけ表示し、「もっと見る」でフィードの部分だけを再実行して続きを出す"""
+    articles = feed["articles"]
+    for article in articles[:feed["shown"]]:
+        render_news_card(article)
 
-    # # 追加
-    # # 開発中は True、本番テストは False にする（API100回制限ありのため）
-    # USE_TEST_DATA = True
-    # if USE_TEST_DATA:
-    #     # ----------------------------
-    #     # test_news.txt を読み込む
-    #     # ----------------------------
-    #     with open("test_news.txt", "r", encoding="utf-8") as f:
-    #         news_data = f.read()
-    #         st.info("📝 開発モード：test_news.txt を使っています（API未使用）")
-    # else:
-    #     # ----------------------------
-    #     # 本番 API を呼び出す
-    #     # ----------------------------
-    #     news_data = call_news_api(NEWS_API_KEY)
-    #     st.success("本番モード：APIを使用しています")
-
-    # # 読み込んだニュースを表示する処理（あなたの UI に合わせて）
-    # st.write(news_data)
-
-    # 天気
-    OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
-    home_pref = st.session_state.settings.get("home_pref") or "東京"
-    # st.write("DEBUG - home_pref:", home_pref)
-    lat, lon, resolved_name = geocode_prefecture(home_pref, OPENWEATHER_API_KEY)
-    current_weather = fetch_current_weather(lat, lon, OPENWEATHER_API_KEY)
-    forecast_data = fetch_forecast(lat, lon, OPENWEATHER_API_KEY)    
-    daily_forecast = aggregate_daily_forecast(forecast_data)
+    if feed["shown"] < len(articles):
+        if st.button("もっと見る", key="news_more"):
+            feed["shown"] += NEWS_PAGE_SIZE
+            st.rerun(scope="fragment")
+    elif not articles:
+        st.caption("選択中のジャンルのニュースが見つかりませんでした。")
+
+
+# ======================================
+# ダッシュボード（メイン画面）
+# ======================================
+def render_weather_card(title, pref, daily_forecast):
+    """今日の天気カード（daily_forecast は weather_providers の日次予報）"""
+    if not daily_forecast:
+        st.warning(f"{pref}の天気を取得できませんでした。")
+        return
     day_data = daily_forecast[0]
     weather_desc = day_data.get("weather", [{}])[0].get("description", "不明")
     weather_desc = weather_desc.replace("晴天", "晴れ")
     icon = get_weather_icon(weather_desc) # アイコン取得もモジュール化
 
-    temp_max = day_data.get("temp", {}).get("max", "--")
-    temp_min = day_data.get("temp", {}).get("min", "--")
-    pop = day_data.get("pop", None)*100
+    temp_max = day_data.get("temp", {}).get("max")
+    temp_min = day_data.get("temp", {}).get("min")
+    temp_max = "--" if temp_max is None else temp_max
+    temp_min = "--" if temp_min is None else temp_min
+    pop = day_data.get("pop")
+    pop = "--" if pop is None else round(pop * 100)
+    # 昨日との比較（貯めておいた履歴から出すので API は呼ばない）
+    diff = forecast_history.compare_with_yesterday(pref) or {}
+    diff_text = f"昨日より {diff['temp_max']:+.1f}°" if "temp_max" in diff else ""
     # telop, max_temp, min_temp = weather_api(home_pref)
     # icon = get_weather_icon(telop)
 
     st.markdown(
         f"""
         <div class="info-card weather-card">
-            <div style="font-size:14px; color:#FF8C00; font-weight:600; margin-bottom:8px;">☀️ 今日の天気</div>
+            <div style="font-size:14px; color:#FF8C00; font-weight:600; margin-bottom:8px;">{title}</div>
             <div style="display:flex; align-items:center; gap:20px; margin-top:8px;">
                 <div style="font-size:72px; line-height:1;">{icon}</div>
                 <div>
-                    <div style="font-size:16px; color:#666; margin-bottom:4px;">【{home_pref}】</div>
+                    <div style="font-size:16px; color:#666; margin-bottom:4px;">【{pref}】</div>
                     <div style="margin-bottom:8px;">
                         <div style="font-size:14px; color:#888;">最高気温</div>
                         <div style="font-size:48px; font-weight:700; color:#FF6347; line-height:1;">{temp_max}°</div>
@@ -523,6 +522,7 @@ def render_dashboard():
                         <div style="font-size:48px; font-weight:700; color:#4682B4; line-height:1;">{temp_min}°</div>
                     </div>
                     <div style="font-size:15px; color:#666; margin-top:4px;">降水確率 {pop}%</div>
+                    <div style="font-size:13px; color:#888; margin-top:2px;">{diff_text}</div>
                 </div>
             </div>
         </div>
@@ -530,6 +530,56 @@ def render_dashboard():
         unsafe_allow_html=True,
     )
 
+
+def render_dashboard():
+    cols = st.columns([6, 1])
+    with cols[1]:
+        # 右上に小さな「設定」ボタン
+        if st.button("⚙️ 設定", key="header_settings"):
+            st.session_state.page = "onboarding"
+            st.session_state.step = 1  # 生年月日からやり直し（好みで変更OK）
+            st.rerun()
+
+    render_header()
+    NEWS_API_KEY = os.getenv("NEWS_API_KEY")
+    today = datetime.today()
+    
+    st.markdown(
+        f"**{today.strftime('%m月%d日（%a）')}**",
+    )
+
+    st.markdown('<div style="margin-top:12px;"></div>', unsafe_allow_html=True)
+
+    # 開発中は .env に OTASUKE_PROVIDER_MODE=replay を書くと、記録済みのレスポンス
+    # （fixtures/ と test_news.txt）だけで動く（API100回制限ありのため）
+    # 記録するときは OTASUKE_PROVIDER_MODE=record
+    if fixtures.is_replay():
+        st.info("📝 開発モード：記録済みのレスポンスを使っています（API未使用）")
+
+    # 設定の保存の結果（保存は裏で行うので、受け付けたかどうかと失敗だけを知らせる）
+    notice = st.session_state.pop("settings_notice", None)
+    if notice:
+        st.info(notice)
+    auth_user_id = st.session_state.get("auth_user_id") or st.session_state.settings.get("auth_user_id")
+    if auth_user_id and settings_store.status(auth_user_id) == "failed":
+        st.warning("設定をまだ保存できていません。しばらくしてから自動で保存し直します。")
+
+    # 天気（自宅と勤務先をまとめて取得する。同じ県なら1回だけ）
+    home_pref = st.session_state.settings.get("home_pref") or "東京"
+    work_pref = st.session_state.settings.get("work_pref")
+    # st.write("DEBUG - home_pref:", home_pref)
+    # tsukumijima / OpenWeather のうち調子の良い方から取得する（遅いときはもう一方にも問い合わせる）
+    forecasts = weather_providers.get_daily_forecasts([home_pref, work_pref])
+    render_weather_card("☀️ 今日の天気", home_pref, forecasts[home_pref])
+    if work_pref and (prefectures.lookup(work_pref) or work_pref) != (prefectures.lookup(home_pref) or home_pref):
+        render_weather_card("🏢 勤務先の天気", work_pref, forecasts[work_pref])
+
+    history = forecast_history.daily_history(home_pref)
+    if len(history) >= 2:
+        with st.expander("📈 最近の気温"):
+            trend = pd.DataFrame(history).set_index("date")[["temp_max", "temp_min"]]
+            st.line_chart(trend.rename(columns={"temp_max": "最高気温", "temp_min": "最低気温"}))
+
     # 星占い （記載は一例、APIで取得できる情報を記載する）
     birth_month = st.session_state.settings["birth_month"]
     birth_day = st.session_state.settings["birth_day"]
@@ -563,35 +613,8 @@ def render_dashboard():
     st.markdown("#### 🔸 あなたへのおすすめニュース")
 
     select_categories = st.session_state.settings.get("categories", [])
-    articles = news_get(NEWS_API_KEY, select_categories)
-
-    # ニュースカード（ダミーを2件ほど）
-    
-    for i in range(len(articles)):
-        delta = diff_hour(articles[i]["publishedAt"])
-        
-        st.markdown(
-            f"""
-            <div class="news-card">
-                {f'<img src="{articles[i]["urlToImage"]}" alt="ニュース画像">' if articles[i]["urlToImage"] else ''}
-                <div style="font-size:16px; font-weight:700; color:#333; margin-bottom:8px; line-height:1.4;">
-                    {articles[i]["title"]}
-                </div>
-                <div style="font-size:14px; color:#555; line-height:1.6; margin-bottom:10px;">
-                    {articles[i]["description"]}
-                </div>
-                <div style="font-size:11px; color:#999;">
-                    🕐 {delta}時間前
-                </div>
-            </div>
-            """,
-            unsafe_allow_html=True,
-        )
-        st.link_button(
-            label="📰 記事を読む",
-            url=articles[i]["url"],
-            help="クリックすると記事の詳細ページに移動します"
-        )
+    feed = load_news_feed(NEWS_API_KEY, select_categories)
+    render_news_feed(feed)
 
     # supabase.table("users").insert({
     #             "auth_user_id":st.session_state.settings["auth_user_id"],
@@ -604,14 +627,9 @@ def render_dashboard():
     #             # その他、初期プロフィール情報など
     #         }).execute()
     
-        supabase.table('users').update({
-                    "birth_year": st.session_state.settings["birth_year"], 
-                    "birth_month": st.session_state.settings["birth_month"],
-                    "birth_day":st.session_state.settings["birth_day"],
-                    "home_pref":st.session_state.settings["home_pref"],
-                    "categories":st.session_state.settings["categories"]}).eq(
-        'email', st.session_state.settings["email"]
-    ).execute()
+    # 設定が変わっていれば保存する（変わっていなければ DB には書かない）
+    if auth_user_id:
+        settings_store.persist(st.session_state, auth_user_id)
     # ======================================
     # 設定に戻るボタン
     # ======================================
@@ -664,11 +682,11 @@ def onboarding_screen():
                 # Supabase に保存
                 try:
                     res = save_settings_to_supabase()
-                    if res is not None:
-                        st.success("設定を保存しました！")
-                    # 保存に成功しても失敗しても、とりあえずダッシュボードへ
-                        st.session_state.page = "dashboard"
-                        st.rerun()
+                    # 書き込みは裏で行うので、ここでは受け付けたかどうかだけを伝える（ダッシュボードに表示）
+                    if res is True:
+                        st.session_state.settings_notice = "設定の保存を受け付けました。数秒で反映されます。"
+                    elif res is False:
+                        st.session_state.settings_notice = "設定に変更はありませんでした。"
                 except Exception as e:
                     st.error(f"設定の保存中にエラーが発生しました: {e}")
                     
@@ -720,6 +738,7 @@ def sign_in(email, password):
         return None
     
 def sign_out():
+    settings_store.invalidate(st.session_state)
     try:
         supabase.auth.sign_out()
     except Exception as e:
@@ -775,7 +794,7 @@ def auth_screen():
         user = sign_in(email,password)
         if user and user.user:
             st.session_state.user_email = user.user.email
-            load_settings_from_supabase()
+            load_settings_from_supabase(user.user.user_metadata)
             st.success("ログインに成功しました！")
             #Dashboardへ遷移
             st.session_state.page = "dashboard"
@@ -0,0 +1,161 @@
+# nationwide.py
+# 47都道府県の天気をまとめて取得するモジュール（全国の天気ページ用）
+#
+# 1県ずつ ジオコーディング → 現在の天気 → 予報 と呼ぶと 47 × 3 = 141 回になるので、
+# 安い順に次の方法で埋めていく
+#   1. tsukumijima のスナップショット（weather.py のバックグラウンド更新。API は呼ばない）
+#   2. OpenWeather の box/city（日本全体の範囲を1回で取得し、県庁所在地に近い都市を当てる）
+#      box/city は非推奨の API で、返るのは「現在の」天気だけ（temp_max / temp_min もその時点の観測の幅で、
+#      1日の予報の最高・最低ではない）。なので現在の気温として扱い、最高・最低には入れない
+#   3. 残りの県だけ tsukumijima に同時数を絞って問い合わせる（座標は prefectures.py の一覧）
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import quota
+import fixtures
+import payloads
+import weather
+import weather_api
+from prefectures import PREFECTURES
+
+# 日本全体を囲む範囲（西経度, 南緯度, 東経度, 北緯度, ズーム）
+JAPAN_BBOX = "122,24,146,46,10"
+
+# box/city の都市を県庁所在地に当てはめる最大距離（km）
+MAX_MATCH_KM = 30
+
+# 1県ずつ問い合わせるときの同時数
+FANOUT_WORKERS = 6
+
+# box/city が使えなかった（プランで無効など）ときに再挑戦しない時間（秒）
+BOX_RETRY_AFTER = 6 * 60 * 60
+
+_box_disabled_until = 0.0
+_box_lock = threading.Lock()
+
+
+@quota.governed("openweather", "box/city")
+def fetch_box(bbox: str, api_key: str) -> dict:
+    """範囲内の都市の現在の天気をまとめて取得（OpenWeather box/city）"""
+    url = "https://api.openweathermap.org/data/2.5/box/city"
+    params = {"bbox": bbox, "units": "metric", "lang": "ja", "appid": api_key}
+    return fixtures.fetch_json("openweather", url, params=params, schema=payloads.OPENWEATHER_BOX)
+
+
+def _temp(value) -> float | None:
+    return None if value in ("", None) else float(value)
+
+
+def _entry(pref, description, temp_max, temp_min, source, temp=None, observed=False) -> dict:
+    """observed: 予報ではなく現在の観測値（temp に現在の気温が入り、最高・最低は None）"""
+    return {
+        "pref": pref.name,
+        "short_name": pref.short_name,
+        "lat": pref.lat,
+        "lon": pref.lon,
+        "description": description or "不明",
+        "temp": _temp(temp),
+        "temp_max": _temp(temp_max),
+        "temp_min": _temp(temp_min),
+        "source": source,
+        "observed": observed,
+    }
+
+
+def _from_snapshots(prefs) -> dict:
+    entries = {}
+    for pref in prefs:
+        hit = weather.cached_weather(pref.name)
+        if hit:
+            telop, max_temp, min_temp = hit
+            entries[pref.name] = _entry(pref, telop, max_temp, min_temp, "tsukumijima")
+    return entries
+
+
+def _match_cities(prefs, cities: list[dict]) -> dict:
+    """box/city の都市を、いちばん近い県庁所在地の県に当てはめる（MAX_MATCH_KM 以内のみ）"""
+    cities = [c for c in cities if c.get("coord")]
+    if not prefs or not cities:
+        return {}
+    lat = np.radians([c["coord"].get("Lat", c["coord"].get("lat")) for c in cities])
+    lon = np.radians([c["coord"].get("Lon", c["coord"].get("lon")) for c in cities])
+    pref_lat = np.radians([p.lat for p in prefs])[:, None]
+    pref_lon = np.radians([p.lon for p in prefs])[:, None]
+
+    # 県 × 都市 の距離（ハーバーサイン）を一度に計算する
+    a = np.sin((lat - pref_lat) / 2) ** 2 + np.cos(pref_lat) * np.cos(lat) * np.sin((lon - pref_lon) / 2) ** 2
+    km = 6371 * 2 * np.arcsin(np.sqrt(a))
+    nearest = km.argmin(axis=1)
+
+    entries = {}
+    for i, pref in enumerate(prefs):
+        if km[i, nearest[i]] > MAX_MATCH_KM:
+            continue
+        city = cities[nearest[i]]
+        main = city.get("main") or {}
+        description = ((city.get("weather") or [{}])[0]).get("description")
+        # 観測の temp_max / temp_min は予報の最高・最低とは別物なので使わない
+        entries[pref.name] = _entry(pref, description, None, None, "openweather", temp=main.get("temp"),
+                                    observed=True)
+    return entries
+
+
+def _from_box(prefs, api_key) -> tuple[dict, int]:
+    """box/city を1回呼んで埋められる県を返す（(結果, API呼び出し回数)）"""
+    global _box_disabled_until
+    with _box_lock:
+        if not api_key or time.monotonic() < _box_disabled_until:
+            return {}, 0
+    try:
+        data = fetch_box(JAPAN_BBOX, api_key)
+    except Exception as e:
+        # 無料プランでは使えないことがあるので、しばらくは 1県ずつの取得に任せる
+        print(f"box/city の取得エラー: {e}")
+        with _box_lock:
+            _box_disabled_until = time.monotonic() + BOX_RETRY_AFTER
+        return {}, 1
+    return _match_cities(prefs, data.get("list") or []), 1
+
+
+def _from_fanout(prefs) -> tuple[dict, int]:
+    """残りの県を tsukumijima に1県ずつ問い合わせる（同時数は FANOUT_WORKERS まで）"""
+    def fetch(pref):
+        try:
+            telop, max_temp, min_temp = weather.weather_api(pref.name)  # スナップショットにも残る
+            return _entry(pref, telop, max_temp, min_temp, "tsukumijima")
+        except Exception as e:
+            print(f"天気の取得エラー（{pref.name}）: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=FANOUT_WORKERS) as executor:
+        results = list(executor.map(fetch, prefs))
+    return {e["pref"]: e for e in results if e}, len(prefs)
+
+
+def fetch_nationwide(api_key: str | None = None) -> dict:
+    """47都道府県の今日の天気をまとめて返す
+
+    戻り値: {"entries": 北から順の県ごとの天気, "calls": 外部APIの呼び出し回数, "missing": 取れなかった県}
+    """
+    api_key = api_key or weather_api.get_api_key()
+    entries = _from_snapshots(PREFECTURES)
+    calls = 0
+
+    missing = [p for p in PREFECTURES if p.name not in entries]
+    if missing:
+        found, n = _from_box(missing, api_key)
+        entries.update(found)
+        calls += n
+
+    missing = [p for p in PREFECTURES if p.name not in entries]
+    if missing:
+        found, n = _from_fanout(missing)
+        entries.update(found)
+        calls += n
+
+    return {
+        "entries": [entries[p.name] for p in PREFECTURES if p.name in entries],
+        "calls": calls,
+        "missing": [p.name for p in PREFECTURES if p.name not in entries],
+    }
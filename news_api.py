@@ -1,53 +1,237 @@
 import requests
 import json
 import os
+import time
+import threading
+import news_store
+import quota
+import fixtures
+import dedupe
+import ranking
 from dotenv import load_dotenv
-from datetime import datetime, timedelta
+from datetime import datetime, timezone, timedelta
 
-def news_get(api_key, categories):
-    # API_KEY = "YOUR_API_KEY"  # 取得したAPIキーを設定
-    BASE_URL = "https://newsapi.org/v2/everything"  # NewsAPIのエンドポイント
+BASE_URL = "https://newsapi.org/v2/everything"  # NewsAPIのエンドポイント
 
-    now = datetime.now()
-    two_days_ago = now - timedelta(days=3)
-    from_time = two_days_ago.strftime("%Y-%m-%dT%H:%M:%S")
-    to_time = now.strftime("%Y-%m-%dT%H:%M:%S")
+# 信頼できるニュースサイトのみに絞る
+TRUSTED_DOMAINS = [
+    "nhk.or.jp", "asahi.com", "yomiuri.co.jp", "nikkei.com",
+    "sankei.com", "mainichi.jp", "jiji.com", "kyodo.co.jp",
+    "nikkan.co.jp", "toyokeizai.net", "diamond.jp", "itmedia.co.jp",
+    "huffingtonpost.jp"
+]
 
-    key_word = ""
-    for id, category in enumerate(categories):
-        if id == len(categories) - 1:
-            key_word = key_word + category
-        else:
-            key_word = key_word + category + " OR "
-   
-    trusted_domains = [
-        "nhk.or.jp", "asahi.com", "yomiuri.co.jp", "nikkei.com", 
-        "sankei.com", "mainichi.jp", "jiji.com", "kyodo.co.jp", 
-        "nikkan.co.jp", "toyokeizai.net", "diamond.jp", "itmedia.co.jp", 
-        "huffingtonpost.jp"
-    ]
-    # ドメインリストをカンマ区切りの文字列に変換
-    domains_string = ",".join(trusted_domains)
+# 1ジャンル・1回あたりの取得件数（1回で多めに取り、表示はローカルで切り出す）
+CATEGORY_PAGE_SIZE = 50
+
+# 1回の取り込みで NewsAPI を呼んでよい最大回数（新着が多いときに遡って読む分も含む）
+MAX_CALLS_PER_INGEST = 4
+
+# マージ元としてジャンルごとに記事ストアから読む件数
+STORE_READ_LIMIT = 100
+
+# 選べるニュースジャンル（取り込みはこの単位で行う）
+CATEGORY_LIST = [
+    "テクノロジー", "ビジネス", "スポーツ", "政治", "国際",
+    "エンタメ", "健康", "ライフスタイル", "経済", "科学",
+    "環境", "教育",
+]
+
+
+def ingest_interval() -> timedelta:
+    """同じジャンルを取り込み直すまでの最短間隔（それまではローカルの記事だけを使う）
+
+    全ジャンルを1日中取り込み続けても NewsAPI の1日の上限に収まるように、上限から決める
+    （1日100回・12ジャンルなら約3時間）
+    """
+    return timedelta(seconds=86400 * len(CATEGORY_LIST) / quota.daily_limit("newsapi"))
+
+
+# バックグラウンドで取り込みの時刻が来たか確かめる間隔（秒）
+INGEST_CHECK_INTERVAL = 60
+
+# 取り込みに失敗したジャンルを取り直すまでの間隔（秒）
+INGEST_RETRY_DELAY = 5 * 60
+
+_ingester_started = False
+_ingester_lock = threading.Lock()
+
+
+@quota.governed("newsapi", "everything", lkg=False)  # 古い記事は記事ストアに残っている
+def fetch_category_news(api_key: str, category: str, from_time: str, to_time: str | None = None) -> list[dict]:
+    """1つのジャンルについて from_time〜to_time（UTC、両端を含む）のニュースを新しい順に取得する"""
     # パラメータ設定
     params = {
-        "q": key_word,
+        "q": category,
         "language": "jp",  #言語
-        "from": from_time,       # 開始日時
-        "to": to_time,         # 終了日時
-        "sortBy": "relevancy",               # ソート順
-        "pageSize": 10,                       # 取得件数
+        "from": from_time,       # 開始日時（前回取り込んだ記事の続きから）
+        "sortBy": "publishedAt",             # 差分取得なので新しい順
+        "pageSize": CATEGORY_PAGE_SIZE,       # 取得件数
         "apiKey": api_key,
-        "domains": domains_string
-                }
+        "domains": ",".join(TRUSTED_DOMAINS)  # ドメインリストをカンマ区切りの文字列に変換
+    }
+    if to_time:
+        params["to"] = to_time  # 遡って読むときの終了日時
 
     # APIリクエスト
-    response = requests.get(BASE_URL, params=params)
-
-    # レスポンスを出力
-    if response.status_code == 200:
-        articles = response.json().get("articles", [])
-        return articles
-        # for i, article in enumerate(articles):
-        #     print(f"{i + 1}. {article['title']} - {article['source']['name']}")
-    else:
-        "Error"
\ No newline at end of file
+    return fixtures.fetch_json("newsapi", BASE_URL, params=params).get("articles", [])
+
+
+def _shift(time_text: str, seconds: int) -> str:
+    t = datetime.strptime(time_text, news_store.TIME_FORMAT) + timedelta(seconds=seconds)
+    return t.strftime(news_store.TIME_FORMAT)
+
+
+def fetch_window(api_key: str, category: str, from_time: str, to_time: str | None,
+                 max_calls: int) -> tuple[list[dict], str | None, int]:
+    """from_time〜to_time の記事を、新しい方から from_time に届くまで遡って取得する
+
+    1回で CATEGORY_PAGE_SIZE 件ちょうど返ってきたら、まだ古い記事が残っているので、
+    いちばん古い記事の時刻を to にしてもう一度呼ぶ（page ではなく to で遡るので件数の上限に掛からない）
+
+    戻り値: (記事, 取り切れなかった範囲の終わり（取り切れたら None）, API の呼び出し回数)
+    """
+    articles = []
+    calls = 0
+    while calls < max_calls:
+        batch = fetch_category_news(api_key, category, from_time, to_time)
+        calls += 1
+        articles.extend(batch)
+        published = [a["publishedAt"] for a in batch if a.get("publishedAt")]
+        if len(batch) < CATEGORY_PAGE_SIZE or not published:
+            return articles, None, calls
+        oldest = min(published)
+        if oldest <= from_time:
+            return articles, None, calls
+        # 同じ時刻の記事だけで1ページが埋まったときは、1秒前に進めて止まらないようにする
+        to_time = oldest if to_time is None or oldest < to_time else _shift(oldest, -1)
+        if to_time < from_time:
+            return articles, None, calls
+    return articles, to_time, calls
+
+
+def ingest_category(api_key: str, category: str) -> int:
+    """1つのジャンルの新着記事だけを取得してローカルの記事ストアに保存する
+
+    ジャンル単位で取り込むので、API呼び出し回数は「ジャンル数」で頭打ちになる
+    （ユーザーのジャンルの組み合わせの数には比例しない）
+
+    新着が多くて MAX_CALLS_PER_INGEST 回で読み切れなかった範囲は「取り残し」として覚えておき、
+    次の取り込みで続きから読む（最新の記事の時刻だけを進めて、間の記事を飛ばすことはしない）
+    """
+    state = news_store.get_ingest_state(category)
+    now = news_store.utc_now()
+    if state["last_ingested_at"]:
+        ingested = datetime.strptime(state["last_ingested_at"], news_store.TIME_FORMAT).replace(tzinfo=timezone.utc)
+        if now - ingested < ingest_interval():
+            return 0  # 最近取り込んだばかり
+
+    # 前回保存した最新記事の直後から、ただし保持期間より前には遡らない
+    start = news_store.window_start(now)
+    from_time = start
+    if state["last_published_at"]:
+        from_time = max(from_time, _shift(state["last_published_at"], 1))
+
+    articles, left_to, calls = fetch_window(api_key, category, from_time, None, MAX_CALLS_PER_INGEST)
+
+    gap_from, gap_to = state["gap_from"], state["gap_to"]
+    if left_to:
+        # 新しく取り残した範囲を、前からの取り残しとつなげて覚える
+        gap_from, gap_to = min(gap_from or from_time, from_time), left_to
+    elif gap_to and calls < MAX_CALLS_PER_INGEST:
+        # 前回の取り残しを続きから読む
+        gap_from = max(gap_from, start)
+        if gap_from <= gap_to:
+            more, gap_to, _ = fetch_window(api_key, category, gap_from, gap_to, MAX_CALLS_PER_INGEST - calls)
+            articles += more
+        else:
+            gap_to = None
+    if gap_to is None or gap_to < start:
+        gap_from = gap_to = None
+
+    # 遡って読むときは境目の記事が2回返ってくるので、URL で1件にする
+    articles = list({a.get("url"): a for a in articles}.values())
+    saved = news_store.save_articles(category, articles)
+    latest = max([a["publishedAt"] for a in articles if a.get("publishedAt")] + [state["last_published_at"] or ""])
+    news_store.update_ingest_state(category, latest or None, gap_from, gap_to)
+    news_store.purge_old_articles(now)
+    return saved
+
+
+def merge_category_news(results: dict[str, list[dict]], limit: int = 10) -> list[dict]:
+    """ジャンルごとの記事リストを1つにまとめ、ユーザーに合わせて並べ替える
+
+    保存済みの記事の索引（BM25）でユーザーのジャンルとの関連度を出し、
+    選んだジャンルにいくつ含まれるかと新しさを加えたスコアで並べる。
+    ほぼ同じ内容の記事は、表示件数に数える前に1件にまとめる。
+    """
+    memberships = {}
+    merged = {}
+    for category, articles in results.items():
+        for article in articles:
+            url = article.get("url")
+            if not url:
+                continue
+            memberships[url] = memberships.get(url, 0) + 1
+            merged.setdefault(url, article)
+
+    articles = list(merged.values())
+    categories = list(results.keys())
+    stats = news_store.load_term_stats(list(merged.keys()), list(ranking.query_terms(categories)))
+    scores = ranking.score_articles(
+        articles, [memberships[a["url"]] for a in articles], categories, stats, now=news_store.utc_now()
+    )
+
+    ranked = [articles[i] for i in scores.argsort()[::-1]]
+    return dedupe.collapse(ranked)[:limit]
+
+
+def ingest_all(api_key: str, categories=None) -> list[str]:
+    """ジャンルごとに、取り込みの時刻が来ていれば取り込む。取り込めなかったジャンルを返す"""
+    failed = []
+    for category in CATEGORY_LIST if categories is None else categories:
+        try:
+            ingest_category(api_key, category)
+        except requests.RequestException as e:
+            # 1ジャンルの失敗でほかのジャンルを止めない（保存済みの記事で表示する）
+            print(f"ニュース取得エラー（{category}）: {e}")
+            failed.append(category)
+    return failed
+
+
+def _ingest_loop(api_key: str):
+    retry_at = {}  # ジャンル -> 次に取り直してよい時刻
+    while True:
+        now = time.monotonic()
+        due = [category for category in CATEGORY_LIST if retry_at.get(category, 0) <= now]
+        for category in ingest_all(api_key, due):
+            retry_at[category] = now + INGEST_RETRY_DELAY
+        time.sleep(INGEST_CHECK_INTERVAL)
+
+
+def start_ingester(api_key: str):
+    """全ジャンルの取り込みをバックグラウンドで始める（プロセスごとに1回だけ）"""
+    global _ingester_started
+    with _ingester_lock:
+        if _ingester_started:
+            return
+        _ingester_started = True
+    threading.Thread(target=_ingest_loop, args=(api_key,), name="news-ingester", daemon=True).start()
+
+
+def news_get(api_key, categories, limit=10):
+    """ユーザーの選択ジャンルのニュースを、ローカルの記事ストアから返す（API の応答を待たない）
+
+    取り込みは start_ingester のバックグラウンド処理で行う
+    記録の再生中はネットワークを使わずすぐに終わるので、その場で取り込む
+    """
+    # 順番や重複が違っても同じジャンルの組み合わせとして扱う
+    unique_categories = sorted(set(categories or []))
+
+    if fixtures.is_replay():
+        ingest_all(api_key, unique_categories)
+    elif api_key:
+        start_ingester(api_key)
+
+    results = news_store.load_articles(unique_categories, limit_per_category=STORE_READ_LIMIT)
+    return merge_category_news(results, limit=limit)
@@ -0,0 +1,336 @@
+# news_store.py
+# 取得したニュース記事をローカルの SQLite に保存しておくためのモジュール
+import os
+import json
+import sqlite3
+import fixtures
+import dedupe
+import ranking
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+# DBファイルの場所（.env で変更可能）
+DB_PATH = os.getenv("NEWS_DB_PATH", os.path.join(".cache", "news.sqlite3"))
+
+# 記録の再生中に使う DB（メモリ上。実際の DB の記事が混ざらず、結果が毎回同じになる）
+REPLAY_DB_URI = "file:news_replay?mode=memory&cache=shared"
+
+# 何日前までの記事を保持するか（NewsAPI に問い合わせていた期間と同じ）
+RETENTION_DAYS = 3
+
+# NewsAPI の publishedAt の形式（UTC）
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+_init_lock = threading.Lock()
+_initialized = set()  # テーブルを作成済みの接続先
+_replay_keeper = None  # メモリ上の DB は接続がすべて閉じると消えるので、1つ開いたままにしておく
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    url          TEXT PRIMARY KEY,
+    title        TEXT,
+    description  TEXT,
+    url_to_image TEXT,
+    source       TEXT,
+    author       TEXT,
+    content      TEXT,
+    published_at TEXT NOT NULL,
+    fetched_at   TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_articles_published_at ON articles (published_at);
+CREATE INDEX IF NOT EXISTS idx_articles_source ON articles (source);
+
+CREATE TABLE IF NOT EXISTS article_categories (
+    url      TEXT NOT NULL REFERENCES articles (url) ON DELETE CASCADE,
+    category TEXT NOT NULL,
+    PRIMARY KEY (url, category)
+);
+CREATE INDEX IF NOT EXISTS idx_article_categories_category ON article_categories (category);
+
+-- 並べ替え用の転置索引（記事ごとの単語の出現回数）
+CREATE TABLE IF NOT EXISTS terms (
+    url  TEXT NOT NULL REFERENCES articles (url) ON DELETE CASCADE,
+    term TEXT NOT NULL,
+    tf   INTEGER NOT NULL,
+    PRIMARY KEY (term, url)
+);
+CREATE INDEX IF NOT EXISTS idx_terms_url ON terms (url);
+
+-- gap_from〜gap_to: 新着が多くて読み切れなかった範囲（次の取り込みで続きから読む）
+CREATE TABLE IF NOT EXISTS ingest_state (
+    category          TEXT PRIMARY KEY,
+    last_published_at TEXT,
+    last_ingested_at  TEXT NOT NULL,
+    gap_from          TEXT,
+    gap_to            TEXT
+);
+"""
+
+# ほぼ同じ記事を探すための署名の索引（古いDBにもあとから追加する）
+SIGNATURE_COLUMNS = ["simhash"] + [f"band{i}" for i in range(dedupe.BANDS)]
+
+
+def _migrate(conn: sqlite3.Connection) -> None:
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(articles)")}
+    for column in SIGNATURE_COLUMNS:
+        if column not in existing:
+            conn.execute(f"ALTER TABLE articles ADD COLUMN {column} INTEGER")
+    if "doc_len" not in existing:
+        conn.execute("ALTER TABLE articles ADD COLUMN doc_len INTEGER")
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(ingest_state)")}
+    for column in ("gap_from", "gap_to"):
+        if column not in existing:
+            conn.execute(f"ALTER TABLE ingest_state ADD COLUMN {column} TEXT")
+    for i in range(dedupe.BANDS):
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_articles_band{i} ON articles (band{i})")
+
+    # 署名のない記事（追加前に保存されたもの）を埋める
+    rows = conn.execute("SELECT url, title, description FROM articles WHERE simhash IS NULL").fetchall()
+    conn.executemany(
+        f"UPDATE articles SET {', '.join(c + ' = ?' for c in SIGNATURE_COLUMNS)} WHERE url = ?",
+        [_signature_values(dict(row)) + [row["url"]] for row in rows],
+    )
+    # 転置索引のない記事も同様に埋める
+    rows = conn.execute("SELECT url, title, description FROM articles WHERE doc_len IS NULL").fetchall()
+    for row in rows:
+        _index_terms(conn, dict(row))
+    conn.commit()
+
+
+def _signature_values(article: dict) -> list[int]:
+    sig = dedupe.article_signature(article)
+    return [dedupe.to_signed(sig)] + dedupe.bands(sig)
+
+
+def _index_terms(conn: sqlite3.Connection, article: dict) -> None:
+    """記事を転置索引に追加する（取り込み時に少しずつ作る）"""
+    tf = ranking.article_terms(article)
+    conn.execute("DELETE FROM terms WHERE url = ?", (article["url"],))
+    conn.executemany(
+        "INSERT INTO terms (url, term, tf) VALUES (?, ?, ?)",
+        [(article["url"], term, count) for term, count in tf.items()],
+    )
+    conn.execute("UPDATE articles SET doc_len = ? WHERE url = ?", (sum(tf.values()), article["url"]))
+
+
+def _connect() -> sqlite3.Connection:
+    """DBに接続する（初回のみテーブルを作成）。記録の再生中はメモリ上の DB に接続する"""
+    global _replay_keeper
+    replay = fixtures.is_replay()
+    target = REPLAY_DB_URI if replay else DB_PATH
+    if target not in _initialized and not replay:
+        os.makedirs(os.path.dirname(DB_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(target, timeout=10, uri=replay)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    if target not in _initialized:
+        with _init_lock:
+            if target not in _initialized:
+                if replay:
+                    _replay_keeper = sqlite3.connect(target, uri=True, check_same_thread=False)
+                else:
+                    conn.execute("PRAGMA journal_mode = WAL")  # 読み込みと書き込みを同時に行えるようにする
+                conn.executescript(SCHEMA)
+                _migrate(conn)
+                _initialized.add(target)
+    return conn
+
+
+@contextmanager
+def _db():
+    """トランザクション単位で接続を開き、終わったら閉じる"""
+    conn = _connect()
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def utc_now() -> datetime:
+    return fixtures.now()  # replay モードでは記録時刻で固定される
+
+
+def window_start(now: datetime | None = None) -> str:
+    """保持期間の開始時刻（これより古い記事は削除対象）"""
+    now = now or utc_now()
+    return (now - timedelta(days=RETENTION_DAYS)).strftime(TIME_FORMAT)
+
+
+def get_ingest_state(category: str) -> dict:
+    """取り込み状態を返す
+
+    last_published_at: 最後に保存した記事の publishedAt
+    last_ingested_at : 最後に取り込んだ時刻
+    gap_from, gap_to : まだ読み切れていない範囲（なければ None）
+    """
+    with _db() as conn:
+        row = conn.execute(
+            "SELECT last_published_at, last_ingested_at, gap_from, gap_to FROM ingest_state WHERE category = ?",
+            (category,),
+        ).fetchone()
+    if row is None:
+        return {"last_published_at": None, "last_ingested_at": None, "gap_from": None, "gap_to": None}
+    return dict(row)
+
+
+def update_ingest_state(category: str, last_published_at: str | None,
+                        gap_from: str | None = None, gap_to: str | None = None) -> None:
+    """取り込み状態を更新する（最新の publishedAt は既存の値と比べて大きい方を残す）"""
+    with _db() as conn:
+        conn.execute(
+            """
+            INSERT INTO ingest_state (category, last_published_at, last_ingested_at, gap_from, gap_to)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (category) DO UPDATE SET
+                last_published_at = NULLIF(MAX(COALESCE(ingest_state.last_published_at, ''),
+                                               COALESCE(excluded.last_published_at, '')), ''),
+                last_ingested_at = excluded.last_ingested_at,
+                gap_from = excluded.gap_from,
+                gap_to = excluded.gap_to
+            """,
+            (category, last_published_at, utc_now().strftime(TIME_FORMAT), gap_from, gap_to),
+        )
+
+
+def find_near_duplicate(conn: sqlite3.Connection, article: dict) -> str | None:
+    """保存済みの記事のうち、ほぼ同じ内容の記事の URL を返す（なければ None）"""
+    sig = dedupe.article_signature(article)
+    band_values = dedupe.bands(sig)
+    where = " OR ".join(f"band{i} = ?" for i in range(dedupe.BANDS))
+    rows = conn.execute(
+        f"SELECT url, simhash FROM articles WHERE ({where}) AND url != ?",
+        band_values + [article["url"]],
+    ).fetchall()
+    for row in rows:
+        if dedupe.is_near_duplicate(sig, dedupe.to_unsigned(row["simhash"])):
+            return row["url"]
+    return None
+
+
+def save_articles(category: str, articles: list[dict]) -> int:
+    """記事を URL をキーにして保存する。保存件数を返す
+
+    ほぼ同じ内容の記事がすでにあるときは保存せず、既存の記事にジャンルだけを追加する
+    """
+    fetched_at = utc_now().strftime(TIME_FORMAT)
+    articles = [a for a in articles if a.get("url") and a.get("publishedAt")]
+    saved = 0
+
+    with _db() as conn:
+        for a in articles:
+            duplicate_of = find_near_duplicate(conn, a)
+            if duplicate_of:
+                conn.execute(
+                    "INSERT OR IGNORE INTO article_categories (url, category) VALUES (?, ?)",
+                    (duplicate_of, category),
+                )
+                continue
+
+            conn.execute(
+                f"""
+                INSERT INTO articles (url, title, description, url_to_image, source, author,
+                                      content, published_at, fetched_at, {', '.join(SIGNATURE_COLUMNS)})
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, {', '.join('?' for _ in SIGNATURE_COLUMNS)})
+                ON CONFLICT (url) DO UPDATE SET
+                    title = excluded.title,
+                    description = excluded.description,
+                    url_to_image = excluded.url_to_image,
+                    fetched_at = excluded.fetched_at,
+                    {', '.join(f'{c} = excluded.{c}' for c in SIGNATURE_COLUMNS)}
+                """,
+                [
+                    a["url"],
+                    a.get("title"),
+                    a.get("description"),
+                    a.get("urlToImage"),
+                    (a.get("source") or {}).get("name"),
+                    a.get("author"),
+                    a.get("content"),
+                    a["publishedAt"],
+                    fetched_at,
+                ] + _signature_values(a),
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO article_categories (url, category) VALUES (?, ?)",
+                (a["url"], category),
+            )
+            _index_terms(conn, a)
+            saved += 1
+
+    return saved
+
+
+def purge_old_articles(now: datetime | None = None) -> int:
+    """保持期間より古い記事を削除する。削除件数を返す"""
+    with _db() as conn:
+        cur = conn.execute("DELETE FROM articles WHERE published_at < ?", (window_start(now),))
+    return cur.rowcount
+
+
+def load_articles(categories: list[str], limit_per_category: int = 20) -> dict[str, list[dict]]:
+    """ジャンルごとに保存済みの記事を新しい順で返す（NewsAPI と同じ形の dict）"""
+    results = {}
+    since = window_start()
+    with _db() as conn:
+        for category in categories:
+            rows = conn.execute(
+                """
+                SELECT a.* FROM articles a
+                JOIN article_categories c ON c.url = a.url
+                WHERE c.category = ? AND a.published_at >= ?
+                ORDER BY a.published_at DESC
+                LIMIT ?
+                """,
+                (category, since, limit_per_category),
+            ).fetchall()
+            results[category] = [_row_to_article(row) for row in rows]
+    return results
+
+
+def load_term_stats(urls: list[str], terms: list[str]) -> dict:
+    """BM25 の計算に必要な統計を読む（検索語と候補の記事に関係する分だけ）"""
+    urls_json = json.dumps(urls)
+    terms_json = json.dumps(terms, ensure_ascii=False)
+    with _db() as conn:
+        n_docs, avgdl = conn.execute(
+            "SELECT COUNT(*), COALESCE(AVG(doc_len), 0) FROM articles"
+        ).fetchone()
+        df = dict(conn.execute(
+            "SELECT term, COUNT(*) FROM terms WHERE term IN (SELECT value FROM json_each(?)) GROUP BY term",
+            (terms_json,),
+        ).fetchall())
+        postings = conn.execute(
+            """
+            SELECT url, term, tf FROM terms
+            WHERE term IN (SELECT value FROM json_each(?))
+              AND url IN (SELECT value FROM json_each(?))
+            """,
+            (terms_json, urls_json),
+        ).fetchall()
+        doc_len = dict(conn.execute(
+            "SELECT url, doc_len FROM articles WHERE url IN (SELECT value FROM json_each(?))",
+            (urls_json,),
+        ).fetchall())
+    return {
+        "terms": terms,
+        "n_docs": n_docs,
+        "avgdl": avgdl,
+        "df": df,
+        "postings": [tuple(row) for row in postings],
+        "doc_len": doc_len,
+    }
+
+
+def _row_to_article(row: sqlite3.Row) -> dict:
+    return {
+        "source": {"id": None, "name": row["source"]},
+        "author": row["author"],
+        "title": row["title"],
+        "description": row["description"],
+        "url": row["url"],
+        "urlToImage": row["url_to_image"],
+        "publishedAt": row["published_at"],
+        "content": row["content"],
+    }
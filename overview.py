@@ -0,0 +1,84 @@
+import streamlit as st
+import pandas as pd
+import fixtures
+import http_client
+from nationwide import fetch_nationwide
+from weather import start_refresher
+from weather_api import get_weather_icon
+from dotenv import load_dotenv
+
+# .env をロード
+load_dotenv()
+
+st.set_page_config(page_title="全国の天気", page_icon="🗾", layout="wide")
+
+# 外部APIへの接続を先に開き、全国の天気をバックグラウンドで更新しておく
+# （記録の再生中はネットワークを使わない）
+if not fixtures.is_replay():
+    http_client.warm_up_in_background()
+    start_refresher()
+
+# 1行に並べる県の数
+GRID_COLUMNS = 6
+
+
+@st.cache_data(ttl=60 * 10, show_spinner="全国の天気を取得しています…")
+def load_overview() -> dict:
+    return fetch_nationwide()
+
+
+def temp_text(value) -> str:
+    return "--" if value is None else f"{value:.0f}°"
+
+
+def temps_html(entry) -> str:
+    """予報なら最高 / 最低、現在の観測（box/city）なら現在の気温だけを出す"""
+    if entry["observed"]:
+        return f'<span style="color:#555;">現在 {temp_text(entry["temp"])}</span>'
+    return (f'<span style="color:#FF6347;">{temp_text(entry["temp_max"])}</span> / '
+            f'<span style="color:#4682B4;">{temp_text(entry["temp_min"])}</span>')
+
+
+st.title("🗾 全国の天気")
+
+if st.button("🔄 更新"):
+    load_overview.clear()
+
+overview = load_overview()
+entries = overview["entries"]
+st.caption(f"{len(entries)} / 47 都道府県（外部APIの呼び出し: {overview['calls']} 回）")
+if overview["missing"]:
+    st.warning("取得できなかった県: " + "、".join(overview["missing"]))
+
+tab_grid, tab_map = st.tabs(["一覧", "地図"])
+
+with tab_grid:
+    for start in range(0, len(entries), GRID_COLUMNS):
+        cols = st.columns(GRID_COLUMNS)
+        for col, entry in zip(cols, entries[start:start + GRID_COLUMNS]):
+            with col:
+                st.markdown(
+                    f"""
+                    <div style="border:1px solid #eee; border-radius:12px; padding:10px; margin-bottom:10px; text-align:center;">
+                        <div style="font-size:14px; font-weight:600;">{entry["short_name"]}</div>
+                        <div style="font-size:36px; line-height:1.2;">{get_weather_icon(entry["description"])}</div>
+                        <div style="font-size:12px; color:#666;">{entry["description"]}</div>
+                        <div style="font-size:14px;">{temps_html(entry)}</div>
+                    </div>
+                    """,
+                    unsafe_allow_html=True,
+                )
+
+with tab_map:
+    frame = pd.DataFrame(entries)
+    if not frame.empty:
+        st.map(frame, latitude="lat", longitude="lon")
+        frame["kind"] = frame["observed"].map({True: "現在の観測", False: "今日の予報"})
+        st.dataframe(
+            frame[["pref", "description", "temp_max", "temp_min", "temp", "kind", "source"]].rename(columns={
+                "pref": "都道府県", "description": "天気", "temp_max": "最高気温（予報）",
+                "temp_min": "最低気温（予報）", "temp": "現在の気温", "kind": "種類", "source": "取得元",
+            }),
+            hide_index=True,
+            width="stretch",
+        )
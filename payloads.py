@@ -0,0 +1,153 @@
+# payloads.py
+# API レスポンスの JSON を読み込み、画面で使う項目だけを残すモジュール
+#
+# - orjson があれば使う（標準の json より数倍速い）
+# - 各 API の「使う項目」をスキーマとして書いておき、それ以外は読み込んだ直後に捨てる
+#   （キャッシュやスナップショットに残るオブジェクトが小さくなる）
+#   絞り込みの分だけ読み込みは遅くなるので、レスポンスをそのままキャッシュする API にだけ使う
+#   （NewsAPI の記事は記事ストアに必要な列だけを書くので、スキーマは使わない）
+#
+# スキーマの書き方
+#   True          : その値をそのまま残す
+#   {"key": ...}  : 辞書のうち書いたキーだけ残す（"*" はすべてのキー）
+#   [...]         : リストの各要素に中のスキーマを当てはめる
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson がなければ標準の json を使う
+    orjson = None
+
+
+def loads(data: bytes | str):
+    """JSON を読み込む（orjson があれば orjson で）"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def compile_schema(schema):
+    """スキーマを絞り込み用の関数にする（そのまま残す値は None）"""
+    if schema is None or schema is True:
+        return None
+    if isinstance(schema, list):
+        item = compile_schema(schema[0])
+        if item is None:
+            return None
+
+        def project_list(value):
+            if type(value) is not list:
+                return value
+            return [item(v) for v in value]
+        return project_list
+    if isinstance(schema, dict):
+        if "*" in schema:
+            sub = compile_schema(schema["*"])
+
+            def project_all(value):
+                if type(value) is not dict or sub is None:
+                    return value
+                return {k: sub(v) for k, v in value.items()}
+            return project_all
+
+        fields = tuple((k, compile_schema(sub)) for k, sub in schema.items())
+
+        def project_dict(value):
+            if type(value) is not dict:
+                return value
+            result = {}
+            for k, sub in fields:
+                if k in value:
+                    v = value[k]
+                    result[k] = v if sub is None else sub(v)
+            return result
+        return project_dict
+    raise ValueError(f"不明なスキーマです: {schema!r}")
+
+
+_compiled = {}
+
+
+def project(value, schema):
+    """スキーマに書いた項目だけを残したコピーを返す（スキーマが None なら何もしない）"""
+    if schema is None:
+        return value
+    key = id(schema)
+    if key not in _compiled:
+        _compiled[key] = compile_schema(schema)
+    func = _compiled[key]
+    return value if func is None else func(value)
+
+
+def decode(data: bytes | str, schema=None):
+    """JSON を読み込み、スキーマに書いた項目だけを残して返す"""
+    return project(loads(data), schema)
+
+
+# --- 各 API で使う項目 ---
+_WEATHER = [{"description": True, "icon": True}]
+
+OPENWEATHER_CURRENT = {
+    "dt": True,
+    "name": True,
+    "main": {"temp": True, "temp_max": True, "temp_min": True, "humidity": True},
+    "weather": _WEATHER,
+    "wind": {"speed": True},
+}
+
+# OpenWeather の3時間ごとの予報を何件取るか（8件 × 3日。今日・明日・明後日がそろう。最大40件）
+# weather_api の cnt と bench_decode で使う（ここなら streamlit を読み込まずに import できる）
+FORECAST_COUNT = 24
+
+OPENWEATHER_FORECAST = {
+    "list": [{
+        "dt": True,
+        "main": {"temp": True},
+        "pop": True,
+        "wind": {"speed": True},
+        "rain": {"3h": True},
+        "snow": {"3h": True},
+        "weather": _WEATHER,
+    }],
+}
+
+OPENWEATHER_ONECALL = {
+    "current": {"dt": True, "temp": True, "humidity": True, "wind_speed": True, "weather": _WEATHER},
+    "daily": [{
+        "dt": True,
+        "temp": {"max": True, "min": True},
+        "pop": True,
+        "wind_speed": True,
+        "rain": True,
+        "snow": True,
+        "weather": _WEATHER,
+    }],
+}
+
+# box/city（範囲内の都市の現在の天気）。座標のキーは "Lat" / "Lon" と大文字で返ってくる
+OPENWEATHER_BOX = {
+    "list": [{
+        "name": True,
+        "coord": True,
+        "main": {"temp": True, "temp_max": True, "temp_min": True},
+        "weather": _WEATHER,
+    }],
+}
+
+OPENWEATHER_GEOCODE = [{"lat": True, "lon": True, "name": True}]
+
+TSUKUMIJIMA_FORECAST = {
+    "forecasts": [{
+        "date": True,
+        "telop": True,
+        "temperature": {"max": {"celsius": True}, "min": {"celsius": True}},
+        "chanceOfRain": True,
+    }],
+}
+
+JUGEMKEY_HOROSCOPE = {
+    "horoscope": {"*": [{
+        "sign": True, "rank": True, "content": True, "color": True, "item": True,
+        "job": True, "money": True, "love": True, "total": True,
+    }]},
+}
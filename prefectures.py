@@ -0,0 +1,84 @@
+# prefectures.py
+# 47都道府県の情報をまとめた一覧
+# （都道府県名のローマ字、県庁所在地のローマ字名・緯度・経度、tsukumijima の地域コード）
+#
+# 都道府県名・「県」なしの名前・ローマ字名（都道府県・県庁所在地）・地域コードのどれからでも引ける
+from typing import NamedTuple
+
+
+class Prefecture(NamedTuple):
+    name: str        # 都道府県名（例: 東京都）
+    short_name: str  # 「都・道・府・県」なしの名前（例: 東京）
+    romaji: str      # 都道府県名のローマ字（例: Kanagawa）
+    city: str        # 県庁所在地のローマ字名（OpenWeather のジオコーディング用）
+    lat: float       # 県庁所在地の緯度
+    lon: float       # 県庁所在地の経度
+    area_code: str   # tsukumijima の地域コード
+
+
+PREFECTURES = [
+    Prefecture("北海道", "北海道", "Hokkaido", "Sapporo", 43.0621, 141.3544, "011000"),
+    Prefecture("青森県", "青森", "Aomori", "Aomori", 40.8244, 140.7400, "020010"),
+    Prefecture("岩手県", "岩手", "Iwate", "Morioka", 39.7036, 141.1527, "030010"),
+    Prefecture("宮城県", "宮城", "Miyagi", "Sendai", 38.2682, 140.8694, "040010"),
+    Prefecture("秋田県", "秋田", "Akita", "Akita", 39.7186, 140.1024, "050010"),
+    Prefecture("山形県", "山形", "Yamagata", "Yamagata", 38.2404, 140.3633, "060010"),
+    Prefecture("福島県", "福島", "Fukushima", "Fukushima", 37.7500, 140.4678, "070010"),
+    Prefecture("茨城県", "茨城", "Ibaraki", "Mito", 36.3418, 140.4468, "080010"),
+    Prefecture("栃木県", "栃木", "Tochigi", "Utsunomiya", 36.5551, 139.8828, "090010"),
+    Prefecture("群馬県", "群馬", "Gunma", "Maebashi", 36.3895, 139.0634, "100010"),
+    Prefecture("埼玉県", "埼玉", "Saitama", "Saitama", 35.8617, 139.6455, "110010"),
+    Prefecture("千葉県", "千葉", "Chiba", "Chiba", 35.6074, 140.1065, "120010"),
+    Prefecture("東京都", "東京", "Tokyo", "Tokyo", 35.6895, 139.6917, "130010"),
+    Prefecture("神奈川県", "神奈川", "Kanagawa", "Yokohama", 35.4478, 139.6425, "140010"),
+    Prefecture("新潟県", "新潟", "Niigata", "Niigata", 37.9026, 139.0236, "150010"),
+    Prefecture("富山県", "富山", "Toyama", "Toyama", 36.6953, 137.2113, "160010"),
+    Prefecture("石川県", "石川", "Ishikawa", "Kanazawa", 36.5947, 136.6256, "170010"),
+    Prefecture("福井県", "福井", "Fukui", "Fukui", 36.0652, 136.2216, "180010"),
+    Prefecture("山梨県", "山梨", "Yamanashi", "Kofu", 35.6642, 138.5684, "190010"),
+    Prefecture("長野県", "長野", "Nagano", "Nagano", 36.6513, 138.1810, "200010"),
+    Prefecture("岐阜県", "岐阜", "Gifu", "Gifu", 35.3912, 136.7223, "210010"),
+    Prefecture("静岡県", "静岡", "Shizuoka", "Shizuoka", 34.9769, 138.3831, "220010"),
+    Prefecture("愛知県", "愛知", "Aichi", "Nagoya", 35.1802, 136.9066, "230010"),
+    Prefecture("三重県", "三重", "Mie", "Tsu", 34.7303, 136.5086, "240010"),
+    Prefecture("滋賀県", "滋賀", "Shiga", "Otsu", 35.0045, 135.8686, "250010"),
+    Prefecture("京都府", "京都", "Kyoto", "Kyoto", 35.0116, 135.7681, "260010"),
+    Prefecture("大阪府", "大阪", "Osaka", "Osaka", 34.6937, 135.5023, "270010"),
+    Prefecture("兵庫県", "兵庫", "Hyogo", "Kobe", 34.6901, 135.1955, "280010"),
+    Prefecture("奈良県", "奈良", "Nara", "Nara", 34.6851, 135.8048, "290010"),
+    Prefecture("和歌山県", "和歌山", "Wakayama", "Wakayama", 34.2260, 135.1675, "300010"),
+    Prefecture("鳥取県", "鳥取", "Tottori", "Tottori", 35.5011, 134.2351, "310010"),
+    Prefecture("島根県", "島根", "Shimane", "Matsue", 35.4723, 133.0505, "320010"),
+    Prefecture("岡山県", "岡山", "Okayama", "Okayama", 34.6618, 133.9344, "330010"),
+    Prefecture("広島県", "広島", "Hiroshima", "Hiroshima", 34.3853, 132.4553, "340010"),
+    Prefecture("山口県", "山口", "Yamaguchi", "Yamaguchi", 34.1859, 131.4714, "350010"),
+    Prefecture("徳島県", "徳島", "Tokushima", "Tokushima", 34.0703, 134.5548, "360010"),
+    Prefecture("香川県", "香川", "Kagawa", "Takamatsu", 34.3428, 134.0466, "370010"),
+    Prefecture("愛媛県", "愛媛", "Ehime", "Matsuyama", 33.8392, 132.7657, "380010"),
+    Prefecture("高知県", "高知", "Kochi", "Kochi", 33.5597, 133.5311, "390010"),
+    Prefecture("福岡県", "福岡", "Fukuoka", "Fukuoka", 33.5902, 130.4017, "400010"),
+    Prefecture("佐賀県", "佐賀", "Saga", "Saga", 33.2494, 130.2988, "410010"),
+    Prefecture("長崎県", "長崎", "Nagasaki", "Nagasaki", 32.7503, 129.8779, "420010"),
+    Prefecture("熊本県", "熊本", "Kumamoto", "Kumamoto", 32.8031, 130.7079, "430010"),
+    Prefecture("大分県", "大分", "Oita", "Oita", 33.2382, 131.6126, "440010"),
+    Prefecture("宮崎県", "宮崎", "Miyazaki", "Miyazaki", 31.9111, 131.4239, "450010"),
+    Prefecture("鹿児島県", "鹿児島", "Kagoshima", "Kagoshima", 31.5966, 130.5571, "460010"),
+    Prefecture("沖縄県", "沖縄", "Okinawa", "Naha", 26.2124, 127.6809, "470010"),
+]
+
+# 表示用の都道府県名リスト（北から順）
+PREF_NAMES = [p.name for p in PREFECTURES]
+
+# どの呼び方からでも1回の辞書引きで見つかるようにしておく
+_INDEX = {}
+for _p in PREFECTURES:
+    for _key in (_p.name, _p.short_name, _p.romaji.lower(), _p.city.lower(), _p.area_code):
+        _INDEX[_key] = _p
+
+
+def lookup(key: str) -> Prefecture | None:
+    """都道府県名・「県」なしの名前・ローマ字名（都道府県・県庁所在地）・地域コードから都道府県を探す"""
+    if not key:
+        return None
+    key = key.strip()
+    return _INDEX.get(key) or _INDEX.get(key.lower())
@@ -0,0 +1,252 @@
+# quota.py
+# 外部APIの呼び出し回数を管理するモジュール
+# Streamlit のワーカープロセスをまたいで共有できるように SQLite に記録する
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import functools
+import threading
+import requests
+import fixtures
+from contextlib import contextmanager
+from datetime import datetime, timezone, timedelta
+
+# 台帳ファイルの場所（.env で変更可能）
+DB_PATH = os.getenv("QUOTA_DB_PATH", os.path.join(".cache", "quota.sqlite3"))
+
+JST = timezone(timedelta(hours=9))
+
+# プロバイダーごとの1日あたりの上限回数（.env の QUOTA_<名前>_PER_DAY で上書き可能）
+DAILY_LIMITS = {
+    "newsapi": 100,        # NewsAPI Developer プラン
+    "openweather": 1000,   # OpenWeather 無料プラン
+    "tsukumijima": 5000,   # 明示的な上限はないが、負荷をかけすぎないように
+    "jugemkey": 1000,
+}
+
+# 1日分の上限のうち、一度にまとめて使ってよい割合（バケツの容量）
+BURST_RATIO = 0.25
+
+# 残りトークンがこの割合を切ったら、キャッシュがあるものはキャッシュで返す
+RESERVE_RATIO = 0.2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    provider   TEXT PRIMARY KEY,
+    tokens     REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    day        TEXT NOT NULL,
+    day_calls  INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS usage (
+    day      TEXT NOT NULL,
+    provider TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    user     TEXT NOT NULL,
+    calls    INTEGER NOT NULL,
+    PRIMARY KEY (day, provider, endpoint, user)
+);
+CREATE TABLE IF NOT EXISTS last_known_good (
+    key      TEXT PRIMARY KEY,
+    value    TEXT NOT NULL,
+    saved_at REAL NOT NULL
+);
+"""
+
+_initialized = False
+_attributed = threading.local()  # executor のスレッドで使う、呼び出し元のユーザーID
+
+
+class QuotaExceeded(requests.RequestException):
+    """その日の呼び出し上限に達していて、代わりのキャッシュもないとき"""
+
+
+def daily_limit(provider: str) -> int:
+    env = os.getenv(f"QUOTA_{provider.upper()}_PER_DAY")
+    return int(env) if env else DAILY_LIMITS[provider]
+
+
+def _connect() -> sqlite3.Connection:
+    global _initialized
+    if not _initialized:
+        os.makedirs(os.path.dirname(DB_PATH) or ".", exist_ok=True)
+    # isolation_level=None にして BEGIN IMMEDIATE でプロセス間の排他を取る
+    conn = sqlite3.connect(DB_PATH, timeout=10, isolation_level=None)
+    if not _initialized:
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.executescript(SCHEMA)
+        _initialized = True
+    return conn
+
+
+@contextmanager
+def _transaction():
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+
+
+def _today() -> str:
+    return datetime.now(JST).strftime("%Y-%m-%d")
+
+
+def _current_user() -> str:
+    """ログイン中のユーザーID（Streamlit の外やバックグラウンド処理では anonymous）"""
+    user = getattr(_attributed, "user", None)
+    if user is not None:
+        return user
+    try:
+        import streamlit as st
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        if get_script_run_ctx(suppress_warning=True) is None:
+            return "anonymous"
+        return st.session_state.get("auth_user_id") or "anonymous"
+    except Exception:
+        return "anonymous"
+
+
+def as_current_user(func):
+    """func を、今のスレッドのユーザーの呼び出しとして記録されるように包む
+
+    executor のスレッドには Streamlit のセッションがないので、そのままでは anonymous になる
+    submit する前に呼び出し元のスレッドで包むこと（例: executor.submit(as_current_user(fetch), pref)）
+    """
+    user = _current_user()
+
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        previous = getattr(_attributed, "user", None)
+        _attributed.user = user
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _attributed.user = previous
+    return run
+
+
+def _take_token(provider: str, endpoint: str, use_reserve: bool) -> bool:
+    """トークンを1つ消費できたら True（トークンバケット方式）
+
+    1日の上限を1日かけて少しずつ補充するので、朝のうちに使い切ってしまうことがない
+    """
+    limit = daily_limit(provider)
+    capacity = max(limit * BURST_RATIO, 1)
+    rate = limit / 86400  # 1秒あたりの補充量
+    reserve = 0 if use_reserve else capacity * RESERVE_RATIO
+    now = time.time()
+    today = _today()
+
+    with _transaction() as conn:
+        row = conn.execute(
+            "SELECT tokens, updated_at, day, day_calls FROM buckets WHERE provider = ?",
+            (provider,),
+        ).fetchone()
+        if row is None:
+            tokens, day_calls = capacity, 0
+        else:
+            tokens, updated_at, day, day_calls = row
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            if day != today:
+                day_calls = 0  # 日付が変わったら日次カウントをリセット
+
+        if tokens - 1 < reserve or day_calls >= limit:
+            return False
+
+        conn.execute(
+            """
+            INSERT INTO buckets (provider, tokens, updated_at, day, day_calls)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (provider) DO UPDATE SET
+                tokens = excluded.tokens, updated_at = excluded.updated_at,
+                day = excluded.day, day_calls = excluded.day_calls
+            """,
+            (provider, tokens - 1, now, today, day_calls + 1),
+        )
+        conn.execute(
+            """
+            INSERT INTO usage (day, provider, endpoint, user, calls) VALUES (?, ?, ?, ?, 1)
+            ON CONFLICT (day, provider, endpoint, user) DO UPDATE SET calls = calls + 1
+            """,
+            (today, provider, endpoint, _current_user()),
+        )
+    return True
+
+
+def _lkg_key(endpoint: str, args: tuple, kwargs: dict) -> str:
+    raw = json.dumps([endpoint, args, kwargs], default=str, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def load_last_known_good(key: str):
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT value FROM last_known_good WHERE key = ?", (key,)).fetchone()
+    finally:
+        conn.close()
+    return json.loads(row[0]) if row else None
+
+
+def save_last_known_good(key: str, value) -> None:
+    conn = _connect()
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO last_known_good (key, value, saved_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value, ensure_ascii=False), time.time()),
+        )
+    finally:
+        conn.close()
+
+
+def governed(provider: str, endpoint: str, lkg: bool = True):
+    """外部API呼び出しを回数管理するデコレーター
+
+    - 予算に余裕があれば普通に呼び出し、結果を「最後に成功した値」として保存する
+    - 残りが少なくなったら、保存済みの値があればそれを返す（API は呼ばない）
+    - 上限に達していて保存済みの値もなければ QuotaExceeded
+    lkg=False のときは値を保存しない（ニュースのように別のストアがある場合）
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if fixtures.is_replay():
+                return func(*args, **kwargs)  # 記録の再生は API を呼ばないので数えない
+
+            key = _lkg_key(endpoint, args, kwargs) if lkg else None
+
+            if not _take_token(provider, endpoint, use_reserve=False):
+                cached = load_last_known_good(key) if lkg else None
+                if cached is not None:
+                    return cached
+                # キャッシュがないときだけ予備のトークンを使う
+                if not _take_token(provider, endpoint, use_reserve=True):
+                    raise QuotaExceeded(f"{provider} の本日の呼び出し上限に達しました（{endpoint}）")
+
+            result = func(*args, **kwargs)
+            if lkg:
+                save_last_known_good(key, result)
+            return result
+        return wrapper
+    return decorator
+
+
+def usage_summary(day: str | None = None) -> list[dict]:
+    """その日のプロバイダー・エンドポイント・ユーザーごとの呼び出し回数"""
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            "SELECT provider, endpoint, user, calls FROM usage WHERE day = ? ORDER BY calls DESC",
+            (day or _today(),),
+        ).fetchall()
+    finally:
+        conn.close()
+    return [{"provider": p, "endpoint": e, "user": u, "calls": c} for p, e, u, c in rows]
@@ -0,0 +1,111 @@
+# ranking.py
+# 保存済みの記事をユーザーのジャンルに合わせて並べ替えるモジュール
+# （BM25 による関連度 + ジャンルの一致 + 新しさ をまとめて numpy で計算する）
+import numpy as np
+from datetime import datetime, timezone
+import dedupe
+
+# BM25 のパラメータ（一般的な値）
+K1 = 1.5
+B = 0.75
+
+# 最終スコアの重み
+TEXT_WEIGHT = 0.5      # 本文（タイトル＋説明文）の関連度
+CATEGORY_WEIGHT = 0.3  # 選んだジャンルで取り込まれた記事か
+RECENCY_WEIGHT = 0.2   # 新しさ
+
+# 新しさの半減期（時間）
+RECENCY_HALF_LIFE_HOURS = 24
+
+# ジャンル名だけでは本文に出てこないことが多いので、関連する言葉も検索に使う
+CATEGORY_KEYWORDS = {
+    "テクノロジー": ["AI", "IT", "技術", "デジタル", "半導体", "スマホ"],
+    "ビジネス": ["企業", "経営", "事業", "買収", "決算", "商社"],
+    "スポーツ": ["試合", "選手", "優勝", "野球", "サッカー", "五輪"],
+    "政治": ["政府", "首相", "国会", "選挙", "政策", "与党"],
+    "国際": ["海外", "米国", "中国", "外交", "世界", "首脳"],
+    "エンタメ": ["映画", "音楽", "ドラマ", "俳優", "アニメ", "芸能"],
+    "健康": ["医療", "病気", "予防", "睡眠", "食事", "運動"],
+    "ライフスタイル": ["暮らし", "生活", "旅行", "料理", "ファッション", "趣味"],
+    "経済": ["株価", "物価", "景気", "金利", "円安", "市場"],
+    "科学": ["研究", "宇宙", "発見", "実験", "大学", "論文"],
+    "環境": ["気候", "温暖化", "脱炭素", "再生可能エネルギー", "自然", "環境問題"],
+    "教育": ["学校", "大学", "学生", "授業", "入試", "子ども"],
+}
+
+
+def tokenize(text: str) -> list[str]:
+    """文字 2-gram に分ける（日本語は単語で区切れないので文字単位にする）"""
+    text = dedupe.normalize(text)
+    if len(text) < 2:
+        return [text] if text else []
+    return [text[i:i + 2] for i in range(len(text) - 1)]
+
+
+def article_terms(article: dict) -> dict[str, int]:
+    """記事の単語ごとの出現回数"""
+    tf = {}
+    for term in tokenize(f"{article.get('title') or ''} {article.get('description') or ''}"):
+        tf[term] = tf.get(term, 0) + 1
+    return tf
+
+
+def query_terms(categories: list[str]) -> dict[str, float]:
+    """ユーザーのジャンルから検索語と重みを作る"""
+    weights = {}
+    for category in categories:
+        words = [category] + CATEGORY_KEYWORDS.get(category, [])
+        for word in words:
+            for term in tokenize(word):
+                weights[term] = weights.get(term, 0) + 1
+    return weights
+
+
+def bm25_scores(tf: np.ndarray, df: np.ndarray, n_docs: int, doc_len: np.ndarray,
+                avgdl: float, query_weights: np.ndarray) -> np.ndarray:
+    """記事 × 検索語 の出現回数行列から BM25 スコアを一度に計算する"""
+    idf = np.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+    norm = K1 * (1 - B + B * doc_len / max(avgdl, 1e-9))
+    tf_part = tf * (K1 + 1) / (tf + norm[:, None])
+    return tf_part @ (idf * query_weights)
+
+
+def score_articles(articles: list[dict], memberships: list[int], categories: list[str],
+                   stats: dict, now: datetime | None = None) -> np.ndarray:
+    """記事ごとの最終スコアを返す
+
+    stats は news_store.load_term_stats の戻り値
+    memberships は各記事がユーザーのジャンルのうちいくつで取り込まれたか
+    """
+    if not articles:
+        return np.zeros(0)
+    now = now or datetime.now(timezone.utc)
+
+    terms = stats["terms"]
+    query = query_terms(categories)
+    query_weights = np.array([query[t] for t in terms], dtype=float)
+
+    # 記事 × 検索語 の出現回数行列
+    row_of = {a["url"]: i for i, a in enumerate(articles)}
+    col_of = {t: j for j, t in enumerate(terms)}
+    tf = np.zeros((len(articles), len(terms)))
+    for url, term, count in stats["postings"]:
+        if url in row_of:
+            tf[row_of[url], col_of[term]] = count
+    doc_len = np.array([stats["doc_len"].get(a["url"], 0) for a in articles], dtype=float)
+    df = np.array([stats["df"].get(t, 0) for t in terms], dtype=float)
+
+    text = bm25_scores(tf, df, stats["n_docs"], doc_len, stats["avgdl"], query_weights) if terms else np.zeros(len(articles))
+    if text.max() > 0:
+        text = text / text.max()
+
+    category = np.array(memberships, dtype=float) / max(len(categories), 1)
+
+    published = np.array([
+        datetime.strptime(a["publishedAt"], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc).timestamp()
+        for a in articles
+    ])
+    age_hours = np.maximum(now.timestamp() - published, 0) / 3600
+    recency = 0.5 ** (age_hours / RECENCY_HALF_LIFE_HOURS)
+
+    return TEXT_WEIGHT * text + CATEGORY_WEIGHT * category + RECENCY_WEIGHT * recency
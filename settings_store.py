@@ -0,0 +1,292 @@
+# settings_store.py
+# ユーザー設定（st.session_state.settings）を users テーブルに読み書きするモジュール
+#
+# 読み込み
+# - ログインの応答に入っている user_metadata.settings を使う（DB の問い合わせは0回）
+#   users の内容はトリガーで auth.users の user_metadata に写している（写しなので、正しい値は users にある）
+# - そこに無ければ、同じセッションで読んだ設定 → get_user_settings() の1回の呼び出し、の順に使う
+# - 読んだ設定はセッションごとに覚えておき、保存したときに新しい内容に置き換える
+#   （別の端末で変えた設定を見逃さないように、セッションをまたいでは使わない）
+#
+# 書き込み
+# - 最後に保存した内容と比べ、変わった列だけを書く（変わっていなければ DB は呼ばない）
+# - 書き込みは画面の描画とは別のスレッドで行う（auth_user_id ごとに1回の upsert にまとめる）
+# - 待ち行列には上限があり、あふれたときは列を書き込み待ちに残し、書き込み用のスレッドの手が空いたときに書く
+#   （画面の描画を止めない）
+# - 書けなかった列は、書き込み用のスレッドが間隔を空けながら書き直す（status() で確認できる）
+# - プロセスの終了時に、残っている書き込みを流し切る
+import json
+import time
+import queue
+import atexit
+import threading
+from horoscope import get_zodiac
+
+# users テーブルに保存する設定の項目
+FIELDS = ("birth_year", "birth_month", "birth_day", "home_pref", "work_pref", "categories")
+
+# 読み込む列（画面で使うものだけ）
+COLUMNS = ("email",) + FIELDS
+
+# 書き込み待ちのユーザー数の上限
+MAX_PENDING = 256
+
+# 失敗したときにその場で書き直す回数と間隔（秒）
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 2.0
+
+# それでも書けなかったときに、あとで書き直すまでの間隔（秒）。失敗するたびに倍にする
+FAILED_RETRY_DELAY = 30.0
+FAILED_RETRY_MAX_DELAY = 10 * 60.0
+
+# 終了時に書き込みを待つ最大時間（秒）
+DRAIN_TIMEOUT = 10.0
+
+# session_state に「最後に保存した内容」と「読み込んだ設定」を置くキー
+SAVED_KEY = "settings_saved"
+CACHE_KEY = "settings_cache"
+
+_queue = queue.Queue(maxsize=MAX_PENDING)
+_pending = {}  # auth_user_id → まだ書いていない列（新しい値で上書きしていく）
+_failed = {}  # auth_user_id → (書けなかった列, 次に書き直す時刻, 失敗した回数)
+_overflow = set()  # 待ち行列があふれて入れられなかった auth_user_id（列は _pending にある）
+_lock = threading.Lock()
+_writer_started = False
+
+
+def to_row(settings: dict) -> dict:
+    """設定を users テーブルの列の形にする（categories は JSON 文字列、星座は誕生日から判定）"""
+    row = {field: settings.get(field) for field in FIELDS}
+    row["categories"] = json.dumps(settings.get("categories") or [], ensure_ascii=False)
+    row["zodiac_sign"] = get_zodiac(settings.get("birth_month"), settings.get("birth_day"))
+    return row
+
+
+def mark_saved(state, settings: dict | None = None) -> None:
+    """今の設定を「保存済み」として覚える（DB から読み込んだ直後など）"""
+    state[SAVED_KEY] = to_row(settings if settings is not None else state["settings"])
+
+
+def dirty_fields(state) -> dict:
+    """最後に保存してから変わった列"""
+    saved = state.get(SAVED_KEY) or {}
+    return {k: v for k, v in to_row(state["settings"]).items() if k not in saved or saved[k] != v}
+
+
+def from_row(row: dict) -> dict:
+    """users テーブルの列（または user_metadata.settings）を設定の形にする"""
+    categories = row.get("categories") or []
+    if isinstance(categories, str):
+        categories = json.loads(categories or "[]")
+    settings = {column: row.get(column) for column in COLUMNS}
+    settings["categories"] = categories
+    return settings
+
+
+def _remember(state, auth_user_id: str, settings: dict) -> None:
+    state[CACHE_KEY] = {"auth_user_id": auth_user_id, "settings": dict(settings)}
+
+
+def invalidate(state) -> None:
+    """このセッションで覚えている設定を捨てる（次の load で読み直す）"""
+    state.pop(CACHE_KEY, None)
+
+
+def _fetch(auth_user_id: str) -> dict | None:
+    from db import supabase
+    try:
+        # 設定を1回で返す関数（supabase/migrations を参照）
+        # クライアントは共有なので、auth_user_id を渡し、ログイン中のユーザーと違えば関数がエラーにする
+        row = supabase.rpc("get_user_settings", {"p_auth_user_id": auth_user_id}).execute().data
+        if isinstance(row, list):
+            row = row[0] if row else None
+        if not row:
+            return None
+        if str(row.get("auth_user_id")) == str(auth_user_id):
+            return row
+        print("get_user_settings が別のユーザーの設定を返しました")
+    except Exception as e:
+        # 関数がまだ無い DB・ユーザーが一致しないときは、使う列だけを select する
+        print(f"get_user_settings の呼び出しエラー: {e}")
+    row = (
+        supabase
+        .table("users")
+        .select(", ".join(COLUMNS))
+        .eq("auth_user_id", auth_user_id)
+        .maybe_single()
+        .execute()
+    )
+    return (row.data if row else None) or None
+
+
+def load(state, auth_user_id: str, user_metadata: dict | None = None) -> dict | None:
+    """ユーザーの設定を返す（user_metadata → このセッションで覚えている設定 → DB の順）。無ければ None
+
+    ログインの応答の user_metadata はその時点の内容なので、覚えている設定より優先する
+    """
+    row = (user_metadata or {}).get("settings")
+    if row:
+        settings = from_row(row)
+    else:
+        cached = state.get(CACHE_KEY)
+        if cached and cached["auth_user_id"] == auth_user_id:
+            return dict(cached["settings"])
+        row = _fetch(auth_user_id)
+        if not row:
+            return None
+        settings = from_row(row)
+    _remember(state, auth_user_id, settings)
+    return dict(settings)
+
+
+def persist(state, auth_user_id: str) -> bool:
+    """変わった列があれば書き込みを予約する（書き込みは裏で行う）。予約したら True"""
+    changed = dirty_fields(state)
+    if not changed:
+        return False
+    mark_saved(state)
+    # 覚えている設定は新しい内容に置き換える（書き込みが終わる前に読まれても古くならない）
+    _remember(state, auth_user_id, {column: state["settings"].get(column) for column in COLUMNS})
+    _enqueue(auth_user_id, changed)
+    return True
+
+
+def _write(auth_user_id: str, fields: dict):
+    from db import supabase
+    return (
+        supabase
+        .table("users")
+        .upsert({"auth_user_id": auth_user_id, **fields}, on_conflict="auth_user_id")
+        .execute()
+    )
+
+
+def _enqueue(auth_user_id: str, fields: dict) -> None:
+    _start_writer()
+    with _lock:
+        if auth_user_id in _pending:
+            # まだ書いていない分があれば、そこにまとめる（待ち行列には入れ直さない）
+            _pending[auth_user_id].update(fields)
+            return
+        failed = _failed.pop(auth_user_id, None)
+        _pending[auth_user_id] = {**(failed[0] if failed else {}), **fields}
+    try:
+        _queue.put_nowait(auth_user_id)
+    except queue.Full:
+        # 待ち行列があふれたら、列は _pending に残して書き込み用のスレッドに任せる（ここでは書かない）
+        with _lock:
+            _overflow.add(auth_user_id)
+
+
+def status(auth_user_id: str) -> str:
+    """書き込みの状態（"saved": 書き終わった / "pending": 書き込み待ち / "failed": 失敗して書き直し待ち）"""
+    with _lock:
+        if auth_user_id in _pending:
+            return "pending"
+        if auth_user_id in _failed:
+            return "failed"
+    return "saved"
+
+
+def _flush_user(auth_user_id: str) -> bool:
+    with _lock:
+        fields = _pending.pop(auth_user_id, None)
+    if not fields:
+        return True
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            _write(auth_user_id, fields)
+            return True
+        except Exception as e:
+            print(f"設定の保存エラー（{attempt}/{MAX_ATTEMPTS}回目）: {e}")
+            if attempt < MAX_ATTEMPTS:
+                time.sleep(RETRY_DELAY)
+    # 書けなかった列は、書き込み用のスレッドがあとで書き直す
+    with _lock:
+        if auth_user_id in _pending:
+            # その間に新しい変更が入っていれば、そちらを優先してまとめる
+            _pending[auth_user_id] = {**fields, **_pending[auth_user_id]}
+        else:
+            _, _, failures = _failed.get(auth_user_id, ({}, 0, 0))
+            delay = min(FAILED_RETRY_DELAY * 2 ** failures, FAILED_RETRY_MAX_DELAY)
+            _failed[auth_user_id] = (fields, time.monotonic() + delay, failures + 1)
+    return False
+
+
+def _retry_failed(force: bool = False) -> None:
+    """書き直す時刻になった失敗分を、もう一度書く（force なら時刻を待たない）"""
+    now = time.monotonic()
+    with _lock:
+        due = [uid for uid, (_, at, _) in _failed.items() if force or at <= now]
+    for auth_user_id in due:
+        with _lock:
+            if auth_user_id not in _failed or auth_user_id in _pending:
+                continue
+            _pending[auth_user_id] = dict(_failed[auth_user_id][0])
+        if _flush_user(auth_user_id):
+            with _lock:
+                _failed.pop(auth_user_id, None)
+        # 失敗したときは _flush_user が回数を増やし、次の間隔を延ばしている
+
+
+def _flush_overflow() -> None:
+    """待ち行列に入れられなかった分を書く
+
+    書き終わるまで _overflow に残しておく（flush() が書き込み中に終わったと判断しないように）
+    """
+    while True:
+        with _lock:
+            if not _overflow:
+                return
+            auth_user_id = next(iter(_overflow))
+        _flush_user(auth_user_id)
+        with _lock:
+            if auth_user_id not in _pending:  # 書いている間に変更が入っていれば、もう一度書く
+                _overflow.discard(auth_user_id)
+
+
+def _writer_loop():
+    while True:
+        try:
+            auth_user_id = _queue.get(timeout=1.0)
+        except queue.Empty:
+            _flush_overflow()
+            _retry_failed()
+            continue
+        try:
+            _flush_user(auth_user_id)
+        finally:
+            _queue.task_done()
+
+
+def _start_writer():
+    global _writer_started
+    with _lock:
+        if _writer_started:
+            return
+        _writer_started = True
+    threading.Thread(target=_writer_loop, name="settings-writer", daemon=True).start()
+
+
+def flush(timeout: float = DRAIN_TIMEOUT) -> bool:
+    """予約済みの書き込みが終わるまで待つ（timeout 秒で諦める）。すべて終わったら True"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with _queue.all_tasks_done:
+            if not _queue.unfinished_tasks and not _overflow:
+                return True
+        time.sleep(0.05)
+    return False
+
+
+@atexit.register
+def _drain():
+    if not _writer_started:
+        return
+    if not flush():
+        print("設定の保存が終わらないまま終了します")
+        return
+    # 書き直し待ちの分も、最後にもう一度だけ書いてみる
+    _retry_failed(force=True)
+    if _failed:
+        print(f"保存できなかった設定があります（{len(_failed)} 人分）")
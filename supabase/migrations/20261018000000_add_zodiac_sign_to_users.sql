@@ -0,0 +1,24 @@
+-- users に星座の列を追加する
+-- 値は save_settings_to_supabase が誕生日と一緒に保存する（horoscope.get_zodiac と同じ判定）
+alter table users add column if not exists zodiac_sign text;
+
+-- 既にいるユーザーの分を埋める（db.backfill_zodiac_signs() と同じ結果）
+update users
+set zodiac_sign = case
+    when (birth_month = 1 and birth_day >= 20) or (birth_month = 2 and birth_day <= 18) then '水瓶座'
+    when (birth_month = 2 and birth_day >= 19) or (birth_month = 3 and birth_day <= 20) then '魚座'
+    when (birth_month = 3 and birth_day >= 21) or (birth_month = 4 and birth_day <= 19) then '牡羊座'
+    when (birth_month = 4 and birth_day >= 20) or (birth_month = 5 and birth_day <= 20) then '牡牛座'
+    when (birth_month = 5 and birth_day >= 21) or (birth_month = 6 and birth_day <= 21) then '双子座'
+    when (birth_month = 6 and birth_day >= 22) or (birth_month = 7 and birth_day <= 22) then '蟹座'
+    when (birth_month = 7 and birth_day >= 23) or (birth_month = 8 and birth_day <= 22) then '獅子座'
+    when (birth_month = 8 and birth_day >= 23) or (birth_month = 9 and birth_day <= 22) then '乙女座'
+    when (birth_month = 9 and birth_day >= 23) or (birth_month = 10 and birth_day <= 23) then '天秤座'
+    when (birth_month = 10 and birth_day >= 24) or (birth_month = 11 and birth_day <= 22) then '蠍座'
+    when (birth_month = 11 and birth_day >= 23) or (birth_month = 12 and birth_day <= 21) then '射手座'
+    when (birth_month = 12 and birth_day >= 22) or (birth_month = 1 and birth_day <= 19) then '山羊座'
+end
+where zodiac_sign is null and birth_month is not null and birth_day is not null;
+
+-- 配信などで星座ごとにユーザーをまとめて引けるようにする
+create index if not exists users_zodiac_sign_idx on users (zodiac_sign);
@@ -0,0 +1,77 @@
+-- 設定の読み込みを速くする
+--   1. get_user_settings(): ログイン中のユーザーの設定（画面で使う列だけ）を1回の呼び出しで返す
+--   2. users の設定を auth.users の user_metadata.settings に写す
+--      （ログインの応答に設定が入るので、ログイン直後に users を読みに行かなくてよい）
+--
+-- user_metadata は写しで、正しい値は users にある
+--   - ユーザー本人が auth.update_user で書き換えられる（権限の判定などには使わない）
+--   - アクセストークン（JWT）に毎回入るので、写す項目を増やすとトークンが大きくなる
+
+create or replace function public.get_user_settings()
+returns jsonb
+language sql
+stable
+security definer
+set search_path = public
+as $$
+    select jsonb_build_object(
+        'email', email,
+        'birth_year', birth_year,
+        'birth_month', birth_month,
+        'birth_day', birth_day,
+        'home_pref', home_pref,
+        'work_pref', work_pref,
+        'categories', categories
+    )
+    from users
+    where auth_user_id = auth.uid()
+$$;
+
+grant execute on function public.get_user_settings() to authenticated;
+
+
+create or replace function public.sync_user_settings_metadata()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    update auth.users
+    set raw_user_meta_data = coalesce(raw_user_meta_data, '{}'::jsonb) || jsonb_build_object(
+        'settings', jsonb_build_object(
+            'email', new.email,
+            'birth_year', new.birth_year,
+            'birth_month', new.birth_month,
+            'birth_day', new.birth_day,
+            'home_pref', new.home_pref,
+            'work_pref', new.work_pref,
+            'categories', new.categories
+        )
+    )
+    where id = new.auth_user_id;
+    return new;
+end;
+$$;
+
+drop trigger if exists users_sync_settings_metadata on users;
+create trigger users_sync_settings_metadata
+    after insert or update of email, birth_year, birth_month, birth_day, home_pref, work_pref, categories
+    on users
+    for each row execute function public.sync_user_settings_metadata();
+
+-- 既にいるユーザーの分を写す
+update auth.users a
+set raw_user_meta_data = coalesce(a.raw_user_meta_data, '{}'::jsonb) || jsonb_build_object(
+    'settings', jsonb_build_object(
+        'email', u.email,
+        'birth_year', u.birth_year,
+        'birth_month', u.birth_month,
+        'birth_day', u.birth_day,
+        'home_pref', u.home_pref,
+        'work_pref', u.work_pref,
+        'categories', u.categories
+    )
+)
+from users u
+where a.id = u.auth_user_id;
@@ -0,0 +1,37 @@
+-- get_user_settings() に読みたいユーザーの auth_user_id を渡すようにする
+--   アプリは Supabase のクライアントを全セッションで共有しているので、auth.uid() が
+--   今の画面のユーザーとは限らない。渡された id と auth.uid() が違えばエラーにし、
+--   返す値にも auth_user_id を入れて、呼び出し側でも確かめられるようにする
+
+drop function if exists public.get_user_settings();
+
+create or replace function public.get_user_settings(p_auth_user_id uuid)
+returns jsonb
+language plpgsql
+stable
+security definer
+set search_path = public
+as $$
+begin
+    if p_auth_user_id is distinct from auth.uid() then
+        raise exception 'get_user_settings: auth_user_id がログイン中のユーザーと一致しません'
+            using errcode = '42501';
+    end if;
+    return (
+        select jsonb_build_object(
+            'auth_user_id', auth_user_id,
+            'email', email,
+            'birth_year', birth_year,
+            'birth_month', birth_month,
+            'birth_day', birth_day,
+            'home_pref', home_pref,
+            'work_pref', work_pref,
+            'categories', categories
+        )
+        from users
+        where auth_user_id = p_auth_user_id
+    );
+end;
+$$;
+
+grant execute on function public.get_user_settings(uuid) to authenticated;
@@ -0,0 +1,83 @@
+# swr_cache.py
+# stale-while-revalidate 方式のキャッシュ
+#
+# - 期限内: キャッシュをそのまま返す（期限は秒数か、expiry.py の更新時刻で決める）
+# - 期限切れ（max_stale 以内）: 古い値をすぐに返し、裏で1回だけ取り直す
+# - max_stale も過ぎた / 初回: その場で取得する
+# 一度見た地点なら、ユーザーの待ち時間に API 呼び出しが入らない
+#
+# st.cache_data と同じく、呼び出しごとに値のコピーを返す（受け取った側が書き換えても
+# ほかのセッションのキャッシュは変わらない）
+import copy
+import time
+import functools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import quota
+
+# 裏での取り直しに使うスレッド（全キャッシュで共有）
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="swr-refresh")
+
+
+def swr_cache(ttl: float | None = None, max_stale: float = 0, max_entries: int = 512, expires=None):
+    """stale-while-revalidate キャッシュのデコレーター
+
+    ttl       : この秒数までは新しい値として返す
+    expires   : ttl の代わりに、取得時刻（UNIX 秒）から期限の時刻を返す関数（expiry.py）
+    max_stale : 期限切れ後、この秒数までは古い値を返しつつ裏で取り直す
+    """
+    if (ttl is None) == (expires is None):
+        raise ValueError("ttl か expires のどちらか一方を指定してください")
+
+    def expires_at(now):
+        return now + ttl if expires is None else expires(now)
+
+    def decorator(func):
+        entries = OrderedDict()  # key -> (期限の時刻, 値)
+        refreshing = set()
+        lock = threading.Lock()
+
+        def store(key, value):
+            with lock:
+                entries[key] = (expires_at(time.time()), value)
+                entries.move_to_end(key)
+                while len(entries) > max_entries:
+                    entries.popitem(last=False)  # 一番使われていないものを捨てる
+
+        def refresh(key, args, kwargs):
+            try:
+                store(key, func(*args, **kwargs))
+            except Exception as e:
+                # 取り直せなかったときは古い値を使い続ける（max_stale まで）
+                print(f"キャッシュの更新エラー（{func.__name__}）: {e}")
+            finally:
+                with lock:
+                    refreshing.discard(key)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+            now = time.time()
+            with lock:
+                hit = entries.get(key)
+                if hit is not None:
+                    entries.move_to_end(key)
+                    if now >= hit[0] and now < hit[0] + max_stale and key not in refreshing:
+                        # 古い値をすぐ返し、取り直しは裏で1回だけ
+                        refreshing.add(key)
+                        _executor.submit(quota.as_current_user(refresh), key, args, kwargs)  # 取り直しも見ていたユーザーの呼び出しとして記録
+            if hit is not None and now < hit[0] + max_stale:
+                return copy.deepcopy(hit[1])
+
+            value = func(*args, **kwargs)
+            store(key, value)
+            return copy.deepcopy(value)
+
+        def clear():
+            with lock:
+                entries.clear()
+
+        wrapper.clear = clear
+        return wrapper
+    return decorator
@@ -0,0 +1,76 @@
+# conftest.py
+# テスト共通の設定
+# - リポジトリ直下のモジュール（news_store など）を import できるようにする
+# - SQLite やファイルのキャッシュはテストごとに tmp_path に置き、.cache/ には触らない
+# - 外部APIは呼ばない（各テストで取得関数を差し替える）
+# - 時刻は clock で止める（差し替えるのはテストするモジュールの time だけ）
+import os
+import sys
+import time
+from datetime import datetime, timezone
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fixtures  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def live_mode(monkeypatch):
+    """.env の OTASUKE_PROVIDER_MODE に左右されないように、live モードに固定する"""
+    monkeypatch.setattr(fixtures, "MODE", "live")
+    monkeypatch.setattr(fixtures, "_replay_now", None)
+
+
+@pytest.fixture
+def quota_db(tmp_path, monkeypatch):
+    import quota
+    monkeypatch.setattr(quota, "DB_PATH", str(tmp_path / "quota.sqlite3"))
+    monkeypatch.setattr(quota, "_initialized", False)
+    return quota
+
+
+@pytest.fixture
+def news_db(tmp_path, monkeypatch):
+    import news_store
+    monkeypatch.setattr(news_store, "DB_PATH", str(tmp_path / "news.sqlite3"))
+    monkeypatch.setattr(news_store, "_initialized", set())
+    return news_store
+
+
+class Clock:
+    """テスト用の時計（UNIX 秒）
+
+    use(モジュール) で、そのモジュールが import した time だけをこの時計にする
+    標準の time モジュールは変えないので、ほかのモジュールやテスト自身の待ち時間には影響しない
+    """
+
+    def __init__(self, monkeypatch, now: float):
+        self._monkeypatch = monkeypatch
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def utc(self) -> datetime:
+        return datetime.fromtimestamp(self.now, timezone.utc)
+
+    def set(self, value) -> None:
+        """時刻を合わせる（UNIX 秒か、タイムゾーン付きの datetime）"""
+        self.now = value.timestamp() if isinstance(value, datetime) else float(value)
+
+    def use(self, *modules) -> "Clock":
+        for module in modules:
+            self._monkeypatch.setattr(module, "time", self)
+        return self
+
+    def __getattr__(self, name):
+        return getattr(time, name)  # sleep などは本物を使う
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    return Clock(monkeypatch, 1_800_000_000.0)
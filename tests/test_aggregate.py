@@ -0,0 +1,85 @@
+# 3時間ごとの予報を日次にまとめる処理（numpy の reduceat）のテスト
+import random
+from datetime import datetime
+import pytest
+from weather_api import JST, aggregate_daily_forecast, aggregate_daily_forecasts
+
+START = int(datetime(2026, 10, 18, 0, tzinfo=JST).timestamp())
+
+
+def _forecast(seed: int, count: int = 40, start: int = START) -> dict:
+    rng = random.Random(seed)
+    items = []
+    for i in range(count):
+        item = {"dt": start + i * 3 * 3600, "main": {"temp": round(rng.uniform(5, 25), 1)},
+                "pop": rng.random(), "wind": {"speed": rng.uniform(0, 10)}}
+        if rng.random() < 0.3:
+            item["rain"] = {"3h": rng.uniform(0, 5)}
+        if rng.random() < 0.8:
+            item["weather"] = [{"description": f"天気{i}", "icon": "01d"}]
+        items.append(item)
+    rng.shuffle(items)  # API の並び順に頼らない
+    return {"list": items}
+
+
+def _reference(data: dict, days: int = 3) -> list[dict]:
+    """1日ずつ Python で集計した結果（比較用）"""
+    by_day = {}
+    for item in sorted(data["list"], key=lambda x: x["dt"]):
+        date = datetime.fromtimestamp(item["dt"], JST).date()
+        by_day.setdefault(date, []).append(item)
+    result = []
+    for date, items in list(by_day.items())[:days]:
+        weather = next((i["weather"][0] for i in items if i.get("weather")), {"description": "不明", "icon": "01d"})
+        result.append({
+            "dt": float(datetime(date.year, date.month, date.day, tzinfo=JST).timestamp()),
+            "temp": {"max": max(i["main"]["temp"] for i in items), "min": min(i["main"]["temp"] for i in items)},
+            "pop": max(i.get("pop", 0) for i in items),
+            "weather": [weather],
+            "wind_speed": sum(i.get("wind", {}).get("speed", 0) for i in items) / len(items),
+            "rain": sum(i.get("rain", {}).get("3h", 0) for i in items),
+            "snow": sum(i.get("snow", {}).get("3h", 0) for i in items),
+        })
+    return result
+
+
+def _assert_same(actual: list[dict], expected: list[dict]):
+    assert len(actual) == len(expected)
+    for a, e in zip(actual, expected):
+        assert a["dt"] == e["dt"]
+        assert a["temp"] == pytest.approx(e["temp"])
+        assert a["weather"] == e["weather"]
+        for name in ("pop", "wind_speed", "rain", "snow"):
+            assert a[name] == pytest.approx(e[name])
+
+
+def test_matches_per_day_loop_for_many_locations():
+    forecasts = [_forecast(seed) for seed in range(5)]
+    for actual, data in zip(aggregate_daily_forecasts(forecasts), forecasts):
+        _assert_same(actual, _reference(data))
+
+
+def test_days_are_split_at_jst_midnight():
+    # UTC 15時（JST 0時）をまたぐ2件は別の日になる
+    data = {"list": [
+        {"dt": START - 3 * 3600, "main": {"temp": 10.0}},
+        {"dt": START, "main": {"temp": 20.0}},
+    ]}
+    daily = aggregate_daily_forecast(data)
+    assert [d["dt"] for d in daily] == [START - 86400, START]
+    assert [d["temp"]["max"] for d in daily] == [10.0, 20.0]
+    assert daily[0]["weather"] == [{"description": "不明", "icon": "01d"}]
+
+
+def test_empty_locations_keep_their_position():
+    forecasts = [{"list": []}, _forecast(1), {}]
+    result = aggregate_daily_forecasts(forecasts)
+    assert result[0] == [] and result[2] == []
+    _assert_same(result[1], _reference(forecasts[1]))
+    assert aggregate_daily_forecasts([{}, {}]) == [[], []]
+
+
+def test_days_limit():
+    data = _forecast(2)
+    assert len(aggregate_daily_forecasts([data], days=2)[0]) == 2
+    _assert_same(aggregate_daily_forecasts([data], days=5)[0], _reference(data, days=5))
@@ -0,0 +1,78 @@
+# SimHash による重複記事の判定と、記事ストアでのまとめ方のテスト
+import random
+from datetime import datetime, timezone
+import dedupe
+
+BODY = ("日本銀行は31日まで開いた金融政策決定会合で、政策金利を0.5%程度に据え置くことを決めた。"
+        "同時に公表した展望リポートでは、2026年度の物価見通しを上方修正した。"
+        "植田総裁は会見で、賃金と物価の好循環が続いているとの認識を示した。")
+
+BOJ = {"url": "https://www.nikkei.com/a", "title": "日銀、政策金利を据え置き 物価見通しを上方修正",
+       "description": BODY, "publishedAt": "2026-10-18T01:00:00Z"}
+# 同じ記事が配信先の名前つきで別のサイトにも載っている
+BOJ_ASAHI = dict(BOJ, url="https://www.asahi.com/b", title=BOJ["title"] + " - 朝日新聞")
+OHTANI = {"url": "https://www.sankei.com/c", "title": "大谷翔平、今季50本目の本塁打",
+          "description": "ドジャースの大谷翔平選手が50号本塁打を放ち、球団記録を更新した。",
+          "publishedAt": "2026-10-18T02:00:00Z"}
+
+
+def test_normalize_ignores_width_case_and_punctuation():
+    assert dedupe.normalize("ＡＩ　Ｎｅｗｓ！ 2026") == dedupe.normalize("ai news 2026")
+    assert dedupe.simhash("【速報】ＡＩ、半導体") == dedupe.simhash("速報 AI 半導体")
+
+
+def test_source_suffix_is_a_near_duplicate():
+    a, b = dedupe.article_signature(BOJ), dedupe.article_signature(BOJ_ASAHI)
+    assert a != b
+    assert dedupe.is_near_duplicate(a, b)
+
+
+def test_different_story_is_not_a_near_duplicate():
+    a, c = dedupe.article_signature(BOJ), dedupe.article_signature(OHTANI)
+    assert dedupe.hamming(a, c) > 3 * dedupe.MAX_DISTANCE
+    assert not dedupe.is_near_duplicate(a, c)
+
+
+def test_empty_and_short_text():
+    assert dedupe.simhash("") == 0
+    assert dedupe.simhash("AI") == dedupe.simhash("ai")
+
+
+def test_near_duplicates_always_share_a_band():
+    rng = random.Random(0)
+    for _ in range(500):
+        sig = rng.getrandbits(dedupe.BITS)
+        other = sig
+        for bit in rng.sample(range(dedupe.BITS), dedupe.BANDS - 1):
+            other ^= 1 << bit
+        assert set(enumerate(dedupe.bands(sig))) & set(enumerate(dedupe.bands(other)))
+
+
+def test_signed_round_trip():
+    for sig in (0, 1, (1 << 63) - 1, 1 << 63, (1 << 64) - 1):
+        signed = dedupe.to_signed(sig)
+        assert -(1 << 63) <= signed < 1 << 63
+        assert dedupe.to_unsigned(signed) == sig
+
+
+def test_collapse_keeps_the_first_of_each_story():
+    assert dedupe.collapse([BOJ_ASAHI, OHTANI, BOJ]) == [BOJ_ASAHI, OHTANI]
+    assert dedupe.collapse([]) == []
+
+
+def test_store_adds_category_to_existing_duplicate(news_db, monkeypatch):
+    monkeypatch.setattr(news_db, "utc_now", lambda: datetime(2026, 10, 18, 3, tzinfo=timezone.utc))
+    assert news_db.save_articles("経済", [BOJ]) == 1
+    assert news_db.save_articles("政治", [BOJ_ASAHI, OHTANI]) == 1
+
+    loaded = news_db.load_articles(["経済", "政治"])
+    assert [a["url"] for a in loaded["経済"]] == [BOJ["url"]]
+    assert [a["url"] for a in loaded["政治"]] == [OHTANI["url"], BOJ["url"]]
+
+
+def test_store_recomputes_signature_when_article_changes(news_db, monkeypatch):
+    monkeypatch.setattr(news_db, "utc_now", lambda: datetime(2026, 10, 18, 3, tzinfo=timezone.utc))
+    news_db.save_articles("経済", [BOJ])
+    # 同じ URL の内容が差し替わったら、古い署名で別の記事をまとめてはいけない
+    news_db.save_articles("経済", [dict(OHTANI, url=BOJ["url"])])
+    assert news_db.save_articles("経済", [BOJ_ASAHI]) == 1
@@ -0,0 +1,89 @@
+# 取得元の更新時刻に合わせたキャッシュ期限のテスト
+from datetime import datetime, timezone
+import pytest
+import expiry
+import fixtures
+import weather
+import swr_cache
+
+JST = expiry.JST
+
+
+def _ts(*args, tz=JST) -> float:
+    return datetime(*args, tzinfo=tz).timestamp()
+
+
+def _jst(ts: float) -> datetime:
+    return datetime.fromtimestamp(ts, JST)
+
+
+def test_next_step_is_strictly_after_now():
+    assert expiry.next_step(600, now=1200) == 1800  # ちょうど区切りなら次の区切り
+    assert expiry.next_step(600, now=1201) == 1800
+    assert expiry.next_step(600, lag=60, now=1259) == 1260
+    assert expiry.next_step(600, lag=60, now=1260) == 1860
+
+
+def test_openweather_forecast_follows_three_hour_utc_steps():
+    now = _ts(2026, 10, 18, 4, 0, tz=timezone.utc)
+    assert expiry.openweather_forecast(now) == _ts(2026, 10, 18, 6, 5, tz=timezone.utc)
+    # 区切りの直後でも、新しいデータが出るまでは前の区切りのまま
+    now = _ts(2026, 10, 18, 6, 2, tz=timezone.utc)
+    assert expiry.openweather_forecast(now) == _ts(2026, 10, 18, 6, 5, tz=timezone.utc)
+
+
+def test_openweather_current_follows_ten_minutes():
+    now = _ts(2026, 10, 18, 12, 34, 56)
+    assert _jst(expiry.openweather_current(now)) == datetime(2026, 10, 18, 12, 40, tzinfo=JST)
+
+
+@pytest.mark.parametrize("now, expected", [
+    ((2026, 10, 18, 0, 30), (2026, 10, 18, 5, 10)),
+    ((2026, 10, 18, 5, 10), (2026, 10, 18, 11, 10)),
+    ((2026, 10, 18, 12, 0), (2026, 10, 18, 17, 10)),
+    ((2026, 10, 18, 17, 9, 59), (2026, 10, 18, 17, 10)),
+    ((2026, 10, 18, 23, 59), (2026, 10, 19, 5, 10)),
+    ((2026, 12, 31, 18, 0), (2027, 1, 1, 5, 10)),
+])
+def test_tsukumijima_follows_jma_publication_hours(now, expected):
+    assert _jst(expiry.tsukumijima(_ts(*now))) == datetime(*expected, tzinfo=JST)
+
+
+def test_jst_midnight():
+    # UTC では前日の 15時が JST の 0時
+    now = _ts(2026, 10, 18, 14, 59, tz=timezone.utc)
+    assert _jst(expiry.jst_midnight(now)) == datetime(2026, 10, 19, tzinfo=JST)
+    assert _jst(expiry.jst_midnight(_ts(2026, 10, 19))) == datetime(2026, 10, 20, tzinfo=JST)
+
+
+def test_cache_is_kept_until_next_publication(clock):
+    clock.set(_ts(2026, 10, 18, 6, 0))
+    clock.use(expiry, swr_cache)
+    calls = []
+
+    @swr_cache.swr_cache(expires=expiry.tsukumijima)
+    def fetch(pref):
+        calls.append(pref)
+        return {"pref": pref, "n": len(calls)}
+
+    assert fetch("東京都")["n"] == 1
+    clock.set(_ts(2026, 10, 18, 11, 9))
+    assert fetch("東京都")["n"] == 1  # 次の発表が反映されるまでは呼ばない
+    clock.set(_ts(2026, 10, 18, 11, 10))
+    assert fetch("東京都")["n"] == 2
+
+
+def test_normalize_tsukumijima_drops_days_before_today(monkeypatch):
+    # 0時〜5時は前日発表の予報に「昨日」が残っている
+    monkeypatch.setattr(fixtures, "now", lambda: datetime(2026, 10, 18, 2, tzinfo=JST))
+    forecast = {"forecasts": [
+        {"date": "2026-10-17", "telop": "晴れ", "temperature": {"max": {"celsius": "20"}}},
+        {"date": "2026-10-18", "telop": "曇り", "temperature": {"max": {"celsius": "18"}, "min": {"celsius": "11"}},
+         "chanceOfRain": {"T00_06": "10%", "T06_12": "30%", "T12_18": "--%"}},
+        {"date": "2026-10-19", "telop": "雨", "temperature": {}},
+    ]}
+    daily = weather.normalize_tsukumijima(forecast)
+    assert [d["dt"] for d in daily] == [_ts(2026, 10, 18), _ts(2026, 10, 19)]
+    assert daily[0]["temp"] == {"max": 18.0, "min": 11.0}
+    assert daily[0]["pop"] == pytest.approx(0.3)
+    assert daily[1]["temp"] == {"max": None, "min": None}
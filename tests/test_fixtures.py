@@ -0,0 +1,61 @@
+# 外部APIのレスポンスの記録・再生のテスト
+import json
+from datetime import datetime, timezone
+import pytest
+import fixtures
+
+URL = "https://api.openweathermap.org/data/2.5/forecast"
+
+
+def _write(tmp_path, provider: str, records: list[dict]):
+    with open(tmp_path / f"{provider}.jsonl", "w", encoding="utf-8") as f:
+        for params, recorded_at, body in records:
+            record = {"key": fixtures._make_key(URL, params), "url": URL, "recorded_at": recorded_at, "body": body}
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+@pytest.fixture
+def replay(tmp_path, monkeypatch):
+    monkeypatch.setattr(fixtures, "FIXTURE_DIR", str(tmp_path))
+    monkeypatch.setattr(fixtures, "TEST_NEWS_PATH", str(tmp_path / "missing.txt"))
+    monkeypatch.setattr(fixtures, "_store", {})
+    fixtures.set_mode("replay")
+    return tmp_path
+
+
+def test_exact_match_is_replayed(replay):
+    _write(replay, "openweather", [
+        ({"lat": 35.68, "lon": 139.69}, "2026-10-18T00:00:00Z", {"city": "東京"}),
+        ({"lat": 34.69, "lon": 135.50}, "2026-10-18T01:00:00Z", {"city": "大阪"}),
+    ])
+    assert fixtures.fetch_json("openweather", URL, {"lat": 34.69, "lon": 135.50, "appid": "secret"}) == {"city": "大阪"}
+
+
+def test_only_volatile_params_may_differ(replay):
+    _write(replay, "openweather", [
+        ({"q": "科学", "from": "2026-10-15T00:00:00Z"}, "2026-10-15T00:00:00Z", {"n": 1}),
+        ({"q": "科学", "from": "2026-10-16T00:00:00Z"}, "2026-10-16T00:00:00Z", {"n": 2}),
+    ])
+    # 日時だけが違う記録は、いちばん新しいもので代用する
+    assert fixtures.fetch_json("openweather", URL, {"q": "科学", "from": "2026-10-17T00:00:00Z"}) == {"n": 2}
+    # 地点などほかのパラメータが違う記録は使わない
+    with pytest.raises(fixtures.FixtureMissing):
+        fixtures.fetch_json("openweather", URL, {"q": "経済", "from": "2026-10-17T00:00:00Z"})
+
+
+def test_replay_clock_is_latest_recording(replay):
+    _write(replay, "openweather", [({"lat": 1}, "2026-10-17T21:30:00Z", {})])
+    assert fixtures.now() == datetime(2026, 10, 17, 21, 30, tzinfo=timezone.utc)
+    # 一度求めたら、記録が増えても再生中は変わらない
+    _write(replay, "tsukumijima", [({"city": "130010"}, "2026-10-18T00:00:00Z", {})])
+    assert fixtures.now() == datetime(2026, 10, 17, 21, 30, tzinfo=timezone.utc)
+
+
+def test_secret_params_are_not_part_of_the_key():
+    assert fixtures._make_key(URL, {"lat": 1, "appid": "a"}) == fixtures._make_key(URL, {"lat": 1, "appid": "b"})
+    assert "appid" not in fixtures._make_key(URL, {"lat": 1, "appid": "a"})
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        fixtures.set_mode("offline")
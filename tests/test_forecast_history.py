@@ -0,0 +1,147 @@
+# 都道府県ごとの予報・実況の時系列（追記とまとめ直し）のテスト
+import os
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+import forecast_history as fh
+from weather_api import JST
+
+TODAY = datetime(2026, 10, 18, tzinfo=JST)
+T0 = int(TODAY.timestamp())
+
+
+@pytest.fixture
+def history(tmp_path, clock, monkeypatch):
+    clock.set(T0 + 9 * 3600)  # JST 9時
+    monkeypatch.setattr(fh, "_now", lambda: int(clock.now))
+    monkeypatch.setattr(fh, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(fh, "_series", {})
+    return fh
+
+
+def _day(offset: int, high, low, pop=0.2, provider=None) -> dict:
+    day = {"dt": T0 + offset * 86400, "temp": {"max": high, "min": low}, "pop": pop}
+    if provider:
+        day["provider"] = provider
+    return day
+
+
+def _reload(history):
+    """メモリの列データを捨て、ファイルから読み直す"""
+    history._series.clear()
+
+
+def test_unchanged_forecast_is_not_appended(history):
+    daily = [_day(0, 20.5, 12.0), _day(1, 22.0, 13.5)]
+    assert history.record_daily("東京都", daily, "tsukumijima") == 2
+    assert history.record_daily("東京都", daily, "tsukumijima") == 0
+    assert history.record_daily("東京都", [_day(0, 21.0, 12.0), _day(1, 22.0, 13.5)], "tsukumijima") == 1
+
+
+def test_alternating_providers_do_not_grow_history(history):
+    tsukumijima = [_day(0, 20.0, 12.0, None)]
+    openweather = [_day(0, 19.4, 11.8, 0.1)]
+    assert history.record_daily("東京都", tsukumijima, "tsukumijima") == 1
+    assert history.record_daily("東京都", openweather, "openweather") == 1
+    for _ in range(5):
+        assert history.record_daily("東京都", tsukumijima, "tsukumijima") == 0
+        assert history.record_daily("東京都", openweather, "openweather") == 0
+
+
+def test_provider_on_each_day_takes_precedence(history):
+    history.record_daily("東京都", [_day(0, 20.0, 12.0, provider="openweather")], "tsukumijima")
+    cols = history._series["東京都"].view()
+    assert cols["source"].tolist() == [history.SOURCES["openweather"]]
+
+
+def test_appends_fixed_size_records_and_reads_them_back(history, clock):
+    history.record_daily("東京都", [_day(0, 20.0, 12.0)], "tsukumijima")
+    path = history._path("東京都")
+    assert os.path.basename(path) == "130010.rec"
+    size = os.path.getsize(path)
+
+    clock.now += 60
+    assert history.record_observation("東京都", clock.now, 18.5)
+    history.record_daily("東京都", [_day(0, 21.0, 12.0), _day(1, 23.0, 14.0)], "tsukumijima")
+    # まとめ直すまでは、追記した3行分だけファイルが伸びる
+    assert os.path.getsize(path) == size + 3 * history.RECORD.itemsize
+
+    before = {k: v.copy() for k, v in history._series["東京都"].view().items()}
+    _reload(history)
+    after = history._get("東京都").view()
+    for name in history.COLUMNS:
+        np.testing.assert_array_equal(after[name], before[name])
+
+
+def test_truncated_record_is_ignored(history):
+    history.record_daily("東京都", [_day(0, 20.0, 12.0), _day(1, 22.0, 13.0)], "tsukumijima")
+    with open(history._path("東京都"), "ab") as f:
+        f.write(b"\x01\x02\x03")  # 書きかけのまま落ちた
+    _reload(history)
+    assert len(history._get("東京都").view()["ts"]) == 2
+
+
+def test_legacy_npz_is_read_and_replaced(history):
+    os.makedirs(history.DATA_DIR, exist_ok=True)
+    np.savez(history._path("東京都", "npz"),
+             ts=np.array([T0], np.int64), issued=np.array([T0], np.int64), kind=np.array([history.FORECAST], np.int8),
+             temp_max=np.array([20.0], np.float32), temp_min=np.array([12.0], np.float32),
+             pop=np.array([0.3], np.float32))
+    history._series.clear()
+    cols = history._get("東京都").view()
+    assert cols["source"].tolist() == [history.UNKNOWN_SOURCE]
+
+    history.record_daily("東京都", [_day(1, 22.0, 13.0)], "tsukumijima")  # 初回の保存でまとめ直す
+    assert not os.path.exists(history._path("東京都", "npz"))
+    _reload(history)
+    assert len(history._get("東京都").view()["ts"]) == 2
+
+
+def test_compaction_keeps_last_forecast_and_hourly_observations(history, clock):
+    start = T0 - 5 * 86400
+    for minutes in range(0, 120, 10):  # 2時間分、10分ごとの実況
+        clock.now = start + minutes * 60
+        history.record_observation("東京都", clock.now, 10.0 + minutes / 10)
+    for high in (20.0, 21.0, 19.0):  # 同じ日の予報が3回変わった
+        history.record_daily("東京都", [_day(-5, high, 10.0)], "tsukumijima")
+
+    clock.now = T0 + history.COMPACT_INTERVAL
+    history.record_daily("東京都", [_day(0, 20.0, 12.0)], "tsukumijima")
+    cols = history._series["東京都"].view()
+
+    obs = cols["kind"] == history.OBSERVATION
+    assert cols["ts"][obs].tolist() == [start, start + 3600]
+    assert cols["temp_max"][obs].tolist() == [15.0, 21.0]
+    assert cols["temp_min"][obs].tolist() == [10.0, 16.0]
+    past = (cols["kind"] == history.FORECAST) & (cols["ts"] == T0 - 5 * 86400)
+    assert cols["temp_max"][past].tolist() == [19.0]
+
+    # まとめ直した内容でファイルも書き直している
+    _reload(history)
+    assert len(history._get("東京都").view()["ts"]) == len(cols["ts"])
+
+
+def test_points_past_retention_are_dropped(history, clock):
+    clock.now = T0 - (history.RETENTION_DAYS + 1) * 86400
+    history.record_observation("東京都", clock.now, 10.0)
+    clock.now = T0
+    history.record_observation("東京都", T0, 12.0)
+    clock.now += history.COMPACT_INTERVAL
+    history.record_observation("東京都", clock.now, 13.0)
+    assert history._series["東京都"].view()["ts"].min() == T0
+
+
+def test_daily_history_prefers_observations_and_fills_missing_values(history):
+    history.record_daily("東京都", [_day(-1, 18.0, 9.0, 0.4), _day(0, 20.0, 11.0, 0.1)], "openweather")
+    history.record_daily("東京都", [_day(0, 21.0, None, None)], "tsukumijima")
+    history.record_observation("東京都", T0 - 86400 + 12 * 3600, 19.5)
+
+    entries = {e["date"]: e for e in history.daily_history("東京都", days_back=1, days_ahead=1)}
+    yesterday, today = entries[TODAY.date() - timedelta(days=1)], entries[TODAY.date()]
+    assert yesterday == {"temp_max": 19.5, "temp_min": 9.0, "pop": 0.4, "observed": True, "date": yesterday["date"]}
+    # tsukumijima に最低気温がない日は、その前に出た予報の値を使う
+    assert (today["temp_max"], today["temp_min"], today["observed"]) == (21.0, 11.0, False)
+    assert today["pop"] == pytest.approx(0.1)
+    assert TODAY.date() + timedelta(days=1) not in entries
+
+    assert history.compare_with_yesterday("東京都") == {"temp_max": 1.5, "temp_min": 2.0}
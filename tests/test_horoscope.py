@@ -0,0 +1,68 @@
+# 1日分の占いを1回だけ取得して星座ごとに引く処理のテスト
+import threading
+import time
+import pytest
+import requests
+import horoscope
+
+DATE = "2026/10/18"
+
+
+def _payload(date: str) -> dict:
+    return {"horoscope": {date: [{"sign": sign, "rank": i + 1} for i, sign in enumerate(horoscope.ZODIAC_SIGNS)]}}
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    monkeypatch.setattr(horoscope, "DB_PATH", str(tmp_path / "horoscope.sqlite3"))
+    monkeypatch.setattr(horoscope, "_db_initialized", False)
+    monkeypatch.setattr(horoscope, "_days", {})
+    monkeypatch.setattr(horoscope, "_day_locks", {})
+    calls = []
+
+    def fetch(date):
+        calls.append(date)
+        time.sleep(0.05)  # 同時に呼ばれたときに重なるように少し待つ
+        return _payload(date)
+
+    monkeypatch.setattr(horoscope, "fetch_horoscope", fetch)
+    return calls
+
+
+def test_day_is_fetched_once_for_concurrent_users(api):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(horoscope.load_day(DATE))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert api == [DATE]
+    assert all(r is results[0] for r in results)
+    assert results[0]["蠍座"]["rank"] == horoscope.ZODIAC_SIGNS.index("蠍座") + 1
+    assert horoscope._day_locks == {}
+
+
+def test_saved_day_survives_restart(api):
+    horoscope.load_day(DATE)
+    horoscope._days.clear()  # プロセスの再起動
+    assert horoscope.load_day(DATE)["山羊座"]["rank"] == 12
+    assert api == [DATE]
+
+
+def test_failed_fetch_releases_lock_and_retries(api, monkeypatch):
+    def broken(date):
+        raise requests.ConnectionError("down")
+
+    monkeypatch.setattr(horoscope, "fetch_horoscope", broken)
+    with pytest.raises(requests.ConnectionError):
+        horoscope.load_day(DATE)
+    assert horoscope._day_locks == {}
+
+    monkeypatch.setattr(horoscope, "fetch_horoscope", _payload)
+    assert len(horoscope.load_day(DATE)) == 12
+
+
+def test_only_recent_days_stay_in_memory(api):
+    for day in ("2026/10/16", "2026/10/17", DATE):
+        horoscope.load_day(day)
+    assert sorted(horoscope._days) == ["2026/10/17", DATE]
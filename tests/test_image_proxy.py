@@ -0,0 +1,170 @@
+# 記事画像のサムネイル作成（URL の確認・ダウンロードの上限）のテスト
+import io
+import socket
+import threading
+import http.server
+import pytest
+from PIL import Image
+import image_proxy
+
+ADDRESSES = {"img.example.com": "93.184.216.34", "intranet.example.com": "10.0.0.5", "v6.example.com": "::1"}
+
+
+@pytest.fixture(autouse=True)
+def dns(monkeypatch):
+    """名前解決はネットワークを使わずに表から引く"""
+    def getaddrinfo(host, port, *args, **kwargs):
+        address = ADDRESSES.get(host, host)
+        try:
+            family = socket.AF_INET6 if ":" in address else socket.AF_INET
+            socket.inet_pton(family, address)
+        except OSError:
+            raise socket.gaierror(host)
+        return [(family, socket.SOCK_STREAM, socket.IPPROTO_TCP, "", (address, port))]
+
+    monkeypatch.setattr(image_proxy.socket, "getaddrinfo", getaddrinfo)
+
+
+@pytest.mark.parametrize("url", [
+    "https://img.example.com/a.jpg",
+    "http://93.184.216.34/a.png",
+])
+def test_public_urls_are_allowed(url):
+    image_proxy.check_public_url(url)
+
+
+@pytest.mark.parametrize("url", [
+    "file:///etc/passwd",
+    "ftp://img.example.com/a.jpg",
+    "https:///a.jpg",
+    "http://127.0.0.1/a.jpg",
+    "http://169.254.169.254/latest/meta-data",
+    "https://intranet.example.com/a.jpg",
+    "https://v6.example.com/a.jpg",
+    "https://no-such-host.invalid/a.jpg",
+])
+def test_private_or_non_http_urls_are_rejected(url):
+    with pytest.raises(image_proxy.UnsafeImageUrl):
+        image_proxy.check_public_url(url)
+
+
+class FakeRaw(io.BytesIO):
+    def read(self, size=-1, decode_content=False):
+        return super().read(size)
+
+
+class FakeResponse:
+    def __init__(self, body=b"", headers=None, redirect=None):
+        self.headers = dict(headers or {})
+        self.is_redirect = redirect is not None
+        if redirect:
+            self.headers["Location"] = redirect
+        self.raw = FakeRaw(body)
+
+    def raise_for_status(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeServer:
+    """image_proxy._session の代わり（URL ごとに用意した応答を返す）"""
+
+    def __init__(self):
+        self.responses = {}
+        self.requested = []
+
+    def get(self, url, **kwargs):
+        assert kwargs["stream"] and not kwargs["allow_redirects"]
+        self.requested.append(url)
+        return self.responses[url]
+
+
+@pytest.fixture
+def server(monkeypatch):
+    fake = FakeServer()
+    monkeypatch.setattr(image_proxy, "_session", fake)
+    return fake
+
+
+def test_redirect_to_private_address_is_not_followed(server):
+    server.responses["https://img.example.com/a.jpg"] = FakeResponse(redirect="http://10.0.0.5/secret")
+    with pytest.raises(image_proxy.UnsafeImageUrl):
+        image_proxy._download("https://img.example.com/a.jpg")
+    assert server.requested == ["https://img.example.com/a.jpg"]
+
+
+def test_redirects_are_limited(server):
+    for i in range(image_proxy.MAX_REDIRECTS + 2):
+        server.responses[f"https://img.example.com/{i}"] = FakeResponse(redirect=f"/{i + 1}")
+    with pytest.raises(image_proxy.UnsafeImageUrl):
+        image_proxy._download("https://img.example.com/0")
+    assert len(server.requested) == image_proxy.MAX_REDIRECTS + 1
+
+
+def test_oversized_downloads_are_dropped(server, monkeypatch):
+    monkeypatch.setattr(image_proxy, "MAX_SOURCE_BYTES", 100)
+    server.responses["https://img.example.com/big"] = FakeResponse(b"x" * 10, {"Content-Length": "1000"})
+    server.responses["https://img.example.com/chunked"] = FakeResponse(b"x" * 1000)
+    server.responses["https://img.example.com/ok"] = FakeResponse(b"x" * 100)
+    assert image_proxy._download("https://img.example.com/big") is None
+    assert image_proxy._download("https://img.example.com/chunked") is None  # 長さがなくても読むのは上限まで
+    assert image_proxy._download("https://img.example.com/ok") == b"x" * 100
+
+
+@pytest.fixture
+def local_server():
+    """127.0.0.1 で待ち受ける HTTP サーバー（受けたリクエストのパスを記録する）"""
+    requested = []
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            requested.append(self.path)
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(b"secret")
+
+        def log_message(self, *args):
+            pass
+
+    httpd = http.server.HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd.server_port, requested
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_dns_rebinding_to_private_address_is_refused(local_server, monkeypatch):
+    port, requested = local_server
+    answers = ["93.184.216.34", "127.0.0.1"]  # 確かめたときは公開アドレス、接続するときは内部のアドレス
+
+    def getaddrinfo(host, port, *args, **kwargs):
+        address = answers.pop(0) if len(answers) > 1 else answers[0]
+        return [(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, "", (address, port))]
+
+    monkeypatch.setattr(image_proxy.socket, "getaddrinfo", getaddrinfo)
+    with pytest.raises(image_proxy.UnsafeImageUrl):
+        image_proxy._download(f"http://rebind.example.com:{port}/a.jpg")
+    assert requested == []
+
+
+def _png(width, height) -> bytes:
+    out = io.BytesIO()
+    Image.new("RGBA", (width, height), (200, 30, 30, 128)).save(out, format="PNG")
+    return out.getvalue()
+
+
+def test_thumbnail_is_a_small_jpeg():
+    thumb = Image.open(io.BytesIO(image_proxy.make_thumbnail(_png(1920, 1080))))
+    assert thumb.format == "JPEG"
+    assert thumb.size == image_proxy.THUMB_SIZE
+
+
+def test_huge_images_are_rejected_before_decoding(monkeypatch):
+    monkeypatch.setattr(image_proxy, "MAX_SOURCE_PIXELS", 100 * 100)
+    with pytest.raises(ValueError):
+        image_proxy.make_thumbnail(_png(101, 100))
@@ -0,0 +1,188 @@
+# ニュースの差分取り込み（publishedAt のカーソルと取り残しの範囲）のテスト
+import random
+import sqlite3
+from datetime import datetime, timezone, timedelta
+import pytest
+import requests
+import fixtures
+import news_api
+
+NOW = datetime(2026, 10, 18, 3, 0, tzinfo=timezone.utc)
+
+
+def _text(seed: int) -> str:
+    # 記事ごとにまったく違う本文にする（似ていると dedupe でまとめられてしまう）
+    rng = random.Random(seed)
+    return "".join(chr(rng.randrange(0x4E00, 0x9FA0)) for _ in range(40))
+
+
+def _articles(count: int, newest: datetime, first: int = 0) -> list[dict]:
+    """1分ごとに1件、newest から古い方へ並んだ記事（first は記事番号の始まり）"""
+    return [
+        {
+            "url": f"https://www.nhk.or.jp/news/{first + i}",
+            "title": _text(first + i),
+            "description": _text(100_000 + first + i),
+            "publishedAt": (newest - timedelta(minutes=i)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        }
+        for i in range(count)
+    ]
+
+
+class FakeNewsApi:
+    """NewsAPI の代わり（from〜to の記事を新しい順に CATEGORY_PAGE_SIZE 件まで返す）"""
+
+    def __init__(self, articles: list[dict]):
+        self.articles = articles
+        self.calls = []
+
+    def __call__(self, api_key, category, from_time, to_time=None):
+        self.calls.append((from_time, to_time))
+        hits = [a for a in self.articles
+                if a["publishedAt"] >= from_time and (to_time is None or a["publishedAt"] <= to_time)]
+        hits.sort(key=lambda a: a["publishedAt"], reverse=True)
+        return hits[:news_api.CATEGORY_PAGE_SIZE]
+
+
+@pytest.fixture(autouse=True)
+def frozen(news_db, clock, monkeypatch):
+    clock.set(NOW)
+    monkeypatch.setattr(news_db, "utc_now", clock.utc)
+
+
+@pytest.fixture
+def api(monkeypatch):
+    def install(articles):
+        fake = FakeNewsApi(articles)
+        monkeypatch.setattr(news_api, "fetch_category_news", fake)
+        return fake
+    return install
+
+
+def _stored_urls(news_store) -> set[str]:
+    conn = sqlite3.connect(news_store.DB_PATH)
+    try:
+        return {url for (url,) in conn.execute("SELECT url FROM articles")}
+    finally:
+        conn.close()
+
+
+def test_first_ingest_reads_back_to_window_start(news_db, clock, api):
+    articles = _articles(120, NOW)
+    fake = api(articles)
+
+    assert news_api.ingest_category("key", "科学") == 120
+    assert _stored_urls(news_db) == {a["url"] for a in articles}
+    assert fake.calls[0] == (news_db.window_start(NOW), None)
+
+    state = news_db.get_ingest_state("科学")
+    assert state["last_published_at"] == articles[0]["publishedAt"]
+    assert state["gap_from"] is None and state["gap_to"] is None
+
+
+def test_next_ingest_starts_after_last_published(news_db, clock, api):
+    fake = api(_articles(10, NOW))
+    news_api.ingest_category("key", "科学")
+
+    clock.set(NOW + news_api.ingest_interval())
+    fake.articles = _articles(3, NOW + timedelta(minutes=3), first=10) + fake.articles
+    fake.calls.clear()
+    assert news_api.ingest_category("key", "科学") == 3
+    # 前回の最新記事の1秒後から読む
+    assert fake.calls == [("2026-10-18T03:00:01Z", None)]
+
+
+def test_ingest_is_skipped_within_interval(news_db, clock, api):
+    fake = api(_articles(5, NOW))
+    news_api.ingest_category("key", "科学")
+    fake.calls.clear()
+
+    clock.set(NOW + news_api.ingest_interval() - timedelta(seconds=1))
+    assert news_api.ingest_category("key", "科学") == 0
+    assert fake.calls == []
+
+
+def test_backlog_beyond_call_budget_is_kept_as_gap(news_db, clock, api):
+    articles = _articles(300, NOW)
+    fake = api(articles)
+
+    news_api.ingest_category("key", "科学")
+    assert len(fake.calls) == news_api.MAX_CALLS_PER_INGEST
+    state = news_db.get_ingest_state("科学")
+    # 最新の記事まで進めても、読み切れなかった古い範囲は取り残しとして残る
+    assert state["last_published_at"] == articles[0]["publishedAt"]
+    assert state["gap_from"] == news_db.window_start(NOW)
+    assert state["gap_to"] is not None
+    assert len(_stored_urls(news_db)) < len(articles)
+
+    # 新着がなくても、次の取り込みで取り残しを続きから読む
+    clock.set(NOW + news_api.ingest_interval())
+    news_api.ingest_category("key", "科学")
+    assert _stored_urls(news_db) == {a["url"] for a in articles}
+    state = news_db.get_ingest_state("科学")
+    assert state["gap_from"] is None and state["gap_to"] is None
+
+
+def test_page_filled_with_one_timestamp_still_moves_back(news_db, clock, api):
+    same = NOW.strftime("%Y-%m-%dT%H:%M:%SZ")
+    articles = [dict(a, publishedAt=same) for a in _articles(news_api.CATEGORY_PAGE_SIZE, NOW)]
+    articles += _articles(5, NOW - timedelta(hours=1), first=news_api.CATEGORY_PAGE_SIZE)
+    fake = api(articles)
+
+    news_api.ingest_category("key", "科学")
+    # 同じ時刻の記事で1ページが埋まっても、1秒前に進めて古い記事を読む
+    assert fake.calls[1][1] == same
+    assert fake.calls[2][1] == "2026-10-18T02:59:59Z"
+    assert {a["url"] for a in articles[-5:]} <= _stored_urls(news_db)
+
+
+def test_replay_uses_a_separate_store(news_db, clock, monkeypatch):
+    live = _articles(1, NOW)
+    news_db.save_articles("環境", live)
+
+    monkeypatch.setattr(fixtures, "MODE", "replay")
+    assert news_db.load_articles(["環境"])["環境"] == []  # 実際の DB の記事は混ざらない
+    news_db.save_articles("環境", _articles(2, NOW, first=500))
+    news_db.update_ingest_state("環境", NOW.strftime(news_db.TIME_FORMAT))
+    assert len(news_db.load_articles(["環境"])["環境"]) == 2
+
+    monkeypatch.setattr(fixtures, "MODE", "live")
+    assert _stored_urls(news_db) == {live[0]["url"]}
+    assert news_db.get_ingest_state("環境")["last_ingested_at"] is None
+
+
+def test_ingest_interval_fits_daily_quota(monkeypatch):
+    monkeypatch.delenv("QUOTA_NEWSAPI_PER_DAY", raising=False)
+    interval = news_api.ingest_interval()
+    assert timedelta(hours=2.5) < interval < timedelta(hours=3)
+    # 全ジャンルを間隔どおりに取り込んでも1日の上限を超えない
+    assert len(news_api.CATEGORY_LIST) * timedelta(days=1) / interval <= 100
+
+    monkeypatch.setenv("QUOTA_NEWSAPI_PER_DAY", "1200")
+    assert news_api.ingest_interval() == timedelta(hours=0.24)
+
+
+def test_news_get_only_reads_the_store(news_db, clock, api, monkeypatch):
+    fake = api(_articles(5, NOW))
+    started = []
+    monkeypatch.setattr(news_api, "start_ingester", started.append)
+    news_api.ingest_category("key", "科学")
+    fake.calls.clear()
+
+    clock.set(NOW + news_api.ingest_interval())  # 取り込みの時刻が来ていても、表示では API を呼ばない
+    articles = news_api.news_get("key", ["科学", "科学"], limit=3)
+    assert len(articles) == 3
+    assert fake.calls == []
+    assert started == ["key"]
+
+
+def test_ingest_all_keeps_going_after_a_failure(news_db, clock, monkeypatch):
+    def fetch(api_key, category, from_time, to_time=None):
+        if category == "政治":
+            raise requests.ConnectionError("down")
+        return _articles(1, NOW, first=len(category))
+
+    monkeypatch.setattr(news_api, "fetch_category_news", fetch)
+    assert news_api.ingest_all("key", ["政治", "科学"]) == ["政治"]
+    assert news_db.get_ingest_state("科学")["last_ingested_at"] is not None
+    assert news_db.get_ingest_state("政治")["last_ingested_at"] is None
@@ -0,0 +1,63 @@
+# payloads.project（スキーマに書いた項目だけを残す）のテスト
+import pytest
+import payloads
+
+
+def test_true_keeps_the_value_as_is():
+    value = {"a": 1}
+    assert payloads.project(value, None) is value
+    assert payloads.project(value, True) is value
+
+
+def test_dict_keeps_only_listed_keys():
+    schema = {"main": {"temp": True}, "name": True}
+    value = {"main": {"temp": 18.3, "humidity": 62}, "name": "東京都", "cod": 200}
+    assert payloads.project(value, schema) == {"main": {"temp": 18.3}, "name": "東京都"}
+    # 無いキーは足さない
+    assert payloads.project({"cod": 200}, schema) == {}
+
+
+def test_list_applies_the_schema_to_each_item():
+    schema = {"list": [{"dt": True, "weather": [{"icon": True}]}]}
+    value = {"list": [
+        {"dt": 1, "weather": [{"icon": "10d", "id": 500}], "pop": 0.4},
+        {"dt": 2, "weather": []},
+    ]}
+    assert payloads.project(value, schema) == {"list": [
+        {"dt": 1, "weather": [{"icon": "10d"}]},
+        {"dt": 2, "weather": []},
+    ]}
+
+
+def test_star_applies_the_schema_to_every_key():
+    schema = {"horoscope": {"*": [{"sign": True, "rank": True}]}}
+    value = {"horoscope": {
+        "2024/05/01": [{"sign": "牡羊座", "rank": 1, "content": "..."}],
+        "2024/05/02": [{"sign": "牡牛座", "rank": 2, "day": "2024/05/02"}],
+    }}
+    assert payloads.project(value, schema) == {"horoscope": {
+        "2024/05/01": [{"sign": "牡羊座", "rank": 1}],
+        "2024/05/02": [{"sign": "牡牛座", "rank": 2}],
+    }}
+    assert payloads.project({"a": {"b": 1}}, {"*": True}) == {"a": {"b": 1}}
+
+
+def test_values_of_a_different_shape_are_left_as_is():
+    # API がエラーなどで違う形を返しても、落ちずにそのまま返す
+    schema = {"main": {"temp": True}, "list": [{"dt": True}], "rain": {"*": {"3h": True}}}
+    value = {"main": None, "list": "error", "rain": [1, 2]}
+    assert payloads.project(value, schema) == value
+    assert payloads.project([1, 2], schema) == [1, 2]
+    assert payloads.project({"list": [1, {"dt": 3, "x": 4}]}, schema) == {"list": [1, {"dt": 3}]}
+
+
+def test_projection_returns_a_new_object():
+    value = {"main": {"temp": 18.3, "humidity": 62}}
+    projected = payloads.project(value, {"main": {"temp": True}})
+    projected["main"]["temp"] = 0
+    assert value["main"]["temp"] == 18.3
+
+
+def test_unknown_schema_is_rejected():
+    with pytest.raises(ValueError):
+        payloads.compile_schema("temp")
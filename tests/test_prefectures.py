@@ -0,0 +1,29 @@
+# 都道府県の引き方のテスト
+import pytest
+import prefectures
+
+
+@pytest.mark.parametrize("key, name", [
+    ("神奈川県", "神奈川県"),
+    ("神奈川", "神奈川県"),
+    ("Kanagawa", "神奈川県"),   # 都道府県名のローマ字
+    ("Yokohama", "神奈川県"),   # 県庁所在地のローマ字
+    ("hokkaido", "北海道"),
+    ("Aichi", "愛知県"),
+    (" Nagoya ", "愛知県"),
+    ("130010", "東京都"),
+])
+def test_lookup(key, name):
+    assert prefectures.lookup(key).name == name
+
+
+def test_unknown_key_is_none():
+    assert prefectures.lookup("Atlantis") is None
+    assert prefectures.lookup("") is None
+
+
+def test_every_key_points_to_one_prefecture():
+    # ローマ字名が別の県の名前と重なっていない
+    for p in prefectures.PREFECTURES:
+        for key in (p.name, p.short_name, p.romaji, p.city, p.area_code):
+            assert prefectures.lookup(key) is p
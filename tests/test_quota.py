@@ -0,0 +1,101 @@
+# quota.governed（トークンバケットと「最後に成功した値」）のテスト
+import pytest
+import fixtures
+
+
+@pytest.fixture
+def quota(quota_db, clock, monkeypatch):
+    # 1日20回 → バケツの容量 5、予備 1
+    monkeypatch.setenv("QUOTA_JUGEMKEY_PER_DAY", "20")
+    clock.use(quota_db)
+    return quota_db
+
+
+def _counting(quota, lkg=True):
+    calls = []
+
+    @quota.governed("jugemkey", "horoscope", lkg=lkg)
+    def fetch(day):
+        calls.append(day)
+        return {"day": day, "n": len(calls)}
+
+    return fetch, calls
+
+
+def test_daily_limit_can_be_overridden(quota, monkeypatch):
+    assert quota.daily_limit("jugemkey") == 20
+    monkeypatch.delenv("QUOTA_JUGEMKEY_PER_DAY")
+    assert quota.daily_limit("jugemkey") == quota.DAILY_LIMITS["jugemkey"]
+
+
+def test_calls_through_while_budget_lasts(quota):
+    fetch, calls = _counting(quota)
+    for i in range(4):
+        assert fetch(f"d{i}") == {"day": f"d{i}", "n": i + 1}
+    assert len(calls) == 4
+    assert quota.usage_summary()[0]["calls"] == 4
+
+
+def test_returns_last_known_good_when_reserve_is_reached(quota):
+    fetch, calls = _counting(quota)
+    first = fetch("today")
+    for i in range(3):
+        fetch(f"other{i}")
+    # 予備だけが残っているので、保存済みの値があれば API を呼ばない
+    assert fetch("today") == first
+    assert len(calls) == 4
+
+
+def test_reserve_is_spent_only_without_cache(quota):
+    fetch, calls = _counting(quota)
+    for i in range(4):
+        fetch(f"d{i}")
+    assert fetch("new")["n"] == 5  # キャッシュがないので予備のトークンを使う
+    with pytest.raises(quota.QuotaExceeded):
+        fetch("newer")
+    assert len(calls) == 5
+
+
+def test_lkg_false_never_serves_cache(quota):
+    fetch, calls = _counting(quota, lkg=False)
+    for _ in range(5):
+        fetch("today")
+    with pytest.raises(quota.QuotaExceeded):
+        fetch("today")
+    assert quota.load_last_known_good(quota._lkg_key("horoscope", ("today",), {})) is None
+
+
+def test_tokens_refill_over_the_day(quota, clock):
+    fetch, calls = _counting(quota, lkg=False)
+    for i in range(5):
+        fetch(f"d{i}")
+    with pytest.raises(quota.QuotaExceeded):
+        fetch("later")
+    # 1日20回 → 4320 秒で1つ補充される
+    clock.now += 86400 / 20
+    fetch("later")
+    assert calls[-1] == "later"
+
+
+def test_replay_is_not_counted(quota, monkeypatch):
+    fetch, calls = _counting(quota, lkg=False)
+    monkeypatch.setattr(fixtures, "MODE", "replay")
+    for i in range(10):
+        fetch(f"d{i}")
+    assert len(calls) == 10
+    assert quota.usage_summary() == []
+
+
+def test_executor_calls_are_recorded_for_the_caller(quota):
+    from concurrent.futures import ThreadPoolExecutor
+    fetch, _ = _counting(quota)
+    quota._attributed.user = "user-1"  # ログイン中のセッションの代わり
+    try:
+        wrapped = quota.as_current_user(fetch)
+    finally:
+        quota._attributed.user = None
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        executor.submit(wrapped, "today").result()
+        executor.submit(fetch, "other").result()
+    users = {row["user"]: row["calls"] for row in quota.usage_summary()}
+    assert users == {"user-1": 1, "anonymous": 1}
@@ -0,0 +1,92 @@
+# BM25 + ジャンル + 新しさ による記事の並べ替えのテスト
+from datetime import datetime, timezone
+import numpy as np
+import pytest
+import news_api
+import ranking
+
+NOW = datetime(2026, 10, 18, 3, 0, tzinfo=timezone.utc)
+
+
+def _article(n: int, title: str, description: str = "", published: str = "2026-10-18T02:00:00Z") -> dict:
+    return {"url": f"https://www.itmedia.co.jp/{n}", "title": title,
+            "description": description, "publishedAt": published}
+
+
+def test_tokenize_uses_character_bigrams():
+    assert ranking.tokenize("半導体") == ["半導", "導体"]
+    assert ranking.tokenize("Ａ") == ["a"]
+    assert ranking.tokenize("") == []
+
+
+def test_query_terms_include_category_keywords():
+    weights = ranking.query_terms(["テクノロジー"])
+    assert "半導" in weights and "ai" in weights
+    # 同じ語が複数のジャンルに出てくれば重みが増える
+    assert ranking.query_terms(["科学", "教育"])["大学"] == 2
+
+
+def test_bm25_prefers_more_matches_rare_terms_and_short_docs():
+    # 記事3件 × 検索語2つ（0列目はよく出る語、1列目は珍しい語）
+    tf = np.array([[1, 0], [3, 0], [0, 1]], dtype=float)
+    df = np.array([3, 1], dtype=float)
+    doc_len = np.array([10, 10, 10], dtype=float)
+    scores = ranking.bm25_scores(tf, df, 3, doc_len, 10.0, np.ones(2))
+    assert scores[1] > scores[0]  # 出現回数が多い
+    assert scores[2] > scores[0]  # 同じ1回でも珍しい語の方が高い
+
+    long_doc = ranking.bm25_scores(tf[:1], df, 3, np.array([40.0]), 10.0, np.ones(2))
+    assert long_doc[0] < scores[0]  # 長い記事の1回は薄める
+
+
+def _scores(news_db, articles, memberships, categories):
+    news_db.save_articles(categories[0], articles)
+    stats = news_db.load_term_stats([a["url"] for a in articles], list(ranking.query_terms(categories)))
+    return ranking.score_articles(articles, memberships, categories, stats, now=NOW)
+
+
+@pytest.fixture
+def store(news_db, monkeypatch):
+    monkeypatch.setattr(news_db, "utc_now", lambda: NOW)
+    return news_db
+
+
+def test_relevant_article_ranks_first(store):
+    articles = [
+        _article(1, "週末の天気は晴れ、行楽日和に", "各地で気温が上がり、紅葉狩りに出かける人が増えそうだ。"),
+        _article(2, "半導体メーカーがAI向け新工場", "生成AIの需要拡大を受け、最先端の半導体を量産する。"),
+    ]
+    scores = _scores(store, articles, [1, 1], ["テクノロジー"])
+    assert scores.argmax() == 1
+    assert np.all((scores >= 0) & (scores <= 1))
+
+
+def test_newer_article_wins_when_text_and_category_tie(store):
+    # どちらも「エンタメ」の検索語を含まないので、本文の関連度は 0 でそろう
+    articles = [
+        _article(1, "週末の天気は晴れ", "各地で気温が上がりそうだ。", published="2026-10-16T03:00:00Z"),
+        _article(2, "秋の味覚、さんまが豊漁", "港では水揚げが続いている。", published="2026-10-18T02:00:00Z"),
+    ]
+    scores = _scores(store, articles, [1, 1], ["エンタメ"])
+    assert scores[1] > scores[0]
+    # 48時間前の記事の新しさは 1/4 になる
+    assert scores[0] == pytest.approx(ranking.CATEGORY_WEIGHT + ranking.RECENCY_WEIGHT * 0.25)
+
+
+def test_article_in_more_selected_categories_ranks_higher(store):
+    articles = [
+        _article(1, "大学の研究チームが新素材を発見"),
+        _article(2, "大学の研究チームが新薬を発見"),
+    ]
+    scores = _scores(store, articles, [1, 2], ["科学", "教育"])
+    assert scores[1] > scores[0]
+
+
+def test_merge_collapses_duplicates_after_ranking(store):
+    body = "生成AIの需要拡大を受け、半導体メーカーが最先端の工場を熊本に建設すると発表した。投資額は1兆円規模になる。"
+    first = _article(1, "半導体メーカーがAI向け新工場", body)
+    copy = _article(2, "半導体メーカーがAI向け新工場 - ITmedia", body)
+    other = _article(3, "週末の天気は晴れ", "各地で気温が上がりそうだ。")
+    store.save_articles("テクノロジー", [first, other])
+    merged = news_api.merge_category_news({"テクノロジー": [first, copy, other]}, limit=10)
+    assert [a["url"] for a in merged] == [first["url"], other["url"]]
@@ -0,0 +1,322 @@
+# 設定の変更検出、裏での書き込み（まとめ・書き直し）、読み込みの順番のテスト
+import queue
+import threading
+import pytest
+import settings_store
+
+USER = "user-1"
+
+
+def _settings(**changes) -> dict:
+    settings = {"email": "a@example.com", "birth_year": 1990, "birth_month": 10, "birth_day": 24,
+                "home_pref": "東京都", "work_pref": "神奈川県", "categories": ["科学", "経済"]}
+    settings.update(changes)
+    return settings
+
+
+def _broken(uid, fields):
+    raise ConnectionError("down")
+
+
+@pytest.fixture
+def writes():
+    """書き込んだ (auth_user_id, 列) の記録"""
+    return []
+
+
+@pytest.fixture
+def store(writes, monkeypatch):
+    """書き込みは writes に記録する（Supabase は呼ばない）。待ち行列と状態はテストごとに新しくする"""
+    monkeypatch.setattr(settings_store, "_queue", queue.Queue(maxsize=settings_store.MAX_PENDING))
+    monkeypatch.setattr(settings_store, "_pending", {})
+    monkeypatch.setattr(settings_store, "_failed", {})
+    monkeypatch.setattr(settings_store, "_overflow", set())
+    monkeypatch.setattr(settings_store, "RETRY_DELAY", 0)
+    monkeypatch.setattr(settings_store, "FAILED_RETRY_DELAY", 3600)
+    monkeypatch.setattr(settings_store, "_write", lambda uid, fields: writes.append((uid, dict(fields))))
+    return settings_store
+
+
+def test_dirty_fields_tracks_changes_since_last_save():
+    state = {"settings": _settings()}
+    assert set(settings_store.dirty_fields(state)) == set(settings_store.FIELDS) | {"zodiac_sign"}
+
+    settings_store.mark_saved(state)
+    assert settings_store.dirty_fields(state) == {}
+
+    state["settings"]["home_pref"] = "大阪府"
+    assert settings_store.dirty_fields(state) == {"home_pref": "大阪府"}
+
+    # 誕生日が変われば星座の列も書く
+    state["settings"]["birth_day"] = 22
+    assert settings_store.dirty_fields(state) == {"home_pref": "大阪府", "birth_day": 22, "zodiac_sign": "天秤座"}
+
+
+def test_categories_are_compared_as_json():
+    state = {"settings": _settings()}
+    settings_store.mark_saved(state)
+    state["settings"]["categories"] = ["科学", "経済"]  # 別のリストでも中身が同じなら変更なし
+    assert settings_store.dirty_fields(state) == {}
+    state["settings"]["categories"].append("教育")
+    assert settings_store.dirty_fields(state) == {"categories": '["科学", "経済", "教育"]'}
+
+
+def test_row_round_trip():
+    settings = _settings()
+    row = settings_store.to_row(settings)
+    assert row["zodiac_sign"] == "蠍座"
+    assert settings_store.from_row({"email": settings["email"], **row}) == settings
+
+
+def test_unchanged_settings_are_not_written(store, writes):
+    state = {"settings": _settings()}
+    store.mark_saved(state)
+    assert store.persist(state, USER) is False
+    assert store.flush(1)
+    assert writes == []
+
+
+def test_only_changed_columns_are_written(store, writes):
+    state = {"settings": _settings()}
+    store.mark_saved(state)
+    state["settings"]["work_pref"] = "千葉県"
+    assert store.persist(state, USER) is True
+    assert store.flush(5)
+    assert writes == [(USER, {"work_pref": "千葉県"})]
+    assert store.status(USER) == "saved"
+    # 保存したので、もう一度呼んでも書かない
+    assert store.persist(state, USER) is False
+
+
+def test_changes_made_while_writing_are_merged_into_one_upsert(store, monkeypatch, writes):
+    started, release = threading.Event(), threading.Event()
+
+    def slow_write(uid, fields):
+        writes.append((uid, dict(fields)))
+        started.set()
+        release.wait(5)
+
+    monkeypatch.setattr(store, "_write", slow_write)
+    state = {"settings": _settings()}
+    store.mark_saved(state)
+
+    state["settings"]["home_pref"] = "大阪府"
+    store.persist(state, USER)
+    assert started.wait(5)
+    # 1回目の書き込み中に2回変更しても、2回目の書き込みは1回にまとまる
+    state["settings"]["home_pref"] = "京都府"
+    store.persist(state, USER)
+    state["settings"]["categories"] = ["教育"]
+    store.persist(state, USER)
+    assert store.status(USER) == "pending"
+    release.set()
+
+    assert store.flush(5)
+    assert writes == [
+        (USER, {"home_pref": "大阪府"}),
+        (USER, {"home_pref": "京都府", "categories": '["教育"]'}),
+    ]
+
+
+def test_full_queue_leaves_the_write_to_the_writer(store, monkeypatch, writes):
+    started, release = threading.Event(), threading.Event()
+
+    def slow_write(uid, fields):
+        writes.append((uid, dict(fields)))
+        started.set()
+        release.wait(5)
+
+    monkeypatch.setattr(store, "_write", slow_write)
+    monkeypatch.setattr(store, "_queue", queue.Queue(maxsize=1))
+    states = {uid: {"settings": _settings()} for uid in ("a", "b", "c")}
+    for uid, state in states.items():
+        store.mark_saved(state)
+        state["settings"]["home_pref"] = "大阪府"
+
+    store.persist(states["a"], "a")
+    assert started.wait(5)  # a を書いている間に、b で待ち行列が埋まる
+    store.persist(states["b"], "b")
+    store.persist(states["c"], "c")
+    # あふれた c もその場では書かず、書き込み待ちに残る
+    assert [uid for uid, _ in writes] == ["a"]
+    assert store.status("c") == "pending"
+
+    release.set()
+    assert store.flush(5)
+    assert sorted(uid for uid, _ in writes) == ["a", "b", "c"]
+    assert store.status("c") == "saved"
+
+
+def test_failed_write_is_retried_later(store, monkeypatch, writes):
+    monkeypatch.setattr(store, "_write", _broken)
+    state = {"settings": _settings()}
+    store.mark_saved(state)
+    state["settings"]["home_pref"] = "大阪府"
+    store.persist(state, USER)
+    assert store.flush(5)
+    assert store.status(USER) == "failed"
+
+    # 書き直しの時刻までは書かない
+    store._retry_failed()
+    assert store.status(USER) == "failed"
+
+    monkeypatch.setattr(store, "_write", lambda uid, fields: writes.append((uid, dict(fields))))
+    store._retry_failed(force=True)
+    assert store.status(USER) == "saved"
+    assert writes == [(USER, {"home_pref": "大阪府"})]
+
+
+def test_failed_fields_are_sent_with_the_next_change(store, monkeypatch, writes):
+    monkeypatch.setattr(store, "_write", _broken)
+    state = {"settings": _settings()}
+    store.mark_saved(state)
+    state["settings"]["home_pref"] = "大阪府"
+    store.persist(state, USER)
+    assert store.flush(5)
+    assert store.status(USER) == "failed"
+
+    monkeypatch.setattr(store, "_write", lambda uid, fields: writes.append((uid, dict(fields))))
+    state["settings"]["work_pref"] = "千葉県"
+    store.persist(state, USER)
+    assert store.flush(5)
+    assert writes == [(USER, {"home_pref": "大阪府", "work_pref": "千葉県"})]
+    assert store.status(USER) == "saved"
+
+
+def test_retry_delay_doubles_on_each_failure(store, clock, monkeypatch):
+    monkeypatch.setattr(store, "_write", _broken)
+    monkeypatch.setattr(store, "FAILED_RETRY_DELAY", 10)
+    clock.set(1000.0)
+    clock.use(store)
+
+    store._pending[USER] = {"home_pref": "大阪府"}
+    store._flush_user(USER)
+    assert store._failed[USER][1:] == (1010.0, 1)
+    store._retry_failed(force=True)
+    assert store._failed[USER][1:] == (1020.0, 2)
+
+
+
+@pytest.fixture
+def fetches(monkeypatch):
+    """DB からの読み込み（get_user_settings）の代わり。呼ばれた auth_user_id を記録する"""
+    calls = []
+    row = {"email": "a@example.com", **settings_store.to_row(_settings())}
+
+    def fetch(uid):
+        calls.append(uid)
+        return dict(row) if uid == USER else None
+
+    monkeypatch.setattr(settings_store, "_fetch", fetch)
+    return calls
+
+
+def test_login_metadata_is_used_without_db(fetches):
+    state = {}
+    metadata = {"settings": {**settings_store.to_row(_settings(home_pref="大阪府")), "email": "a@example.com"}}
+    assert settings_store.load(state, USER, metadata)["home_pref"] == "大阪府"
+    assert fetches == []
+
+
+def test_metadata_wins_over_session_cache(fetches):
+    state = {}
+    settings_store.load(state, USER)
+    # 別の端末で変えた設定は、次のログインの user_metadata に入っている
+    metadata = {"settings": settings_store.to_row(_settings(work_pref="千葉県"))}
+    assert settings_store.load(state, USER, metadata)["work_pref"] == "千葉県"
+    assert settings_store.load(state, USER)["work_pref"] == "千葉県"
+    assert fetches == [USER]
+
+
+def test_session_cache_is_per_user_and_invalidated_on_sign_out(fetches):
+    state = {}
+    assert settings_store.load(state, USER)["categories"] == ["科学", "経済"]
+    settings_store.load(state, USER)
+    assert fetches == [USER]
+
+    assert settings_store.load(state, "someone-else") is None
+    settings_store.invalidate(state)
+    settings_store.load(state, USER)
+    assert fetches == [USER, "someone-else", USER]
+
+
+def test_loaded_settings_are_copies(fetches):
+    state = {}
+    settings = settings_store.load(state, USER)
+    settings["home_pref"] = "沖縄県"
+    assert settings_store.load(state, USER)["home_pref"] == "東京都"
+
+
+def test_persist_refreshes_session_cache(store, fetches):
+    state = {}
+    state["settings"] = settings_store.load(state, USER)
+    settings_store.mark_saved(state)
+    state["settings"]["home_pref"] = "大阪府"
+    settings_store.persist(state, USER)
+    # 書き込みが終わる前に読んでも新しい値
+    assert settings_store.load(state, USER)["home_pref"] == "大阪府"
+    assert fetches == [USER]
+    assert settings_store.flush(5)
+
+
+class _FakeClient:
+    """db.supabase の代わり。rpc と select の結果を差し替え、呼ばれたメソッドを記録する"""
+
+    def __init__(self):
+        self.calls = []
+        self.rpc_data = None
+        self.select_data = {"email": "b@example.com"}
+        self.data = None
+
+    def rpc(self, name, params):
+        self.calls.append(("rpc", name, params))
+        self.data = self.rpc_data
+        return self
+
+    def table(self, name):
+        self.calls.append(("table", name))
+        self.data = self.select_data
+        return self
+
+    def select(self, columns):
+        return self
+
+    def eq(self, column, value):
+        self.calls.append(("eq", column, value))
+        return self
+
+    def maybe_single(self):
+        return self
+
+    def execute(self):
+        if isinstance(self.data, Exception):
+            raise self.data
+        return self
+
+
+@pytest.fixture
+def supabase(monkeypatch):
+    import sys
+    import types
+    client = _FakeClient()
+    monkeypatch.setitem(sys.modules, "db", types.SimpleNamespace(supabase=client))
+    return client
+
+
+def test_fetch_passes_the_user_to_the_rpc(supabase):
+    supabase.rpc_data = {"auth_user_id": USER, "email": "a@example.com"}
+    assert settings_store._fetch(USER)["email"] == "a@example.com"
+    assert supabase.calls == [("rpc", "get_user_settings", {"p_auth_user_id": USER})]
+
+
+def test_fetch_ignores_another_users_row(supabase):
+    # 共有のクライアントが別のユーザーでログインしていたときは、auth_user_id で直接読む
+    supabase.rpc_data = {"auth_user_id": "someone-else", "email": "x@example.com"}
+    assert settings_store._fetch(USER)["email"] == "b@example.com"
+    assert ("eq", "auth_user_id", USER) in supabase.calls
+
+
+def test_fetch_falls_back_to_select_on_rpc_error(supabase):
+    supabase.rpc_data = PermissionError("auth_user_id does not match")
+    assert settings_store._fetch(USER)["email"] == "b@example.com"
+    assert ("eq", "auth_user_id", USER) in supabase.calls
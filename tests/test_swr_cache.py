@@ -0,0 +1,97 @@
+# stale-while-revalidate キャッシュのテスト
+import time
+import threading
+import pytest
+import swr_cache as swr
+
+
+@pytest.fixture(autouse=True)
+def frozen(clock):
+    clock.use(swr)
+
+
+def _counting(**options):
+    calls = []
+
+    @swr.swr_cache(**options)
+    def fetch(pref):
+        calls.append(pref)
+        return {"pref": pref, "n": len(calls), "items": [1, 2]}
+
+    return fetch, calls
+
+
+def test_ttl_or_expires_is_required():
+    with pytest.raises(ValueError):
+        swr.swr_cache()
+    with pytest.raises(ValueError):
+        swr.swr_cache(ttl=10, expires=lambda now: now)
+
+
+def test_fresh_value_is_served_from_cache(clock):
+    fetch, calls = _counting(ttl=60)
+    assert fetch("東京都")["n"] == 1
+    clock.now += 59
+    assert fetch("東京都")["n"] == 1
+    assert fetch(pref="東京都")["n"] == 2  # 引数の渡し方が違えば別のキー
+    clock.now += 1
+    assert fetch("東京都")["n"] == 3
+
+
+def test_stale_value_is_returned_while_refreshing_once(clock):
+    release = threading.Event()
+    calls = []
+
+    @swr.swr_cache(ttl=60, max_stale=600)
+    def fetch(pref):
+        if calls:
+            release.wait(5)  # 裏での取り直しを止めておく
+        calls.append(pref)
+        return len(calls)
+
+    assert fetch("東京都") == 1
+    clock.now += 120
+    # 期限切れでも古い値をすぐ返し、取り直しは1回だけ
+    assert [fetch("東京都") for _ in range(5)] == [1] * 5
+    release.set()
+    deadline = time.monotonic() + 5
+    while fetch("東京都") == 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert fetch("東京都") == 2
+    assert len(calls) == 2
+
+
+def test_too_old_value_is_fetched_inline(clock):
+    fetch, calls = _counting(ttl=60, max_stale=600)
+    fetch("東京都")
+    clock.now += 60 + 600
+    assert fetch("東京都")["n"] == 2
+
+
+def test_callers_get_independent_copies(clock):
+    fetch, _ = _counting(ttl=60)
+    first = fetch("東京都")
+    first["items"].append(3)
+    assert fetch("東京都")["items"] == [1, 2]
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    fetch, calls = _counting(ttl=60, max_entries=2)
+    fetch("東京都")
+    fetch("大阪府")
+    fetch("東京都")
+    fetch("京都府")  # 一番使われていない大阪府が捨てられる
+    fetch("東京都")
+    fetch("大阪府")
+    assert calls == ["東京都", "大阪府", "京都府", "大阪府"]
+
+
+def test_expires_uses_fetch_time(clock):
+    fetch, calls = _counting(expires=lambda now: (now // 600 + 1) * 600)
+    clock.now = 1_800_000_500.0
+    fetch("東京都")
+    clock.now = 1_800_000_599.0
+    fetch("東京都")
+    clock.now = 1_800_000_600.0
+    fetch("東京都")
+    assert len(calls) == 2
@@ -0,0 +1,70 @@
+# 天気のスナップショット（同じ県を同時に取りに行かない）のテスト
+import threading
+import pytest
+import weather
+from prefectures import PREF_NAMES
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """tsukumijima の代わり。release を set するまで返さず、呼ばれた県を記録する"""
+    calls = []
+    release = threading.Event()
+    lock = threading.Lock()
+
+    def fetch(pref):
+        with lock:
+            calls.append(pref)
+        release.wait(5)
+        return {"pref": pref}
+
+    monkeypatch.setattr(weather, "_snapshots", {})
+    monkeypatch.setattr(weather, "_in_flight", {})
+    monkeypatch.setattr(weather, "fetch_forecast_json", fetch)
+    monkeypatch.setattr(weather, "normalize_tsukumijima", lambda weather_json: [])
+    monkeypatch.setattr(weather.forecast_history, "record_daily", lambda *args: 0)
+    return calls, release
+
+
+def test_concurrent_requests_share_one_fetch(upstream):
+    calls, release = upstream
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(weather.forecast_json("東京都"))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert calls == ["東京都"]
+    assert results == [{"pref": "東京都"}] * 5
+
+
+def test_cold_start_fetches_each_prefecture_once(upstream):
+    # 起動直後にバックグラウンドの更新と全国の一覧の取得が重なっても、1県1回
+    calls, release = upstream
+    refresher = threading.Thread(target=weather.refresh_all, kwargs={"only_expired": True})
+    refresher.start()
+    fanout = [threading.Thread(target=weather.forecast_json, args=(pref,)) for pref in PREF_NAMES]
+    for thread in fanout:
+        thread.start()
+    release.set()
+    for thread in fanout + [refresher]:
+        thread.join(5)
+    assert sorted(calls) == sorted(PREF_NAMES)
+
+
+def test_failure_is_shared_and_not_cached(upstream, monkeypatch):
+    calls, release = upstream
+    release.set()
+
+    def broken(pref):
+        calls.append(pref)
+        raise ConnectionError("down")
+
+    monkeypatch.setattr(weather, "fetch_forecast_json", broken)
+    with pytest.raises(ConnectionError):
+        weather.forecast_json("東京都")
+    with pytest.raises(ConnectionError):
+        weather.forecast_json("東京都")
+    assert calls == ["東京都", "東京都"]
+    assert weather._in_flight == {}
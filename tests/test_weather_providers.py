@@ -0,0 +1,150 @@
+# 天気の取得元の順番・切り替え・ヘッジのテスト
+import time
+import threading
+import pytest
+import requests
+import weather_providers as wp
+
+DAILY = [{"dt": 1_792_249_200.0, "temp": {"max": 20.0, "min": 12.0}, "pop": 0.2}]
+
+
+@pytest.fixture
+def providers(monkeypatch):
+    """取得元を差し替える（名前 → 関数）。記録は予報履歴に書かない"""
+    fakes = {"tsukumijima": lambda pref: DAILY, "openweather": lambda pref: DAILY}
+    monkeypatch.setattr(wp, "PROVIDERS", {name: lambda pref, name=name: fakes[name](pref) for name in fakes})
+    monkeypatch.setattr(wp, "STATS", {name: wp.ProviderStats() for name in fakes})
+    monkeypatch.setattr(wp, "BATCH_PROVIDERS", {})  # まとめての取得は test_openweather_batch_* で見る
+    monkeypatch.setattr(wp, "PRIMARY", "openweather")
+    monkeypatch.setattr(wp.weather_api, "get_api_key", lambda: "key")
+    monkeypatch.setattr(wp.forecast_history, "record_daily", lambda *args: 0)
+    return fakes
+
+
+def _fail(stats, times=wp.MIN_SAMPLES):
+    for _ in range(times):
+        stats.record(0.1, ok=False)
+
+
+def test_primary_comes_first(providers, monkeypatch):
+    assert wp.available_providers() == ["openweather", "tsukumijima"]
+    monkeypatch.setattr(wp, "PRIMARY", "tsukumijima")
+    assert wp.available_providers() == ["tsukumijima", "openweather"]
+
+
+def test_openweather_is_skipped_without_api_key(providers, monkeypatch):
+    monkeypatch.setattr(wp.weather_api, "get_api_key", lambda: None)
+    assert wp.available_providers() == ["tsukumijima"]
+
+
+def test_primary_is_not_demoted_on_too_few_samples(providers):
+    _fail(wp.STATS["openweather"], wp.MIN_SAMPLES - 1)
+    assert wp.available_providers()[0] == "openweather"
+
+
+def test_failing_primary_is_demoted_for_a_while(providers, clock):
+    clock.use(wp)
+    _fail(wp.STATS["openweather"])
+    assert wp.available_providers() == ["tsukumijima", "openweather"]
+
+    # しばらく記録がなければ、もう一度 PRIMARY から試す
+    clock.now += wp.DEMOTE_FOR
+    assert wp.available_providers()[0] == "openweather"
+
+
+def test_primary_is_kept_when_the_other_is_worse(providers):
+    _fail(wp.STATS["openweather"])
+    _fail(wp.STATS["tsukumijima"])
+    assert wp.available_providers()[0] == "openweather"
+
+
+def test_failover_to_second_provider(providers):
+    def broken(pref):
+        raise requests.ConnectionError("down")
+
+    providers["openweather"] = broken
+    daily = wp.get_daily_forecast("東京都")
+    assert [d["provider"] for d in daily] == ["tsukumijima"]
+    assert wp.STATS["openweather"].error_rate() == 1.0
+
+
+def test_all_providers_failing_raises_last_error(providers):
+    def broken(pref):
+        raise requests.ConnectionError(pref)
+
+    providers["openweather"] = providers["tsukumijima"] = broken
+    with pytest.raises(requests.ConnectionError):
+        wp.get_daily_forecast("東京都")
+
+
+def test_slow_primary_is_hedged(providers, monkeypatch):
+    release = threading.Event()
+
+    def slow(pref):
+        release.wait(5)
+        return DAILY
+
+    providers["openweather"] = slow
+    monkeypatch.setattr(wp, "DEFAULT_P95", 0.05)
+    monkeypatch.setattr(wp, "MIN_HEDGE_DELAY", 0.05)
+    try:
+        start = time.monotonic()
+        daily = wp.get_daily_forecast("東京都")
+        assert daily[0]["provider"] == "tsukumijima"
+        assert time.monotonic() - start < 2
+    finally:
+        release.set()
+
+
+def test_same_prefecture_is_fetched_once(providers):
+    calls = []
+    providers["openweather"] = lambda pref: calls.append(pref) or DAILY
+    result = wp.get_daily_forecasts(["東京", "東京都", "大阪府", None])
+    assert sorted(calls) == ["大阪府", "東京都"]
+    assert set(result) == {"東京", "東京都", "大阪府"}
+    assert result["東京"] == result["東京都"]
+
+
+def _forecast(temp):
+    """OpenWeather の3時間ごとの予報（2日分）"""
+    start = 1_792_249_200  # JST の 0 時
+    return {"list": [{"dt": start + i * 10800, "main": {"temp": temp + i}, "weather": [{"icon": "01d"}]}
+                     for i in range(16)]}
+
+
+def test_openweather_batch_aggregates_all_locations_at_once(providers, monkeypatch):
+    forecasts = {"東京都": _forecast(10.0), "大阪府": _forecast(20.0)}
+    batches = []
+    real_aggregate = wp.weather_api.aggregate_daily_forecasts
+
+    def aggregate(items, *args):
+        batches.append(len(items))
+        return real_aggregate(items, *args)
+
+    monkeypatch.setattr(wp, "BATCH_PROVIDERS", {"openweather": wp._fetch_openweather_many})
+    monkeypatch.setattr(wp, "_fetch_openweather_forecast", forecasts.__getitem__)
+    monkeypatch.setattr(wp.weather_api, "USE_ONECALL", False)
+    monkeypatch.setattr(wp.weather_api, "aggregate_daily_forecasts", aggregate)
+    providers["openweather"] = providers["tsukumijima"] = lambda pref: pytest.fail("1地点ずつ取得した")
+
+    result = wp.get_daily_forecasts(["東京", "大阪府"])
+    assert batches == [2]
+    assert result["大阪府"] == [dict(day, provider="openweather")
+                              for day in real_aggregate([forecasts["大阪府"]])[0]]
+    assert result["東京"][0]["temp"]["max"] == 17.0  # 1日目は 10〜17 度
+
+
+def test_openweather_batch_failures_fall_back_per_location(providers, monkeypatch):
+    def fetch(pref):
+        if pref == "大阪府":
+            raise requests.ConnectionError("down")
+        return _forecast(10.0)
+
+    monkeypatch.setattr(wp, "BATCH_PROVIDERS", {"openweather": wp._fetch_openweather_many})
+    monkeypatch.setattr(wp, "_fetch_openweather_forecast", fetch)
+    monkeypatch.setattr(wp.weather_api, "USE_ONECALL", False)
+    providers["openweather"] = fetch  # 1地点ずつでも OpenWeather は失敗し、tsukumijima に切り替わる
+
+    result = wp.get_daily_forecasts(["東京都", "大阪府"])
+    assert result["東京都"][0]["provider"] == "openweather"
+    assert [d["provider"] for d in result["大阪府"]] == ["tsukumijima"]
@@ -0,0 +1,55 @@
+# 誕生日から星座を引く表のテスト
+from datetime import date, timedelta
+import pytest
+from horoscope import ZODIAC_SIGNS, get_zodiac, get_zodiacs, zodiac_indices
+
+
+def _by_comparison(month: int, day: int) -> str:
+    """月日の比較で星座を決める（表を使わない書き方）"""
+    if (month, day) >= (12, 22) or (month, day) < (1, 20):
+        return "山羊座"
+    for sign, start, end in [
+        ("水瓶座", (1, 20), (2, 19)), ("魚座", (2, 19), (3, 21)), ("牡羊座", (3, 21), (4, 20)),
+        ("牡牛座", (4, 20), (5, 21)), ("双子座", (5, 21), (6, 22)), ("蟹座", (6, 22), (7, 23)),
+        ("獅子座", (7, 23), (8, 23)), ("乙女座", (8, 23), (9, 23)), ("天秤座", (9, 23), (10, 24)),
+        ("蠍座", (10, 24), (11, 23)), ("射手座", (11, 23), (12, 22)),
+    ]:
+        if start <= (month, day) < end:
+            return sign
+    raise AssertionError((month, day))
+
+
+def _every_day():
+    d = date(2024, 1, 1)  # うるう年なので2月29日も含む
+    while d.year == 2024:
+        yield d.month, d.day
+        d += timedelta(days=1)
+
+
+def test_every_day_of_the_year():
+    days = list(_every_day())
+    assert len(days) == 366
+    for month, day in days:
+        assert get_zodiac(month, day) == _by_comparison(month, day)
+    months, dd = zip(*days)
+    assert get_zodiacs(months, dd) == [_by_comparison(m, d) for m, d in days]
+
+
+@pytest.mark.parametrize("month, day, sign", [
+    (1, 19, "山羊座"), (1, 20, "水瓶座"), (12, 21, "射手座"), (12, 22, "山羊座"), (2, 29, "魚座"),
+])
+def test_boundaries(month, day, sign):
+    assert get_zodiac(month, day) == sign
+
+
+def test_invalid_dates():
+    for month, day in [(2, 30), (4, 31), (13, 1), (0, 10), (1, 0), (None, 1), ("x", 1)]:
+        assert get_zodiac(month, day) is None
+    assert get_zodiac("3", "21") == "牡羊座"  # フォームの値は文字列のこともある
+    assert zodiac_indices([2, 4, 13], [30, 31, 1]).tolist() == [-1, -1, -1]
+    assert get_zodiacs([2, 3], [30, 21]) == [None, "牡羊座"]
+
+
+def test_signs_are_in_calendar_order():
+    assert len(set(ZODIAC_SIGNS)) == 12
+    assert zodiac_indices([1, 2], [20, 19]).tolist() == [0, 1]
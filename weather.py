@@ -1,4 +1,16 @@
+import time
+import threading
 import requests 
+from datetime import datetime, timezone, timedelta
+from concurrent.futures import Future, ThreadPoolExecutor
+import quota
+from prefectures import PREFECTURES, PREF_NAMES, lookup
+import fixtures
+import payloads
+import forecast_history
+import expiry
+
+JST = timezone(timedelta(hours=9))
 
 # 天気コードとアイコンのマッピング
 weather_icons = {
@@ -11,73 +23,230 @@ weather_icons = {
 }
 
 
-# 日本の47都道府県とcitycodeを設定
-city_code_list = {
-    "北海道": "011000",
-    "青森県": "020010",
-    "岩手県": "030010",
-    "宮城県": "040010",
-    "秋田県": "050010",
-    "山形県": "060010",
-    "福島県": "070010",
-    "茨城県": "080010",
-    "栃木県": "090010",
-    "群馬県": "100010",
-    "埼玉県": "110010",
-    "千葉県": "120010",
-    "東京都": "130010",
-    "神奈川県": "140010",
-    "新潟県": "150010",
-    "富山県": "160010",
-    "石川県": "170010",
-    "福井県": "180010",
-    "山梨県": "190010",
-    "長野県": "200010",
-    "岐阜県": "210010",
-    "静岡県": "220010",
-    "愛知県": "230010",
-    "三重県": "240010",
-    "滋賀県": "250010",
-    "京都府": "260010",
-    "大阪府": "270010",
-    "兵庫県": "280010",
-    "奈良県": "290010",
-    "和歌山県": "300010",
-    "鳥取県": "310010",
-    "島根県": "320010",
-    "岡山県": "330010",
-    "広島県": "340010",
-    "山口県": "350010",
-    "徳島県": "360010",
-    "香川県": "370010",
-    "愛媛県": "380010",
-    "高知県": "390010",
-    "福岡県": "400010",
-    "佐賀県": "410010",
-    "長崎県": "420010",
-    "熊本県": "430010",
-    "大分県": "440010",
-    "宮崎県": "450010",
-    "鹿児島県": "460010",
-    "沖縄県": "470010",
-}
+# 日本の47都道府県とcitycodeを設定（prefectures.py の一覧から作る）
+city_code_list = {p.name: p.area_code for p in PREFECTURES}
 
-def weather_api(pref):
-    city_code = city_code_list[pref]
+class UnknownPrefecture(requests.RequestException, ValueError):
+    """都道府県の一覧にない地点を渡されたとき（天気の取得エラーと同じように扱える）"""
+
+
+def area_code(pref) -> str:
+    """tsukumijima の地域コード（「東京」のような県なしの名前でも引ける）。一覧になければ UnknownPrefecture"""
+    found = lookup(pref) if isinstance(pref, str) else None
+    if found is None:
+        raise UnknownPrefecture(f"都道府県が見つかりません: {pref!r}")
+    return found.area_code
+
+
+@quota.governed("tsukumijima", "forecast/city")
+def _fetch_forecast_json(city_code):
     url = "https://weather.tsukumijima.net/api/forecast/city/" + city_code
+    return fixtures.fetch_json("tsukumijima", url, schema=payloads.TSUKUMIJIMA_FORECAST)
+
+
+def fetch_forecast_json(pref):
+    """tsukumijima の予報（今日・明日・明後日）をそのまま取得"""
+    return _fetch_forecast_json(area_code(pref))  # 地点を確かめてから呼ぶ（回数を無駄にしない）
+
+
+def _percent(value: str | None) -> float | None:
+    """"30%" → 0.3（"--%" は None）"""
+    try:
+        return int(str(value).rstrip("%")) / 100
+    except ValueError:
+        return None
+
 
-    response = requests.get(url)
-    weather_json = response.json()
+def _celsius(temp: dict | None) -> float | None:
+    value = (temp or {}).get("celsius")
+    return float(value) if value not in (None, "") else None
 
-    telop = weather_json['forecasts'][0]["telop"]
-    max_temp = weather_json['forecasts'][0]["temperature"]["max"]["celsius"]
-    min_temp = weather_json['forecasts'][0]["temperature"]["min"]["celsius"]
+
+def normalize_tsukumijima(weather_json: dict) -> list[dict]:
+    """tsukumijima の予報を日次の形（aggregate_daily_forecast と同じ）にそろえる
+
+    tsukumijima にない値（風速・降水量など）は None になる
+    0時〜5時の発表前は前日発表分に「昨日」が含まれるので、今日より前の日は捨てる（先頭が今日になる）
+    """
+    today = fixtures.now().astimezone(JST).strftime("%Y-%m-%d")
+    daily = []
+    for forecast in weather_json.get("forecasts", []):
+        if forecast.get("date", today) < today:
+            continue
+        date = datetime.strptime(forecast["date"], "%Y-%m-%d").replace(tzinfo=JST)
+        pops = [p for p in map(_percent, (forecast.get("chanceOfRain") or {}).values()) if p is not None]
+        temperature = forecast.get("temperature") or {}
+        daily.append({
+            "dt": date.timestamp(),
+            "temp": {
+                "max": _celsius(temperature.get("max")),
+                "min": _celsius(temperature.get("min"))
+            },
+            "pop": max(pops) if pops else None,  # 時間帯ごとの最大降水確率を採用
+            "weather": [{"description": forecast.get("telop") or "不明"}],
+            "wind_speed": None,
+            "rain": None,
+            "snow": None
+        })
+    return daily
+
+
+def _today_forecast(weather_json):
+    """JST の今日の予報（0時〜5時の発表前は前日発表分の2日目が今日になる）"""
+    forecasts = weather_json['forecasts']
+    today = fixtures.now().astimezone(JST).strftime("%Y-%m-%d")
+    return next((f for f in forecasts if f.get("date") == today), forecasts[0])
+
+
+def today_summary(weather_json):
+    """予報から今日の (天気, 最高気温, 最低気温) を取り出す"""
+    forecast = _today_forecast(weather_json)
+    telop = forecast["telop"]
+    max_temp = forecast["temperature"]["max"]["celsius"]
+    min_temp = forecast["temperature"]["min"]["celsius"]
     if max_temp == None:
         max_temp = ""
     if min_temp == None:
         min_temp = ""
     return telop, max_temp, min_temp
 
+
+def fetch_weather(pref):
+    """tsukumijima から今日の (天気, 最高気温, 最低気温) を取得"""
+    return today_summary(fetch_forecast_json(pref))
+
+
+# --- 全都道府県の天気をバックグラウンドで更新しておく ---
+# ダッシュボードからの呼び出しは辞書を引くだけになり、
+# API呼び出しは気象庁の発表（1日3回）ごとに47回で済む
+SNAPSHOT_GRACE = 15 * 60  # 発表時刻を過ぎても、更新が終わるまではこの秒数だけ前のものを使う
+REFRESH_WORKERS = 8  # 同時に問い合わせる数
+
+# 取得できなかった県を取り直すまでの間隔（秒）。失敗が続くたびに倍にする（次の発表は待たない）
+RETRY_DELAY = 60
+RETRY_MAX_DELAY = 30 * 60
+
+_snapshots = {}  # 都道府県名 -> (期限の時刻, tsukumijima のレスポンス)
+_in_flight = {}  # 都道府県名 -> 取得中の Future（同じ県を同時に2回取りに行かない）
+_snapshot_lock = threading.Lock()
+_refresher_started = False
+
+
+def _snapshot_key(pref):
+    found = lookup(pref)
+    return found.name if found else pref
+
+
+def _store_snapshot(pref, weather_json):
+    with _snapshot_lock:
+        _snapshots[_snapshot_key(pref)] = (expiry.tsukumijima(), weather_json)
+
+
+def cached_forecast_json(pref):
+    """スナップショットの tsukumijima のレスポンス。なければ・次の発表を過ぎていれば None（APIは呼ばない）"""
+    with _snapshot_lock:
+        hit = _snapshots.get(_snapshot_key(pref))
+    if hit and time.time() < hit[0] + SNAPSHOT_GRACE:
+        return hit[1]
+    return None
+
+
+def _refresh_snapshot(pref, force=False):
+    """tsukumijima から取り直してスナップショットを更新し、レスポンスを返す
+
+    同じ県を取得中なら API は呼ばずにその結果を待つ（起動直後にバックグラウンドの更新と
+    画面からの取得が重なっても、1県あたり1回で済む）
+    force でなければ、次の発表までのスナップショットがあるときはそれを返す
+    """
+    key = _snapshot_key(pref)
+    with _snapshot_lock:
+        hit = _snapshots.get(key)
+        if not force and hit and time.time() < hit[0]:
+            return hit[1]
+        future = _in_flight.get(key)
+        owner = future is None
+        if owner:
+            future = _in_flight[key] = Future()
+    if not owner:
+        return future.result()
+
+    try:
+        weather_json = fetch_forecast_json(pref)
+        _store_snapshot(pref, weather_json)
+        future.set_result(weather_json)
+        return weather_json
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _snapshot_lock:
+            _in_flight.pop(key, None)
+
+
+def forecast_json(pref):
+    """tsukumijima のレスポンスを返す（次の発表まではスナップショットを使い、APIを呼ばない）"""
+    weather_json = cached_forecast_json(pref)
+    if weather_json is None:
+        weather_json = _refresh_snapshot(pref)
+    return weather_json
+
+
+def refresh_all(only_expired=False):
+    """47都道府県の天気を並行して取得し、スナップショットを更新する。取得できなかった県を返す"""
+    def refresh(pref):
+        if only_expired:
+            with _snapshot_lock:
+                hit = _snapshots.get(pref)
+            if hit and time.time() < hit[0]:
+                return None  # 次の発表までは取り直しても同じ
+        try:
+            weather_json = _refresh_snapshot(pref, force=not only_expired)
+            forecast_history.record_daily(pref, normalize_tsukumijima(weather_json), "tsukumijima")  # 変わった日だけ追記
+            return None
+        except Exception as e:
+            # 取得できなかった県は前回のスナップショットを残す
+            print(f"天気の更新エラー（{pref}）: {e}")
+            return pref
+
+    with ThreadPoolExecutor(max_workers=REFRESH_WORKERS) as executor:
+        return [pref for pref in executor.map(refresh, PREF_NAMES) if pref]
+
+
+def _refresh_loop():
+    retry_delay = RETRY_DELAY
+    while True:
+        failed = refresh_all(only_expired=True)
+        # 次の発表（が tsukumijima に反映される時刻）まで待つ
+        wait = max(expiry.tsukumijima() - time.time(), 60)
+        if failed:
+            # 取得できなかった県があれば、次の発表を待たずに少し空けて取り直す
+            wait = min(wait, retry_delay)
+            retry_delay = min(retry_delay * 2, RETRY_MAX_DELAY)
+        else:
+            retry_delay = RETRY_DELAY
+        time.sleep(wait)
+
+
+def start_refresher():
+    """バックグラウンドの更新を開始する（プロセスごとに1回だけ）"""
+    global _refresher_started
+    with _snapshot_lock:
+        if _refresher_started:
+            return
+        _refresher_started = True
+    threading.Thread(target=_refresh_loop, name="weather-refresher", daemon=True).start()
+
+
+def cached_weather(pref):
+    """スナップショットの (天気, 最高気温, 最低気温)。なければ・古ければ None（APIは呼ばない）"""
+    weather_json = cached_forecast_json(pref)
+    return today_summary(weather_json) if weather_json is not None else None
+
+
+def weather_api(pref):
+    """今日の (天気, 最高気温, 最低気温) を返す（スナップショットがあればAPIを呼ばない）"""
+    return today_summary(forecast_json(pref))
+
 def get_weather_icon(weather_text):
     """天気テキストからアイコンを取得"""
     icon_list = []
@@ -1,9 +1,17 @@
 # weather_api.py
 import os
 import requests
+from typing import TypedDict
+from concurrent.futures import ThreadPoolExecutor
+import quota
+import fixtures
+import prefectures
+import payloads
+import expiry
+from swr_cache import swr_cache
 import streamlit as st
-from datetime import datetime, timezone, timedelta
-from collections import defaultdict
+from datetime import timezone, timedelta
+import numpy as np
 from dotenv import load_dotenv
 
 # .env をロード
@@ -18,23 +26,6 @@ WEATHER_ICONS = {
     "霧雨": "🌦️", "霧": "🌫️", "雪": "❄️", "雷": "⚡",
 }
 
-# 都道府県名を主要都市名にマッピング（OpenWeatherMap のジオコーディング用）
-PREF_TO_CITY = {
-    "北海道": "Sapporo", "青森県": "Aomori", "岩手県": "Morioka", "宮城県": "Sendai",
-    "秋田県": "Akita", "山形県": "Yamagata", "福島県": "Fukushima",
-    "茨城県": "Mito", "栃木県": "Utsunomiya", "群馬県": "Maebashi",
-    "埼玉県": "Saitama", "千葉県": "Chiba", "東京都": "Tokyo", "神奈川県": "Yokohama",
-    "新潟県": "Niigata", "富山県": "Toyama", "石川県": "Kanazawa", "福井県": "Fukui",
-    "山梨県": "Kofu", "長野県": "Nagano", "岐阜県": "Gifu",
-    "静岡県": "Shizuoka", "愛知県": "Nagoya", "三重県": "Tsu",
-    "滋賀県": "Otsu", "京都府": "Kyoto", "大阪府": "Osaka", "兵庫県": "Kobe",
-    "奈良県": "Nara", "和歌山県": "Wakayama",
-    "鳥取県": "Tottori", "島根県": "Matsue", "岡山県": "Okayama", "広島県": "Hiroshima",
-    "山口県": "Yamaguchi", "徳島県": "Tokushima", "香川県": "Takamatsu",
-    "愛媛県": "Matsuyama", "高知県": "Kochi",
-    "福岡県": "Fukuoka", "佐賀県": "Saga", "長崎県": "Nagasaki", "熊本県": "Kumamoto",
-    "大分県": "Oita", "宮崎県": "Miyazaki", "鹿児島県": "Kagoshima", "沖縄県": "Naha"
-}
 
 def get_api_key() -> str | None:
     """APIキーのロードロジックを集中管理"""
@@ -59,18 +50,42 @@ def get_weather_icon(desc: str) -> str:
             return v
     return "🌤️"
 
+# One Call API 3.0（現在の天気と日次予報を1回で取れる。別途サブスクリプションが必要）を使うか
+USE_ONECALL = os.getenv("OPENWEATHER_ONECALL", "").lower() in ("1", "true", "yes")
+
+# 現在の天気と予報を同時に取りに行くためのスレッド
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="openweather")
+
+
+class WeatherBundle(TypedDict):
+    """fetch_weather_bundle の戻り値"""
+    current: dict          # 現在の天気（/data/2.5/weather と同じ形）
+    daily: list[dict]      # 日次予報（aggregate_daily_forecast と同じ形、最大3日分）
+    forecast: dict | None  # 3時間ごとの予報（One Call のときは None）
+    source: str            # "onecall" または "weather+forecast"
+
+
+
 # --- キャッシュ付きの API 呼び出し ---
-@st.cache_data(ttl=60 * 10)  # 10分キャッシュ
 def geocode_prefecture(pref_name: str, api_key: str) -> tuple[float, float, str]:
-    """都道府県名から緯度・経度を取得し、解決された地名を返す"""
-    city_name = PREF_TO_CITY.get(pref_name, pref_name)
+    """都道府県名から緯度・経度を取得し、解決された地名を返す
+
+    47都道府県は prefectures.py に県庁所在地の座標があるので API を呼ばない
+    """
+    pref = prefectures.lookup(pref_name)
+    if pref:
+        return pref.lat, pref.lon, pref.city
+    return geocode_city(pref_name, api_key)
+
+@st.cache_data(ttl=60 * 60 * 24 * 30)  # 地名の座標は変わらないので30日キャッシュ
+@quota.governed("openweather", "geo/direct")
+def geocode_city(city_name: str, api_key: str) -> tuple[float, float, str]:
+    """一覧にない地名を OpenWeather のジオコーディングで緯度・経度にする"""
     url = "https://api.openweathermap.org/geo/1.0/direct"
     params = {"q": f"{city_name},JP", "limit": 1, "appid": api_key}
-    r = requests.get(url, params=params, timeout=8)
-    r.raise_for_status()
-    data = r.json()
+    data = fixtures.fetch_json("openweather", url, params=params, schema=payloads.OPENWEATHER_GEOCODE)
     if not data:
-        raise ValueError(f"ジオコーディングで結果が見つかりませんでした: {pref_name} ({city_name})")
+        raise ValueError(f"ジオコーディングで結果が見つかりませんでした: {city_name}")
     
     lat = data[0]["lat"]
     lon = data[0]["lon"]
@@ -78,7 +93,8 @@ def geocode_prefecture(pref_name: str, api_key: str) -> tuple[float, float, str]
     
     return lat, lon, resolved_name
 
-@st.cache_data(ttl=60 * 5)  # 5分キャッシュ
+@swr_cache(expires=expiry.openweather_current, max_stale=60 * 60)  # 10分ごとの更新に合わせる。期限切れ後1時間は古い値を返しつつ裏で更新
+@quota.governed("openweather", "weather")
 def fetch_current_weather(lat: float, lon: float, api_key: str) -> dict:
     """現在の天気を取得（無料API）"""
     url = "https://api.openweathermap.org/data/2.5/weather"
@@ -89,70 +105,160 @@ def fetch_current_weather(lat: float, lon: float, api_key: str) -> dict:
         "lang": "ja",
         "appid": api_key
     }
-    r = requests.get(url, params=params, timeout=8)
-    r.raise_for_status()
-    return r.json()
+    return fixtures.fetch_json("openweather", url, params=params, schema=payloads.OPENWEATHER_CURRENT)
 
-@st.cache_data(ttl=60 * 5)  # 5分キャッシュ
+@swr_cache(expires=expiry.openweather_forecast, max_stale=60 * 60)  # 3時間ごとの更新に合わせる。期限切れ後1時間は古い値を返しつつ裏で更新
+@quota.governed("openweather", "forecast")
 def fetch_forecast(lat: float, lon: float, api_key: str) -> dict:
-    """5日間の3時間ごと予報を取得（無料API）"""
+    """3時間ごとの予報を取得（無料API）。使うのは3日分なので payloads.FORECAST_COUNT 件だけ取る"""
     url = "https://api.openweathermap.org/data/2.5/forecast"
     params = {
         "lat": lat,
         "lon": lon,
         "units": "metric",
         "lang": "ja",
+        "cnt": payloads.FORECAST_COUNT,
         "appid": api_key
     }
-    r = requests.get(url, params=params, timeout=8)
-    r.raise_for_status()
-    return r.json()
+    return fixtures.fetch_json("openweather", url, params=params, schema=payloads.OPENWEATHER_FORECAST)
 
-def aggregate_daily_forecast(forecast_data: dict) -> list[dict]:
-    """3時間ごとの予報を日次に集約し、最大3日分を返す"""
-    daily = defaultdict(lambda: {
-        "temps": [], "pops": [], "weather": [], "wind_speeds": [],
-        "rain": 0, "snow": 0
-    })
-    
-    for item in forecast_data.get("list", []):
-        # UTCからJSTへ変換
-        dt = datetime.fromtimestamp(item["dt"], tz=timezone.utc).astimezone(JST)
-        date_key = dt.strftime("%Y-%m-%d")
-        
-        daily[date_key]["temps"].append(item["main"]["temp"])
-        daily[date_key]["pops"].append(item.get("pop", 0))
-        daily[date_key]["wind_speeds"].append(item.get("wind", {}).get("speed", 0))
-        
-        if item.get("weather"):
-            # 天気アイコン/説明は、その日の最初の予報を採用することが多いが、ここではリストとして保持
-            daily[date_key]["weather"].append(item["weather"][0])
-        
-        # 降水量・降雪量を累積（3時間分ずつ）
-        if "rain" in item:
-            daily[date_key]["rain"] += item["rain"].get("3h", 0)
-        if "snow" in item:
-            daily[date_key]["snow"] += item["snow"].get("3h", 0)
-    
-    result = []
-    # キーを日付順にソートし、最初の3日分のみ処理
-    for date_key in sorted(daily.keys())[:3]:
-        d = daily[date_key]
-        
-        # 代表的な天気（ここではその日の最初の予報、または出現頻度最大のものなどを選ぶのが一般的だが、ここでは最初のものを採用）
-        main_weather = d["weather"][0] if d["weather"] else {"description": "不明", "icon": "01d"}
-
-        result.append({
-            "dt": datetime.strptime(date_key, "%Y-%m-%d").replace(tzinfo=JST).timestamp(),
+@swr_cache(expires=expiry.openweather_current, max_stale=60 * 60)  # 10分ごとの更新に合わせる。期限切れ後1時間は古い値を返しつつ裏で更新
+@quota.governed("openweather", "onecall")
+def fetch_onecall(lat: float, lon: float, api_key: str) -> dict:
+    """現在の天気と日次予報を1回で取得（One Call API 3.0）"""
+    url = "https://api.openweathermap.org/data/3.0/onecall"
+    params = {
+        "lat": lat,
+        "lon": lon,
+        "exclude": "minutely,hourly,alerts",
+        "units": "metric",
+        "lang": "ja",
+        "appid": api_key
+    }
+    return fixtures.fetch_json("openweather", url, params=params, schema=payloads.OPENWEATHER_ONECALL)
+
+def _bundle_from_onecall(data: dict, days: int = 3) -> WeatherBundle:
+    """One Call のレスポンスを、2.5 の API を組み合わせたときと同じ形にそろえる"""
+    current = data.get("current") or {}
+    jst_offset = int(JST.utcoffset(None).total_seconds())
+    daily = []
+    for item in (data.get("daily") or [])[:days]:
+        daily.append({
+            "dt": float((item["dt"] + jst_offset) // 86400 * 86400 - jst_offset),  # その日の 0 時 JST
             "temp": {
-                "max": max(d["temps"]) if d["temps"] else 0,
-                "min": min(d["temps"]) if d["temps"] else 0
+                "max": float(item["temp"]["max"]),
+                "min": float(item["temp"]["min"])
             },
-            "pop": max(d["pops"]) if d["pops"] else 0, # 最大降水確率を採用
+            "pop": float(item.get("pop", 0)),
+            "weather": item.get("weather") or [{"description": "不明", "icon": "01d"}],
+            "wind_speed": float(item.get("wind_speed", 0)),
+            "rain": float(item.get("rain", 0)),
+            "snow": float(item.get("snow", 0))
+        })
+    return {
+        "current": {
+            "dt": current.get("dt"),
+            "main": {"temp": current.get("temp"), "humidity": current.get("humidity")},
+            "weather": current.get("weather") or [],
+            "wind": {"speed": current.get("wind_speed")},
+        },
+        "daily": daily,
+        "forecast": None,
+        "source": "onecall",
+    }
+
+def fetch_weather_bundle(lat: float, lon: float, api_key: str) -> WeatherBundle:
+    """現在の天気と日次予報をまとめて取得する
+
+    OPENWEATHER_ONECALL が有効なら One Call で1回、そうでなければ
+    現在の天気と予報を同時に問い合わせる（待ち時間は遅い方の1回分）
+    """
+    if USE_ONECALL:
+        try:
+            return _bundle_from_onecall(fetch_onecall(lat, lon, api_key))
+        except requests.RequestException as e:
+            # サブスクリプションがない・上限などのときは 2.5 の API で取り直す
+            print(f"One Call の取得エラー: {e}")
+
+    current = _executor.submit(quota.as_current_user(fetch_current_weather), lat, lon, api_key)
+    forecast = _executor.submit(quota.as_current_user(fetch_forecast), lat, lon, api_key)
+    forecast_data = forecast.result()
+    return {
+        "current": current.result(),
+        "daily": aggregate_daily_forecast(forecast_data),
+        "forecast": forecast_data,
+        "source": "weather+forecast",
+    }
+
+def aggregate_daily_forecasts(forecasts: list[dict], days: int = 3) -> list[list[dict]]:
+    """複数地点の3時間ごとの予報をまとめて日次に集約し、地点ごとに最大 days 日分を返す
+
+    全地点の予報を1つの配列に並べ、(地点, JSTの日付) ごとに numpy でまとめて集計する
+    （地点ごと・予報ごとに Python のループを回さない）
+    """
+    # 全地点の予報を列ごとの配列に並べる
+    items = [(loc, item) for loc, data in enumerate(forecasts) for item in data.get("list", [])]
+    if not items:
+        return [[] for _ in forecasts]
+
+    loc = np.array([loc for loc, _ in items], dtype=np.int64)
+    dt = np.array([item["dt"] for _, item in items], dtype=np.int64)
+    temp = np.array([item["main"]["temp"] for _, item in items], dtype=float)
+    pop = np.array([item.get("pop", 0) for _, item in items], dtype=float)
+    wind = np.array([item.get("wind", {}).get("speed", 0) for _, item in items], dtype=float)
+    rain = np.array([item.get("rain", {}).get("3h", 0) for _, item in items], dtype=float)
+    snow = np.array([item.get("snow", {}).get("3h", 0) for _, item in items], dtype=float)
+    weather = [item["weather"][0] if item.get("weather") else None for _, item in items]
+
+    # UTC の時刻から JST の日付番号を出し、(地点, 日付) でグループにする
+    jst_offset = int(JST.utcoffset(None).total_seconds())
+    day = (dt + jst_offset) // 86400
+    order = np.lexsort((dt, day, loc))  # 地点 → 日付 → 時刻 の順に並べる
+    loc, dt, day = loc[order], dt[order], day[order]
+    temp, pop, wind, rain, snow = temp[order], pop[order], wind[order], rain[order], snow[order]
+    weather = [weather[i] for i in order]
+
+    new_group = np.ones(len(order), dtype=bool)
+    new_group[1:] = (loc[1:] != loc[:-1]) | (day[1:] != day[:-1])
+    starts = np.flatnonzero(new_group)
+    counts = np.diff(np.append(starts, len(order)))
+
+    temp_max = np.maximum.reduceat(temp, starts)
+    temp_min = np.minimum.reduceat(temp, starts)
+    pop_max = np.maximum.reduceat(pop, starts)  # 最大降水確率を採用
+    wind_mean = np.add.reduceat(wind, starts) / counts  # 平均風速
+    rain_sum = np.add.reduceat(rain, starts)  # 降水量・降雪量は3時間分ずつ累積
+    snow_sum = np.add.reduceat(snow, starts)
+
+    # 代表的な天気はその日の最初の予報のもの（グループ内で最初に天気がある予報）
+    with_weather = np.flatnonzero([w is not None for w in weather])
+    first = np.searchsorted(with_weather, starts)
+    ends = starts + counts
+
+    result = [[] for _ in forecasts]
+    group_loc = loc[starts]
+    group_day = day[starts]
+    for g in range(len(starts)):
+        daily = result[group_loc[g]]
+        if len(daily) >= days:
+            continue
+        has_weather = first[g] < len(with_weather) and with_weather[first[g]] < ends[g]
+        main_weather = weather[with_weather[first[g]]] if has_weather else {"description": "不明", "icon": "01d"}
+        daily.append({
+            "dt": float(group_day[g] * 86400 - jst_offset),
+            "temp": {
+                "max": float(temp_max[g]),
+                "min": float(temp_min[g])
+            },
+            "pop": float(pop_max[g]),
             "weather": [main_weather],
-            "wind_speed": sum(d["wind_speeds"]) / len(d["wind_speeds"]) if d["wind_speeds"] else 0, # 平均風速
-            "rain": d["rain"],
-            "snow": d["snow"]
+            "wind_speed": float(wind_mean[g]),
+            "rain": float(rain_sum[g]),
+            "snow": float(snow_sum[g])
         })
-    
-    return result
\ No newline at end of file
+
+    return result
+
+def aggregate_daily_forecast(forecast_data: dict) -> list[dict]:
+    """3時間ごとの予報を日次に集約し、最大3日分を返す"""
+    return aggregate_daily_forecasts([forecast_data])[0]
@@ -0,0 +1,255 @@
+# weather_providers.py
+# 天気の取得元（tsukumijima / OpenWeather）をまとめて扱うモジュール
+#
+# - どちらの取得元も weather_api.aggregate_daily_forecast と同じ日次の形にそろえる
+#   （tsukumijima の変換は weather.normalize_tsukumijima）
+# - 普段は設定した取得元（PRIMARY。風速・降水量まで取れる OpenWeather）から問い合わせる
+#   直近の記録で失敗が続いているときだけ、もう一方を先にする
+# - 1つ目が p95 を過ぎても返ってこなければ、もう一方にも問い合わせて早い方を使う（ヘッジ）
+# - 1つ目が失敗したときはすぐにもう一方へ切り替える
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+import requests
+import quota
+import weather
+import weather_api
+import prefectures
+import forecast_history
+
+# 直近何回分の結果で応答時間・失敗率を見るか
+WINDOW = 50
+
+# 記録が少ないうちに使う p95（秒）
+DEFAULT_P95 = 1.5
+
+# ヘッジするまでの待ち時間の下限・上限（秒）
+MIN_HEDGE_DELAY = 0.2
+MAX_HEDGE_DELAY = 5.0
+
+# p95 の計算に使う最低の記録数
+MIN_SAMPLES = 5
+
+# 先に問い合わせる取得元（.env の WEATHER_PRIMARY_PROVIDER で変更可能）
+PRIMARY = os.getenv("WEATHER_PRIMARY_PROVIDER", "openweather")
+
+# PRIMARY の直近の失敗率がこれを超えたら、もう一方を先にする
+DEMOTE_ERROR_RATE = 0.5
+
+# 後ろに回した PRIMARY も、最後の記録からこの秒数が過ぎたら先頭に戻して試す
+DEMOTE_FOR = 5 * 60
+
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="weather-provider")
+# 複数地点をまとめて取得するとき用（_executor の中から _executor を待つと詰まるので分ける）
+_batch_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="weather-batch")
+
+
+class ProviderStats:
+    """取得元ごとの直近の応答時間と成否"""
+
+    def __init__(self):
+        self._latencies = deque(maxlen=WINDOW)
+        self._errors = deque(maxlen=WINDOW)
+        self._lock = threading.Lock()
+        self.last_at = 0.0  # 最後に記録した時刻（time.monotonic）
+
+    def record(self, latency: float, ok: bool) -> None:
+        with self._lock:
+            self.last_at = time.monotonic()
+            if ok:
+                self._latencies.append(latency)
+            self._errors.append(not ok)
+
+    def p95(self) -> float:
+        with self._lock:
+            latencies = list(self._latencies)
+        if len(latencies) < MIN_SAMPLES:
+            return DEFAULT_P95
+        return float(np.percentile(latencies, 95))
+
+    def error_rate(self) -> float:
+        with self._lock:
+            errors = list(self._errors)
+        return sum(errors) / len(errors) if errors else 0.0
+
+    def samples(self) -> int:
+        with self._lock:
+            return len(self._errors)
+
+    def summary(self) -> dict:
+        return {"p95": self.p95(), "error_rate": self.error_rate(), "samples": self.samples()}
+
+
+def _fetch_tsukumijima(pref: str) -> list[dict]:
+    return weather.normalize_tsukumijima(weather.forecast_json(pref))  # 次の発表まではスナップショット
+
+
+def _fetch_openweather_forecast(pref: str) -> dict:
+    """3時間ごとの予報（日次に集約する前）"""
+    api_key = weather_api.get_api_key()
+    lat, lon, _ = weather_api.geocode_prefecture(pref, api_key)
+    return weather_api.fetch_forecast(lat, lon, api_key)
+
+
+def _fetch_openweather(pref: str) -> list[dict]:
+    if weather_api.USE_ONECALL:
+        api_key = weather_api.get_api_key()
+        lat, lon, _ = weather_api.geocode_prefecture(pref, api_key)
+        return weather_api.fetch_weather_bundle(lat, lon, api_key)["daily"]  # 1回で済む
+    return weather_api.aggregate_daily_forecast(_fetch_openweather_forecast(pref))
+
+
+def _fetch_openweather_many(prefs: list[str]) -> dict[str, list[dict]]:
+    """複数地点の予報を並行して取得し、日次への集約は全地点まとめて1回で行う
+
+    取得できなかった地点は含めない（呼び出し側が1地点ずつ取り直す）
+    """
+    if weather_api.USE_ONECALL:
+        return {}  # One Call は日次で返ってくるので、まとめて集約するものがない
+    futures = {
+        pref: _executor.submit(quota.as_current_user(_timed_fetch), "openweather", pref, _fetch_openweather_forecast)
+        for pref in prefs
+    }
+    forecasts = {}
+    for pref, future in futures.items():
+        try:
+            forecasts[pref] = future.result()
+        except Exception as e:
+            print(f"天気の取得エラー（openweather, {pref}）: {e}")
+    return dict(zip(forecasts, weather_api.aggregate_daily_forecasts(list(forecasts.values()))))
+
+
+PROVIDERS = {
+    "tsukumijima": _fetch_tsukumijima,
+    "openweather": _fetch_openweather,
+}
+
+# 複数地点をまとめて取得できる取得元（先頭の取得元にあれば get_daily_forecasts で使う）
+BATCH_PROVIDERS = {
+    "openweather": _fetch_openweather_many,
+}
+
+STATS = {name: ProviderStats() for name in PROVIDERS}
+
+
+def available_providers() -> list[str]:
+    """使える取得元を問い合わせる順に返す
+
+    PRIMARY を先にする。PRIMARY の記録が MIN_SAMPLES 回以上あり、失敗率が DEMOTE_ERROR_RATE を超えて
+    もう一方より悪いときだけ、DEMOTE_FOR 秒のあいだ後ろに回す
+    （速さだけでは入れ替えない。遅いときはヘッジで補う）
+    """
+    names = [name for name in PROVIDERS if name != "openweather" or weather_api.get_api_key()]
+    names.sort(key=lambda name: name != PRIMARY)
+    if len(names) > 1 and names[0] == PRIMARY:
+        primary, secondary = STATS[names[0]], STATS[names[1]]
+        if (primary.samples() >= MIN_SAMPLES and primary.error_rate() > DEMOTE_ERROR_RATE
+                and primary.error_rate() > secondary.error_rate()
+                and time.monotonic() - primary.last_at < DEMOTE_FOR):
+            names = names[1:] + names[:1]
+    return names
+
+
+def _timed_fetch(name: str, pref: str, fetch=None):
+    start = time.monotonic()
+    try:
+        result = (fetch or PROVIDERS[name])(pref)
+    except Exception:
+        STATS[name].record(time.monotonic() - start, ok=False)
+        raise
+    STATS[name].record(time.monotonic() - start, ok=True)
+    return result
+
+
+def get_daily_forecast(pref: str) -> list[dict]:
+    """pref の日次予報（最大3日分）を返す
+
+    各日に取得元の名前が "provider" として入る
+    すべての取得元が失敗したときは最後のエラーを送出する
+    """
+    names = available_providers()
+    if not names:
+        raise requests.RequestException("使える天気の取得元がありません")
+
+    pending = {}  # future -> 取得元の名前
+    waiting = list(names)
+    last_error = None
+
+    def launch():
+        name = waiting.pop(0)
+        pending[_executor.submit(quota.as_current_user(_timed_fetch), name, pref)] = name
+
+    launch()
+    while pending:
+        # 控えの取得元があるうちは p95 だけ待ち、過ぎたら次にも問い合わせる
+        timeout = None
+        if waiting:
+            first = next(iter(pending.values()))
+            timeout = min(max(STATS[first].p95(), MIN_HEDGE_DELAY), MAX_HEDGE_DELAY)
+        done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            launch()  # 遅いのでヘッジ
+            continue
+        for future in done:
+            name = pending.pop(future)
+            try:
+                daily = future.result()
+            except Exception as e:
+                print(f"天気の取得エラー（{name}）: {e}")
+                last_error = e
+                continue
+            if daily:
+                forecast_history.record_daily(pref, daily, name)  # 変わった日だけ追記される
+                return [dict(day, provider=name) for day in daily]
+        if not pending and waiting:
+            launch()  # 失敗したので次の取得元へ切り替える
+
+    raise last_error or requests.RequestException(f"天気を取得できませんでした: {pref}")
+
+
+def get_daily_forecasts(prefs) -> dict[str, list[dict] | None]:
+    """複数地点の日次予報をまとめて返す（{渡した地点名: 日次予報}）
+
+    「東京」と「東京都」のように同じ地点は1回だけ取得し、残りは並行して問い合わせるので
+    地点が増えても待ち時間は一番遅い1地点分で済む
+    先頭の取得元が BATCH_PROVIDERS にあれば全地点をまとめて取得し、取れなかった地点だけ
+    1地点ずつ（切り替え・ヘッジあり）取り直す
+    取得できなかった地点は None になる
+    """
+    canonical = {}
+    for pref in prefs:
+        if pref:
+            found = prefectures.lookup(pref)
+            canonical[pref] = found.name if found else pref
+
+    unique = list(dict.fromkeys(canonical.values()))
+    results = {}
+    names = available_providers()
+    batch = BATCH_PROVIDERS.get(names[0]) if names and len(unique) > 1 else None
+    if batch:
+        for key, daily in batch(unique).items():
+            if daily:
+                forecast_history.record_daily(key, daily, names[0])
+                results[key] = [dict(day, provider=names[0]) for day in daily]
+
+    rest = [key for key in unique if key not in results]
+    if len(rest) <= 1:
+        futures = None
+    else:
+        futures = {key: _batch_executor.submit(quota.as_current_user(get_daily_forecast), key) for key in rest}
+
+    for key in rest:
+        try:
+            results[key] = futures[key].result() if futures else get_daily_forecast(key)
+        except Exception as e:
+            print(f"天気の取得エラー（{key}）: {e}")
+            results[key] = None
+    return {pref: results[key] for pref, key in canonical.items()}
+
+
+def stats_summary() -> dict:
+    """取得元ごとの p95・失敗率（デバッグ表示用）"""
+    return {name: stats.summary() for name, stats in STATS.items()}